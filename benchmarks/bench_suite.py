@@ -0,0 +1,286 @@
+"""
+Offline benchmark suite of the title service, the title cache, the download loop and verification.
+Runs against local stubs only: StubIE answers URLs of a fake domain, a StubHttpServer serves HTML pages
+and a small media file generated with ffmpeg. All stores are created in a temporary directory.
+
+Scenarios:
+- titles-yt-dlp-cold / -warm, titles-beautifulsoup-cold / -warm: TitleService with an empty, then a filled cache
+- cache-lookup-10k: lookups in a title cache of 10k entries, from the database and from the memory tier
+- downloads-serial / downloads-parallel: DownloadEngine with 1 and --jobs workers (needs ffmpeg and ffprobe)
+- verify-cold / verify-warm: ffprobe verification throughput without and with cached probes (needs ffprobe)
+
+Results are written to JSON, --compare prints the change of every rate against the results of a previous run.
+
+Usage: python -m benchmarks.bench_suite [--scenarios NAME ...] [--urls N] [--jobs N] [--output FILE] [--compare FILE]
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import tempfile
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+import yt_dlp.version
+
+from benchmarks.stub_extractor import StubIE, StubSessionManager, stub_url
+from benchmarks.stub_http_server import StubHttpServer
+from youtube_downloader.cache import VideoTitleCache, CacheEntry
+from youtube_downloader.constants import FilePath, TitleProvider
+from youtube_downloader.download_engine import DownloadEngine, EngineConfig, VIDEO_MP4, \
+    DEFAULT_CONCURRENT_FRAGMENT_DOWNLOADS, build_download_items, make_playlist_expander
+from youtube_downloader.get_video_titles import make_ydl_opts as make_title_ydl_opts
+from youtube_downloader.governor import RequestGovernor
+from youtube_downloader.progress import ProgressReporter
+from youtube_downloader.scheduler import DownloadScheduler
+from youtube_downloader.service import TitleService
+from youtube_downloader.verification import VerificationService, ProbeCache
+
+RESULTS_FILE = "benchmark_results.json"
+# Seconds of the generated media file
+MEDIA_SECONDS = 2
+QUIET_YDL_OPTS = {"quiet": True, "noprogress": True, "no_warnings": True}
+# The stub server never throttles, the default rate limit would be measured instead of the code
+DEFAULT_BENCH_REQUESTS_PER_SECOND = 10000.0
+
+
+@dataclass
+class BenchContext:
+    args: argparse.Namespace
+    tmp_dir: str
+    server: StubHttpServer
+    # Generated media file served by the server, None if ffmpeg is not available
+    media_path: Optional[str]
+
+    def path(self, *names: str) -> str:
+        return os.path.join(self.tmp_dir, *names)
+
+
+class Skipped(Exception):
+    pass
+
+
+def generate_media(path: str, seconds: int = MEDIA_SECONDS) -> Optional[str]:
+    """
+    Small H.264 / AAC MP4 made of ffmpeg's test pattern and a sine tone
+    :return: None if ffmpeg is not installed
+    """
+    if not shutil.which("ffmpeg"):
+        return None
+    subprocess.run(["ffmpeg", "-hide_banner", "-loglevel", "error", "-y",
+                    "-f", "lavfi", "-i", f"testsrc=duration={seconds}:size=320x240:rate=25",
+                    "-f", "lavfi", "-i", f"sine=frequency=440:duration={seconds}",
+                    "-c:v", "libx264", "-preset", "ultrafast", "-c:a", "aac", "-shortest",
+                    "-movflags", "+faststart", path], check=True)
+    return path
+
+
+def rate(count: int, seconds: float) -> float:
+    return count / seconds if seconds else 0.0
+
+
+def fetch_titles(ctx: BenchContext, provider: TitleProvider, urls: List[str], cache_file: str) -> Dict[str, Any]:
+    with StubSessionManager(QUIET_YDL_OPTS) as sessions, \
+            VideoTitleCache(cache_file, legacy_shelf_path=None) as cache:
+        ydl_opts = make_title_ydl_opts()
+        service = TitleService(cache, ydl_opts, provider=provider, workers=ctx.args.jobs,
+                               ydl_pool=sessions.get_pool("titles", ydl_opts),
+                               governor=RequestGovernor(requests_per_second=ctx.args.max_requests_per_second))
+        ctx.server.reset_counters()
+        start = time.perf_counter()
+        titles = service.fetch_titles(urls)
+        elapsed = time.perf_counter() - start
+        service.close()
+    return {"urls": len(urls), "titles": len(titles), "seconds": elapsed, "urls_per_second": rate(len(urls), elapsed),
+            "http_requests": ctx.server.requests}
+
+
+def title_urls(ctx: BenchContext, provider: TitleProvider) -> List[str]:
+    if provider == TitleProvider.YT_DLP:
+        return [stub_url(f"title{i:05d}") for i in range(ctx.args.urls)]
+    return [ctx.server.page_url(f"title{i:05d}") for i in range(ctx.args.urls)]
+
+
+def make_title_scenario(provider: TitleProvider, warm: bool) -> Callable[[BenchContext], Dict[str, Any]]:
+    def scenario(ctx: BenchContext) -> Dict[str, Any]:
+        cache_file = ctx.path(f"titles-{provider.value}-{'warm' if warm else 'cold'}.sqlite3")
+        urls = title_urls(ctx, provider)
+        if warm:
+            fetch_titles(ctx, provider, urls, cache_file)
+        return fetch_titles(ctx, provider, urls, cache_file)
+    return scenario
+
+
+def cache_lookup(ctx: BenchContext) -> Dict[str, Any]:
+    cache_file = ctx.path("cache-lookup.sqlite3")
+    urls = [stub_url(f"cached{i:05d}") for i in range(ctx.args.cache_entries)]
+    with VideoTitleCache(cache_file, legacy_shelf_path=None) as cache:
+        cache.put_entries({url: CacheEntry(title=f"Cached video {i}", provider=TitleProvider.YT_DLP.value)
+                           for i, url in enumerate(urls)})
+    random.Random(0).shuffle(urls)
+    result: Dict[str, Any] = {"entries": len(urls)}
+    # The first pass reads the database and fills the memory tier, the second one is served from memory
+    with VideoTitleCache(cache_file, legacy_shelf_path=None) as cache:
+        for tier in ("database", "memory"):
+            start = time.perf_counter()
+            found = sum(cache.get_entry(url) is not None for url in urls)
+            elapsed = time.perf_counter() - start
+            if found != len(urls):
+                raise AssertionError(f"Only {found} of {len(urls)} cached titles were found")
+            result[f"{tier}_seconds"] = elapsed
+            result[f"{tier}_lookups_per_second"] = rate(len(urls), elapsed)
+    return result
+
+
+def make_download_scenario(parallel: bool) -> Callable[[BenchContext], Dict[str, Any]]:
+    def scenario(ctx: BenchContext) -> Dict[str, Any]:
+        if ctx.media_path is None or not shutil.which("ffprobe"):
+            raise Skipped("ffmpeg and ffprobe are needed to generate and verify the media")
+        jobs = ctx.args.jobs if parallel else 1
+        name = "parallel" if parallel else "serial"
+        output_dir = ctx.path(f"downloads-{name}")
+        urls_file = ctx.path(f"downloads-{name}.txt")
+        urls = [stub_url(f"dl{i:05d}") for i in range(ctx.args.downloads)]
+        with open(urls_file, "w", encoding="utf-8") as f:
+            f.write("\n".join(urls) + "\n")
+        # The archive would be the one of the user, the journal is removed after the run
+        config = EngineConfig(urls_file=urls_file, output_dir=output_dir, use_browser_cookies=False, jobs=jobs,
+                              use_archive=False, max_requests_per_second=ctx.args.max_requests_per_second)
+        scheduler = DownloadScheduler(jobs=jobs)
+        fragments_per_job = DownloadScheduler.split_evenly(DEFAULT_CONCURRENT_FRAGMENT_DOWNLOADS, scheduler.jobs)
+        with ProgressReporter(stream=io.StringIO()) as progress, StubSessionManager(QUIET_YDL_OPTS) as sessions, \
+                VideoTitleCache(ctx.path(f"downloads-{name}.sqlite3"), legacy_shelf_path=None) as cache:
+            engine = DownloadEngine(VIDEO_MP4, config, progress)
+            start = time.perf_counter()
+            with engine.open(sessions, cache, fragments_per_job):
+                playlist_expander = make_playlist_expander(sessions, cache, config, engine.governor)
+                items = build_download_items(urls, playlist_expander, [engine.journal])
+                scheduler.run(items, lambda item, idx, total: engine.download_url(item, idx, total))
+            elapsed = time.perf_counter() - start
+        verified = sum(engine.journal.is_finished(url, None) for url in urls)
+        os.remove(engine.journal.file_path)
+        return {"jobs": jobs, "downloads": len(urls), "verified": verified, "seconds": elapsed,
+                "downloads_per_second": rate(len(urls), elapsed),
+                "media_latency_ms": ctx.args.media_latency_ms}
+    return scenario
+
+
+def make_verify_scenario(warm: bool) -> Callable[[BenchContext], Dict[str, Any]]:
+    def scenario(ctx: BenchContext) -> Dict[str, Any]:
+        if ctx.media_path is None or not shutil.which("ffprobe"):
+            raise Skipped("ffmpeg and ffprobe are needed to generate and verify the media")
+        files_dir = ctx.path("verify-files")
+        if not os.path.isdir(files_dir):
+            os.makedirs(files_dir)
+            for i in range(ctx.args.verify_files):
+                shutil.copyfile(ctx.media_path, os.path.join(files_dir, f"file{i:05d}.mp4"))
+        files = sorted(os.path.join(files_dir, name) for name in os.listdir(files_dir))
+        with ProbeCache(ctx.path(f"probes-{'warm' if warm else 'cold'}.sqlite3")) as probe_cache:
+            service = VerificationService(workers=ctx.args.probe_workers, cache=probe_cache)
+            if warm:
+                list(service.verify_many(files))
+            start = time.perf_counter()
+            results = list(service.verify_many(files))
+            elapsed = time.perf_counter() - start
+        return {"files": len(files), "ok": sum(r.ok for r in results), "cached": sum(r.cached for r in results),
+                "workers": ctx.args.probe_workers, "seconds": elapsed, "files_per_second": rate(len(files), elapsed)}
+    return scenario
+
+
+SCENARIOS: Dict[str, Callable[[BenchContext], Dict[str, Any]]] = {
+    "titles-yt-dlp-cold": make_title_scenario(TitleProvider.YT_DLP, warm=False),
+    "titles-yt-dlp-warm": make_title_scenario(TitleProvider.YT_DLP, warm=True),
+    "titles-beautifulsoup-cold": make_title_scenario(TitleProvider.BEAUTIFULSOUP, warm=False),
+    "titles-beautifulsoup-warm": make_title_scenario(TitleProvider.BEAUTIFULSOUP, warm=True),
+    "cache-lookup-10k": cache_lookup,
+    "downloads-serial": make_download_scenario(parallel=False),
+    "downloads-parallel": make_download_scenario(parallel=True),
+    "verify-cold": make_verify_scenario(warm=False),
+    "verify-warm": make_verify_scenario(warm=True),
+}
+
+
+def print_comparison(results: Dict[str, Any], previous: Dict[str, Any]) -> None:
+    print(f"\nChange against the run of {previous.get('started_at')}:")
+    for name, metrics in results["scenarios"].items():
+        old_metrics = previous.get("scenarios", {}).get(name, {})
+        for metric, value in metrics.items():
+            old = old_metrics.get(metric)
+            if metric.endswith("_per_second") and old:
+                print(f"{name:<28} {metric:<28} {old:>12.1f} -> {value:>12.1f}  {value / old:>6.2f}x")
+
+
+def build_argparser() -> argparse.ArgumentParser:
+    p = argparse.ArgumentParser(description="Offline benchmarks of title fetching, the title cache, "
+                                            "downloads and verification")
+    p.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS),
+                   help="Scenarios to run (default: all)")
+    p.add_argument("--urls", type=int, default=200, help="Number of URLs of the title scenarios (default: 200)")
+    p.add_argument("--cache-entries", type=int, default=10000,
+                   help="Number of entries of the cache lookup scenario (default: 10000)")
+    p.add_argument("--downloads", type=int, default=20, help="Number of URLs of the download scenarios (default: 20)")
+    p.add_argument("--verify-files", type=int, default=100,
+                   help="Number of files of the verify scenarios (default: 100)")
+    p.add_argument("--jobs", "-j", type=int, default=4,
+                   help="Workers of the parallel downloads and of title fetching (default: 4)")
+    p.add_argument("--probe-workers", type=int, default=4, help="Parallel ffprobe processes (default: 4)")
+    p.add_argument("--media-latency-ms", type=int, default=100,
+                   help="Delay of the local server before it sends a media file (default: 100)")
+    p.add_argument("--max-requests-per-second", type=float, default=DEFAULT_BENCH_REQUESTS_PER_SECOND,
+                   help="Rate limit of the request governor on the stub hosts "
+                        f"(default: {DEFAULT_BENCH_REQUESTS_PER_SECOND}).")
+    p.add_argument("--output", "-o", default=None,
+                   help=f"Results file (default: {RESULTS_FILE} in a new directory under {FilePath.SESSIONS_DIR})")
+    p.add_argument("--compare", default=None, help="Results file of a previous run to compare with")
+    return p
+
+
+def main():
+    args = build_argparser().parse_args()
+    results: Dict[str, Any] = {
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "yt_dlp": yt_dlp.version.__version__,
+        "platform": platform.platform(),
+        "args": vars(args),
+        "scenarios": {},
+        "skipped": {},
+    }
+    with tempfile.TemporaryDirectory(prefix="youtube-downloader-bench-") as tmp_dir:
+        media_path = generate_media(os.path.join(tmp_dir, "media.mp4"))
+        media = None
+        if media_path:
+            with open(media_path, "rb") as f:
+                media = f.read()
+        with StubHttpServer(media=media, media_latency=args.media_latency_ms / 1000) as server:
+            StubIE.media_base_url = server.base_url
+            StubIE.duration = MEDIA_SECONDS
+            ctx = BenchContext(args, tmp_dir, server, media_path)
+            for name in args.scenarios:
+                try:
+                    metrics = SCENARIOS[name](ctx)
+                except Skipped as e:
+                    results["skipped"][name] = str(e)
+                    print(f"{name:<28} skipped: {e}")
+                    continue
+                results["scenarios"][name] = metrics
+                print(f"{name:<28} " + ", ".join(f"{k}: {v:.2f}" if isinstance(v, float) else f"{k}: {v}"
+                                                 for k, v in metrics.items()))
+
+    output = args.output or os.path.join(FilePath.get_session_dir(), RESULTS_FILE)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to: {output}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            print_comparison(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
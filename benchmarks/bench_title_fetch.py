@@ -0,0 +1,65 @@
+"""
+Measures page title scraping throughput against a local HTTP server:
+a new connection and a full page download + parse for every URL (the old HtmlParser behaviour)
+versus the pooled, streaming TitleFetcher.
+
+Usage: python -m benchmarks.bench_title_fetch [--urls N] [--workers N] [--body-kb N]
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from bs4 import BeautifulSoup
+
+from benchmarks.stub_http_server import StubHttpServer
+from youtube_downloader.html_utils import HtmlParser, TitleFetcher, BS4_HTML_PARSER, DEFAULT_TIMEOUT_SECONDS
+
+
+def fetch_full_page(url):
+    # The old HtmlParser behaviour, the baseline of the benchmark
+    resp = requests.get(url, timeout=DEFAULT_TIMEOUT_SECONDS)
+    resp.raise_for_status()
+    return BeautifulSoup(resp.text, features=BS4_HTML_PARSER).title.string
+
+
+def run(fetch, urls, workers) -> float:
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        titles = list(executor.map(fetch, urls))
+    elapsed = time.perf_counter() - start
+    assert all(titles), "Some titles were not found"
+    return elapsed
+
+
+def main():
+    p = argparse.ArgumentParser(description="Page title scraping: full download per URL vs. pooled streaming")
+    p.add_argument("--urls", type=int, default=500, help="Number of URLs to fetch (default: 500)")
+    p.add_argument("--workers", type=int, default=8, help="Number of fetching threads (default: 8)")
+    p.add_argument("--connections-per-host", type=int, default=8,
+                   help="Connection pool size of the pooled fetcher (default: 8)")
+    p.add_argument("--body-kb", type=int, default=256, help="Size of the page after the title in KiB (default: 256)")
+    args = p.parse_args()
+
+    with StubHttpServer(body_bytes=args.body_kb * 1024) as server:
+        urls = [server.page_url(f"p{i:05d}") for i in range(args.urls)]
+        # Warm up the page cache of the server
+        run(fetch_full_page, urls[:args.workers], args.workers)
+
+        server.reset_counters()
+        full_elapsed = run(fetch_full_page, urls, args.workers)
+        full_connections = server.connections
+
+        server.reset_counters()
+        with TitleFetcher(connections_per_host=args.connections_per_host) as fetcher:
+            pooled_elapsed = run(lambda url: HtmlParser.fetch_title(url, fetcher=fetcher), urls, args.workers)
+        pooled_connections = server.connections
+
+    print(f"URLs: {len(urls)}, workers: {args.workers}, page size: {args.body_kb} KiB")
+    print(f"Full page per URL:  {len(urls) / full_elapsed:8.1f} req/s, {full_connections} connections")
+    print(f"Pooled streaming:   {len(urls) / pooled_elapsed:8.1f} req/s, {pooled_connections} connections")
+    print(f"Speedup:            {full_elapsed / pooled_elapsed:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Compares title extraction from saved pages: a full BeautifulSoup parse of the page (the old HtmlParser path)
+versus the incremental HeadTitleExtractor that stops at the title. Reports CPU time and peak memory per page.
+
+Pages are read from --fixtures-dir (*.html, e.g. saved with "curl -o page.html <url>"),
+or generated to look like YouTube watch pages: large inline scripts, then the title, then a big JSON blob.
+
+Usage: python -m benchmarks.bench_title_parse [--fixtures-dir DIR] [--repeat N]
+"""
+import argparse
+import glob
+import os
+import time
+import tracemalloc
+from typing import Callable, Dict, Optional
+
+from youtube_downloader.html_utils import HtmlParser, HeadTitleExtractor, STREAM_CHUNK_SIZE
+
+
+def make_fixture_page(video_id: str, head_script_bytes: int, body_bytes: int) -> bytes:
+    script = "<script nonce=\"abc\">var ytcfg={" + "\"k\":\"v\"," * (head_script_bytes // 8) + "};</script>"
+    # Half of the body is a JSON blob in a script, the other half markup
+    data = "<script>var ytInitialData={" + "\"a\":[1,2,3]," * (body_bytes // 24) + "};</script>"
+    data += "<div class=\"item\"><a href=\"/watch?v=abc\"><span>Related</span></a></div>" * (body_bytes // 140)
+    return (f"<!DOCTYPE html><html lang=\"en\"><head><meta charset=\"utf-8\">{script}"
+            f"<title>Fixture video {video_id} &amp; friends - YouTube</title>"
+            f"<meta property=\"og:title\" content=\"Fixture video {video_id} &amp; friends\">"
+            f"</head><body>{data}</body></html>").encode("utf-8")
+
+
+def generated_fixtures() -> Dict[str, bytes]:
+    return {
+        "small-page": make_fixture_page("small", head_script_bytes=2 * 1024, body_bytes=50 * 1024),
+        "watch-page": make_fixture_page("watch", head_script_bytes=100 * 1024, body_bytes=1024 * 1024),
+        "late-title": make_fixture_page("late", head_script_bytes=600 * 1024, body_bytes=1024 * 1024),
+    }
+
+
+def load_fixtures(fixtures_dir: str) -> Dict[str, bytes]:
+    fixtures = {}
+    for path in sorted(glob.glob(os.path.join(fixtures_dir, "*.html"))):
+        with open(path, "rb") as f:
+            fixtures[os.path.basename(path)] = f.read()
+    return fixtures
+
+
+def full_parse(page: bytes) -> Optional[str]:
+    return HtmlParser.parse_title(page)
+
+
+def incremental_parse(page: bytes) -> Optional[str]:
+    # Chunks of the same size as the ones TitleFetcher reads from the network
+    extractor = HeadTitleExtractor()
+    for start in range(0, len(page), STREAM_CHUNK_SIZE):
+        extractor.feed(page[start:start + STREAM_CHUNK_SIZE].decode("utf-8", errors="replace"))
+        if extractor.done:
+            break
+    return extractor.title
+
+
+def measure(func: Callable[[bytes], Optional[str]], page: bytes, repeat: int):
+    # Warm up
+    func(page)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        title = func(page)
+    elapsed = (time.perf_counter() - start) / repeat
+    tracemalloc.start()
+    func(page)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return title, elapsed, peak
+
+
+def main():
+    p = argparse.ArgumentParser(description="Title extraction: full BeautifulSoup parse vs. incremental head parse")
+    p.add_argument("--fixtures-dir", default=None, help="Directory of saved *.html pages (default: generated pages)")
+    p.add_argument("--repeat", type=int, default=5, help="Number of parses per page and path (default: 5)")
+    args = p.parse_args()
+
+    fixtures = load_fixtures(args.fixtures_dir) if args.fixtures_dir else generated_fixtures()
+    if not fixtures:
+        raise SystemExit(f"No *.html files found in {args.fixtures_dir}")
+
+    print(f"{'page':<20} {'size':>9} {'path':<13} {'time':>10} {'peak mem':>10}  title")
+    for name, page in fixtures.items():
+        for label, func in (("beautifulsoup", full_parse), ("incremental", incremental_parse)):
+            title, elapsed, peak = measure(func, page, args.repeat)
+            print(f"{name:<20} {len(page) // 1024:>6} KiB {label:<13} {elapsed * 1000:>7.2f} ms "
+                  f"{peak / 1024:>6.0f} KiB  {title}")
+
+
+if __name__ == "__main__":
+    main()
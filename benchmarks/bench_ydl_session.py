@@ -0,0 +1,65 @@
+"""
+Measures the per-URL overhead of creating a YoutubeDL instance for every URL
+versus borrowing a long-lived instance from a YoutubeDLPool.
+Uses the local stub extractor, no network access is needed.
+
+Usage: python -m benchmarks.bench_ydl_session [--urls N] [--browser-cookies]
+"""
+import argparse
+import time
+
+from yt_dlp import YoutubeDL
+
+from benchmarks.stub_extractor import StubIE, stub_url
+from youtube_downloader.ydl_session import YoutubeDLSessionManager
+
+YDL_OPTS = {
+    "quiet": True,
+    "skip_download": True,
+    "ignore_no_formats_error": True,
+}
+
+
+def extract_with_new_instances(urls, ydl_opts):
+    for url in urls:
+        with YoutubeDL(ydl_opts) as ydl:
+            ydl.add_info_extractor(StubIE())
+            ydl.extract_info(url, download=False, ie_key=StubIE.ie_key())
+
+
+def extract_with_pool(urls, ydl_opts):
+    with YoutubeDLSessionManager() as sessions:
+        pool = sessions.get_pool("bench", ydl_opts, on_create=lambda ydl: ydl.add_info_extractor(StubIE()))
+        for url in urls:
+            with pool.session() as ydl:
+                ydl.extract_info(url, download=False, ie_key=StubIE.ie_key())
+
+
+def measure(func, urls, ydl_opts) -> float:
+    start = time.perf_counter()
+    func(urls, ydl_opts)
+    return (time.perf_counter() - start) / len(urls)
+
+
+def main():
+    p = argparse.ArgumentParser(description="YoutubeDL per-URL overhead: new instance vs. pooled session")
+    p.add_argument("--urls", type=int, default=200, help="Number of URLs to extract (default: 200)")
+    p.add_argument("--browser-cookies", action="store_true",
+                   help="Load cookies from Chrome, like the CLI does by default")
+    args = p.parse_args()
+
+    ydl_opts = dict(YDL_OPTS)
+    if args.browser_cookies:
+        ydl_opts["cookiesfrombrowser"] = ("chrome",)
+    urls = [stub_url(f"vid{i:05d}") for i in range(args.urls)]
+
+    per_url_new = measure(extract_with_new_instances, urls, ydl_opts)
+    per_url_pooled = measure(extract_with_pool, urls, ydl_opts)
+    print(f"URLs:              {len(urls)}")
+    print(f"New instance/URL:  {per_url_new * 1000:.2f} ms per URL")
+    print(f"Pooled session:    {per_url_pooled * 1000:.2f} ms per URL")
+    print(f"Speedup:           {per_url_new / per_url_pooled:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+from typing import Any, Callable, Dict, Optional
+
+from yt_dlp import YoutubeDL
+from yt_dlp.extractor.common import InfoExtractor
+
+from youtube_downloader.ydl_session import YoutubeDLPool, YoutubeDLSessionManager
+
+STUB_DOMAIN = "stub.invalid"
+# The generic extractor accepts any URL and comes before extractors added to a YoutubeDL later
+STUB_ALLOWED_EXTRACTORS = ["default", "-generic"]
+
+
+class StubIE(InfoExtractor):
+    """
+    Extractor for a fake domain, returns canned metadata without any network access.
+    The format URL points to media_base_url, e.g. a StubHttpServer serving fixture media.
+    """
+    IE_NAME = "stub"
+    _VALID_URL = r"https?://stub\.invalid/watch\?v=(?P<id>[\w-]+)"
+    media_base_url = f"http://{STUB_DOMAIN}"
+    # Duration of the media, downloads are verified against it
+    duration = 60
+
+    def _real_extract(self, url):
+        video_id = self._match_id(url)
+        return {
+            "id": video_id,
+            "title": f"Stub video {video_id}",
+            "duration": self.duration,
+            "formats": [{
+                "format_id": "18",
+                "url": f"{self.media_base_url}/media/{video_id}.mp4",
+                "ext": "mp4",
+                "vcodec": "avc1.42001E",
+                "acodec": "mp4a.40.2",
+                "width": 640,
+                "height": 360,
+            }],
+        }
+
+
+def stub_url(video_id: str) -> str:
+    return f"https://{STUB_DOMAIN}/watch?v={video_id}"
+
+
+class StubSessionManager(YoutubeDLSessionManager):
+    """
+    Session manager whose YoutubeDL instances extract stub URLs with StubIE, without passing its ie_key.
+    Lets code that creates its own pools, like DownloadEngine.open, run against the stub domain.
+    """
+    def __init__(self, extra_opts: Optional[Dict[str, Any]] = None):
+        """
+        :param extra_opts: Added to the options of every pool, e.g. to silence yt-dlp output
+        """
+        super().__init__()
+        self._extra_opts = extra_opts or {}
+
+    def get_pool(self, name: str, ydl_opts: Dict[str, Any],
+                 on_create: Optional[Callable[[YoutubeDL], None]] = None) -> YoutubeDLPool:
+        def create(ydl: YoutubeDL):
+            ydl.add_info_extractor(StubIE())
+            if on_create:
+                on_create(ydl)
+        ydl_opts = dict(ydl_opts, allowed_extractors=STUB_ALLOWED_EXTRACTORS, **self._extra_opts)
+        return super().get_pool(name, ydl_opts, on_create=create)
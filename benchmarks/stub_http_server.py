@@ -0,0 +1,112 @@
+"""
+Local HTTP server serving generated HTML pages and media files, for benchmarks that must not touch the network.
+"""
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+DEFAULT_BODY_BYTES = 256 * 1024
+
+
+def make_page(page_id: str, body_bytes: int = DEFAULT_BODY_BYTES) -> bytes:
+    """
+    HTML page with the title near the top, followed by body_bytes of filler, like a typical video page.
+    """
+    head = (f"<!DOCTYPE html><html><head><meta charset=\"utf-8\">"
+            f"<title>Stub page {page_id} - YouTube</title></head><body>").encode("utf-8")
+    filler = b"<div class=\"filler\">" + b"x" * max(0, body_bytes - 32) + b"</div>"
+    return head + filler + b"</body></html>"
+
+
+class _QuietHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients drop connections after reading the title, that's expected
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class StubHttpServer:
+    """
+    Serves GET /page/<id> with HTTP/1.1 keep-alive on a free localhost port, in a background thread.
+    GET /media/<anything> returns the media file given to the server, e.g. for StubIE formats.
+    Counts requests and accepted connections, so connection reuse can be checked.
+    """
+    def __init__(self, body_bytes: int = DEFAULT_BODY_BYTES, media: Optional[bytes] = None,
+                 media_latency: float = 0.0):
+        """
+        :param media: Body of every /media/ request
+        :param media_latency: Seconds to wait before answering a /media/ request, like a remote server would
+        """
+        self.requests = 0
+        self.connections = 0
+        self._counter_lock = threading.Lock()
+        self._pages = {}
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body are separate writes: without this, keep-alive requests stall on delayed ACKs
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                super().setup()
+                with server._counter_lock:
+                    server.connections += 1
+
+            def do_GET(self):
+                with server._counter_lock:
+                    server.requests += 1
+                if self.path.startswith("/media/") and media is not None:
+                    time.sleep(media_latency)
+                    self._send(media, "video/mp4")
+                    return
+                if not self.path.startswith("/page/"):
+                    self.send_error(404)
+                    return
+                page_id = self.path[len("/page/"):]
+                page = server._pages.get(page_id)
+                if page is None:
+                    page = server._pages.setdefault(page_id, make_page(page_id, body_bytes))
+                self._send(page, "text/html; charset=utf-8")
+
+            def _send(self, body: bytes, content_type: str):
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                try:
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client stopped reading after the title
+                    self.close_connection = True
+
+            def log_message(self, format, *args):
+                pass
+
+        self._httpd = _QuietHTTPServer(("127.0.0.1", 0), Handler)
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="stub-http", daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def page_url(self, page_id: str) -> str:
+        return f"{self.base_url}/page/{page_id}"
+
+    def reset_counters(self) -> None:
+        with self._counter_lock:
+            self.requests = 0
+            self.connections = 0
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._httpd.shutdown()
+        self._httpd.server_close()
@@ -0,0 +1,91 @@
+from datetime import datetime
+
+import pytest
+
+from youtube_downloader.bandwidth import BandwidthWindow, fair_shares, parse_rate
+
+# 2026-10-16 is a Friday
+FRIDAY = 16
+SATURDAY = 17
+SUNDAY = 18
+MONDAY = 19
+
+
+def at(day: int, hour: int, minute: int = 0) -> datetime:
+    return datetime(2026, 10, day, hour, minute)
+
+
+def test_parse_rate_uses_powers_of_1024():
+    assert parse_rate("500K") == 500 * 1024
+    assert parse_rate("4M/s") == 4 * 1024 * 1024
+    with pytest.raises(ValueError):
+        parse_rate("fast")
+
+
+def test_fair_shares_split_equally_without_demands():
+    assert fair_shares(900, [None, None, None]) == [300, 300, 300]
+
+
+def test_fair_shares_give_slow_downloads_what_they_need():
+    assert fair_shares(900, [100, None, None]) == [100, 400, 400]
+
+
+def test_fair_shares_split_left_over_budget():
+    # Both need less than the budget, the rest is split equally
+    assert fair_shares(1000, [100, 300]) == [400, 600]
+
+
+def test_fair_shares_without_downloads():
+    assert fair_shares(1000, []) == []
+
+
+def test_window_parse():
+    window = BandwidthWindow.parse("Mon-Fri 09:00-17:30=4M")
+    assert (window.start, window.end) == (9 * 60, 17 * 60 + 30)
+    assert window.rate == 4 * 1024 * 1024
+    assert window.days == frozenset(range(5))
+    assert str(window) == "Mon-Fri 09:00-17:30=4M"
+    assert BandwidthWindow.parse("01:00-07:00=0").rate == 0
+
+
+@pytest.mark.parametrize("value", ["09:00-17:00", "25:00-26:00=1M", "09:60-10:00=1M", "xyz 09:00-10:00=1M",
+                                   "09:00-10:00=fast"])
+def test_window_parse_invalid(value):
+    with pytest.raises(ValueError):
+        BandwidthWindow.parse(value)
+
+
+def test_window_days_wrap_across_the_end_of_the_week():
+    assert BandwidthWindow.parse("fri-mon 00:00-06:00=1M").days == frozenset({4, 5, 6, 0})
+    assert BandwidthWindow.parse("sat,sun 00:00-06:00=1M").days == frozenset({5, 6})
+
+
+def test_window_contains():
+    window = BandwidthWindow.parse("mon-fri 09:00-17:00=0")
+    assert window.contains(at(FRIDAY, 9))
+    assert window.contains(at(FRIDAY, 16, 59))
+    assert not window.contains(at(FRIDAY, 17))
+    assert not window.contains(at(SATURDAY, 12))
+
+
+def test_window_over_midnight_belongs_to_the_day_it_starts():
+    window = BandwidthWindow.parse("fri 22:00-06:00=1M")
+    assert window.contains(at(FRIDAY, 23))
+    assert window.contains(at(SATURDAY, 5, 59))
+    assert not window.contains(at(SATURDAY, 6))
+    # Started on Thursday
+    assert not window.contains(at(FRIDAY, 1))
+    assert not window.contains(at(SATURDAY, 23))
+
+
+def test_window_over_midnight_on_every_day():
+    window = BandwidthWindow.parse("22:00-06:00=1M")
+    assert window.contains(at(MONDAY, 2))
+    assert window.contains(at(MONDAY, 22))
+    assert not window.contains(at(MONDAY, 12))
+
+
+def test_window_with_the_same_start_and_end_lasts_all_day():
+    window = BandwidthWindow.parse("sun 00:00-00:00=0")
+    assert window.contains(at(SUNDAY, 12))
+    assert not window.contains(at(MONDAY, 12))
@@ -0,0 +1,149 @@
+import shelve
+
+import pytest
+
+from youtube_downloader import cache as cache_module
+from youtube_downloader.cache import CacheEntry, HotTitleCache, VideoTitleCache
+
+VIDEO_URL = "https://www.youtube.com/watch?v=dQw4w9WgXcQ"
+
+
+class Clock:
+    def __init__(self, now: float = 1_000_000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache_module.time, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "titles.sqlite3")
+
+
+def open_cache(db_path: str, **kwargs) -> VideoTitleCache:
+    return VideoTitleCache(file_path=db_path, legacy_shelf_path=None, **kwargs)
+
+
+def test_entries_are_stored_normalized_under_their_canonical_url(db_path):
+    with open_cache(db_path) as cache:
+        assert cache.put("https://youtu.be/dQw4w9WgXcQ", "Never\n\tGonna   Give") == "Never Gonna Give"
+    with open_cache(db_path) as cache:
+        assert cache.get(VIDEO_URL) == "Never Gonna Give"
+        assert cache.get("https://www.youtube.com/shorts/dQw4w9WgXcQ") == "Never Gonna Give"
+        assert len(cache) == 1
+
+
+def test_pending_writes_are_saved_on_close(db_path):
+    cache = open_cache(db_path, batch_size=1000)
+    cache.put("https://example.com/a", "A")
+    cache.close()
+    with open_cache(db_path) as cache:
+        assert cache.get("https://example.com/a") == "A"
+
+
+def test_least_recently_used_entries_are_evicted_above_max_entries(db_path, clock):
+    with open_cache(db_path, max_entries=2) as cache:
+        cache.put("https://example.com/a", "A")
+        cache.save()
+        clock.now += 1
+        cache.put("https://example.com/b", "B")
+        cache.save()
+        clock.now += 1
+        cache.get("https://example.com/a")
+        cache.put("https://example.com/c", "C")
+        cache.save()
+        assert len(cache) == 2
+        assert cache.get("https://example.com/b") is None
+        assert cache.get("https://example.com/a") == "A"
+        assert cache.get("https://example.com/c") == "C"
+
+
+def test_least_recently_used_entries_are_evicted_above_max_bytes(db_path, clock):
+    with open_cache(db_path, max_bytes=10) as cache:
+        cache.put("https://example.com/a", "aaaa")
+        clock.now += 1
+        cache.save()
+        cache.put("https://example.com/b", "bbbb")
+        clock.now += 1
+        cache.save()
+        cache.put("https://example.com/c", "cccc")
+        cache.save()
+        assert sorted(url for url, _ in cache.entries()) == ["https://example.com/b", "https://example.com/c"]
+
+
+def test_close_evicts_entries_above_the_limits(db_path, clock):
+    cache = open_cache(db_path, max_entries=1)
+    cache.put("https://example.com/a", "A")
+    cache.save()
+    clock.now += 1
+    cache.put("https://example.com/b", "B")
+    cache.close()
+    with open_cache(db_path) as cache:
+        assert [url for url, _ in cache.entries()] == ["https://example.com/b"]
+
+
+def test_hot_tier_evicts_entries_that_were_not_read(db_path):
+    with open_cache(db_path, hot_cache_size=2) as cache:
+        cache.put("https://example.com/a", "A")
+        cache.put("https://example.com/b", "B")
+        cache.get("https://example.com/a")
+        cache.put("https://example.com/c", "C")
+        assert cache.hot_stats["size"] == 2
+        assert cache.hot_stats["evictions"] == 1
+        # Evicted from memory only
+        assert cache.get("https://example.com/b") == "B"
+
+
+def test_hot_tier_gives_referenced_entries_a_second_chance():
+    hot = HotTitleCache(max_entries=2)
+    hot.put("a", CacheEntry(title="A"))
+    hot.put("b", CacheEntry(title="B"))
+    assert hot.get("a").title == "A"
+    hot.put("c", CacheEntry(title="C"))
+    assert hot.get("b") is None
+    hot.put("d", CacheEntry(title="D"))
+    # The reference bit of a was cleared by the first eviction
+    assert hot.get("a") is None
+    assert hot.stats() == {"size": 2, "hits": 1, "misses": 2, "evictions": 2}
+
+
+def test_eviction_clears_the_hot_tier(db_path, clock):
+    with open_cache(db_path, max_entries=1) as cache:
+        cache.put("https://example.com/a", "A")
+        cache.save()
+        clock.now += 1
+        cache.put("https://example.com/b", "B")
+        cache.save()
+        assert cache.get("https://example.com/a") is None
+
+
+def test_shelf_is_migrated_once(db_path, tmp_path):
+    shelf_path = str(tmp_path / "webpage_title_cache")
+    with shelve.open(shelf_path) as shelf:
+        shelf["https://youtu.be/dQw4w9WgXcQ"] = "Old\ttitle"
+        shelf["https://example.com/page"] = {"title": "Page", "video_id": None, "duration": None}
+        shelf["https://example.com/empty"] = ""
+
+    with open_cache(db_path) as cache:
+        cache.put("https://example.com/page", "Newer page")
+    with VideoTitleCache(file_path=db_path, legacy_shelf_path=shelf_path) as cache:
+        assert len(cache) == 2
+        assert cache.get(VIDEO_URL) == "Old title"
+        # Entries of the database are newer than the shelf
+        assert cache.get("https://example.com/page") == "Newer page"
+        cache.delete(VIDEO_URL)
+    with VideoTitleCache(file_path=db_path, legacy_shelf_path=shelf_path) as cache:
+        assert cache.get(VIDEO_URL) is None
+
+
+def test_missing_shelf_is_ignored(db_path, tmp_path):
+    with VideoTitleCache(file_path=db_path, legacy_shelf_path=str(tmp_path / "missing")) as cache:
+        assert len(cache) == 0
@@ -0,0 +1,55 @@
+import pytest
+
+from youtube_downloader.canonical import UrlCanonicalizer, YOUTUBE_EXTRACTOR, YOUTUBE_PLAYLIST_EXTRACTOR
+
+VIDEO_ID = "dQw4w9WgXcQ"
+PLAYLIST_ID = "PLrAXtmErZgOeiKm4sgNOknGvNjby9efdf"
+
+
+@pytest.mark.parametrize("url", [
+    f"https://www.youtube.com/watch?v={VIDEO_ID}",
+    f"http://youtube.com/watch?v={VIDEO_ID}&t=42s&si=abc",
+    f"https://www.youtube.com/watch?v={VIDEO_ID}&list={PLAYLIST_ID}&index=3",
+    f"https://youtu.be/{VIDEO_ID}?si=abc",
+    f"https://m.youtube.com/watch?v={VIDEO_ID}",
+    f"https://music.youtube.com/watch?v={VIDEO_ID}",
+    f"https://www.youtube.com/shorts/{VIDEO_ID}",
+    f"https://www.youtube.com/embed/{VIDEO_ID}",
+    f"https://www.youtube.com/live/{VIDEO_ID}?feature=share",
+    f"https://www.youtube-nocookie.com/embed/{VIDEO_ID}",
+    f"  www.youtube.com/watch?v={VIDEO_ID}  ",
+    f"https://WWW.YouTube.com/watch?v={VIDEO_ID}",
+])
+def test_video_url_forms(url):
+    canonical = UrlCanonicalizer.canonicalize(url)
+    assert canonical.extractor == YOUTUBE_EXTRACTOR
+    assert canonical.id == VIDEO_ID
+    assert canonical.url == f"https://www.youtube.com/watch?v={VIDEO_ID}"
+    assert UrlCanonicalizer.canonical_key(url) == f"youtube:{VIDEO_ID}"
+
+
+def test_playlist_url():
+    canonical = UrlCanonicalizer.canonicalize(f"https://www.youtube.com/playlist?list={PLAYLIST_ID}&si=abc")
+    assert canonical.extractor == YOUTUBE_PLAYLIST_EXTRACTOR
+    assert not canonical.is_video
+    assert canonical.url == f"https://www.youtube.com/playlist?list={PLAYLIST_ID}"
+    assert canonical.key == f"youtubetab:{PLAYLIST_ID}"
+
+
+@pytest.mark.parametrize("url", [
+    "https://example.com/watch?v=dQw4w9WgXcQ",
+    "https://www.youtube.com/",
+    "https://www.youtube.com/watch?v=tooshort",
+    "https://www.youtube.com/watch",
+    "https://www.youtube.com/@channel/videos",
+    "https://youtu.be/",
+    "not a url",
+])
+def test_other_urls(url):
+    assert UrlCanonicalizer.canonicalize(url) is None
+    assert UrlCanonicalizer.canonical_key(url) is None
+
+
+def test_video_ids_are_case_sensitive():
+    assert UrlCanonicalizer.canonical_key("https://youtu.be/dQw4w9WgXcQ") != \
+           UrlCanonicalizer.canonical_key("https://youtu.be/DQW4W9WGXCQ")
@@ -0,0 +1,67 @@
+import pytest
+
+from youtube_downloader.codec_policy import AAC_ENCODER, CodecPolicy, EncodeStats, H264_ENCODER
+from youtube_downloader.ffmpeg_utils import COPY_CODEC
+
+
+@pytest.mark.parametrize("vcodec, acodec, video_codec, audio_codec", [
+    ("avc1.640028", "mp4a.40.2", COPY_CODEC, COPY_CODEC),
+    ("h264", "aac", COPY_CODEC, COPY_CODEC),
+    ("hevc", "aac", COPY_CODEC, COPY_CODEC),
+    ("vp09.00.40.08", "opus", H264_ENCODER, AAC_ENCODER),
+    ("VP9", "mp4a.40.2", H264_ENCODER, COPY_CODEC),
+    ("av01.0.08M.08", "aac", H264_ENCODER, COPY_CODEC),
+    ("avc1.640028", "vorbis", COPY_CODEC, AAC_ENCODER),
+    (None, "opus", COPY_CODEC, AAC_ENCODER),
+])
+def test_plan(vcodec, acodec, video_codec, audio_codec):
+    plan = CodecPolicy.plan(vcodec, acodec)
+    assert (plan.video_codec, plan.audio_codec) == (video_codec, audio_codec)
+    assert plan.transcodes_video == (video_codec != COPY_CODEC)
+
+
+def test_compatible_streams_are_only_remuxed_out_of_other_containers():
+    plan = CodecPolicy.plan("avc1.640028", "mp4a.40.2")
+    assert plan.is_copy
+    assert not plan.needs_ffmpeg("/out/video.mp4")
+    assert not plan.needs_ffmpeg("/out/video.MP4")
+    assert plan.needs_ffmpeg("/out/video.mkv")
+    assert CodecPolicy.plan("vp9", "opus").needs_ffmpeg("/out/video.mp4")
+
+
+def test_plan_for_info_uses_the_selected_formats():
+    info = {"requested_formats": [
+        {"format_id": "248", "vcodec": "vp9", "acodec": "none"},
+        {"format_id": "140", "vcodec": "none", "acodec": "mp4a.40.2"},
+    ]}
+    plan = CodecPolicy.plan_for_info(info)
+    assert (plan.video_codec, plan.audio_codec) == (H264_ENCODER, COPY_CODEC)
+    assert (plan.source_vcodec, plan.source_acodec) == ("vp9", "mp4a.40.2")
+
+
+def test_plan_for_info_of_a_single_format():
+    plan = CodecPolicy.plan_for_info({"vcodec": "avc1.4d401f", "acodec": "mp4a.40.2"})
+    assert plan.is_copy
+
+
+def test_plan_for_info_without_known_codecs():
+    assert CodecPolicy.plan_for_info({"format_id": "18"}) is None
+    assert CodecPolicy.plan_for_info({"vcodec": "none", "acodec": "none"}) is None
+
+
+def test_encode_stats_estimate_the_time_saved_by_copies():
+    stats = EncodeStats()
+    stats.record(CodecPolicy.plan("vp9", "opus"), media_seconds=100.0, elapsed_seconds=50.0)
+    stats.record(CodecPolicy.plan("avc1.640028", "mp4a.40.2"), media_seconds=200.0, elapsed_seconds=1.0)
+    assert (stats.transcoded_files, stats.copied_files) == (1, 1)
+    assert stats.encode_seconds_per_media_second == 0.5
+    assert stats.estimated_saved_seconds == 100.0
+
+
+def test_encode_stats_do_not_count_audio_re_encodes_as_copies():
+    stats = EncodeStats()
+    stats.record(CodecPolicy.plan("avc1.640028", "opus"), media_seconds=300.0, elapsed_seconds=3.0)
+    assert (stats.transcoded_files, stats.audio_transcoded_files, stats.copied_files) == (0, 1, 0)
+    assert stats.copied_media_seconds == 0
+    assert stats.estimated_saved_seconds == 0
+    assert "1 files with only their audio re-encoded" in stats.summary()
@@ -0,0 +1,37 @@
+from youtube_downloader.utils import FileUtils, UrlDeduplicator
+
+
+def test_url_forms_of_the_same_video_are_duplicates():
+    deduplicator = UrlDeduplicator()
+    assert deduplicator.add("https://www.youtube.com/watch?v=dQw4w9WgXcQ")
+    assert not deduplicator.add("https://youtu.be/dQw4w9WgXcQ?si=abc")
+    assert not deduplicator.add("https://www.youtube.com/shorts/dQw4w9WgXcQ")
+    assert deduplicator.add("https://www.youtube.com/watch?v=9bZkp7q19f0")
+    assert len(deduplicator) == 2
+    assert deduplicator.duplicates == 2
+
+
+def test_playlist_and_video_ids_do_not_collide():
+    deduplicator = UrlDeduplicator()
+    assert deduplicator.add("https://www.youtube.com/watch?v=PLabcdefghi")
+    assert deduplicator.add("https://www.youtube.com/playlist?list=PLabcdefghi")
+
+
+def test_other_urls_are_compared_as_they_are():
+    deduplicator = UrlDeduplicator()
+    assert deduplicator.add("https://example.com/a")
+    assert not deduplicator.add("https://example.com/a")
+    assert deduplicator.add("https://example.com/a?b=1")
+    assert UrlDeduplicator.key("https://example.com/a") == "https://example.com/a"
+
+
+def test_iter_urls_skips_duplicates_and_comments(tmp_path):
+    urls_file = tmp_path / "urls.txt"
+    urls_file.write_text("# Music\n"
+                         "https://www.youtube.com/watch?v=dQw4w9WgXcQ\n"
+                         "\n"
+                         "again: https://youtu.be/dQw4w9WgXcQ\n"
+                         "https://www.youtube.com/watch?v=9bZkp7q19f0\n", encoding="utf-8")
+    assert list(FileUtils.iter_urls(str(urls_file))) == ["https://www.youtube.com/watch?v=dQw4w9WgXcQ",
+                                                         "https://www.youtube.com/watch?v=9bZkp7q19f0"]
+    assert len(list(FileUtils.iter_urls(str(urls_file), dedupe=False))) == 3
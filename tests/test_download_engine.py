@@ -0,0 +1,97 @@
+import io
+
+import pytest
+
+from benchmarks.stub_extractor import StubSessionManager, stub_url
+from youtube_downloader.archive import DownloadArchive
+from youtube_downloader.download_engine import AUDIO_MP3, AUDIO_OPUS, DownloadEngine, DownloadItem, EngineConfig, \
+    KEEP_OPUS_M4A_AUDIO_CODEC, VIDEO_MP4, build_download_items, ensure_all_processed, make_ydl_opts
+from youtube_downloader.journal import JournalState, RunJournal
+from youtube_downloader.progress import ProgressReporter
+from youtube_downloader.transcode import CodecAwareConvertorPP
+
+QUIET_YDL_OPTS = {"quiet": True, "noprogress": True, "no_warnings": True}
+URL = stub_url("video1")
+OTHER_URL = stub_url("video2")
+
+
+class UnusedExpander:
+    def expand(self, url):
+        raise AssertionError(f"Unexpected playlist: {url}")
+
+
+@pytest.fixture
+def config(tmp_path):
+    return EngineConfig(urls_file=str(tmp_path / "urls.txt"), output_dir=str(tmp_path / "out"),
+                        use_browser_cookies=False, use_archive=False)
+
+
+@pytest.fixture
+def progress():
+    with ProgressReporter(stream=io.StringIO()) as progress:
+        yield progress
+
+
+@pytest.fixture
+def sessions():
+    with StubSessionManager(QUIET_YDL_OPTS) as sessions:
+        yield sessions
+
+
+def test_video_urls_of_playlists_are_downloaded_as_videos(config, sessions):
+    opts = make_ydl_opts(config.output_dir, cookiefile=None, use_browser_cookies=False)
+    assert opts["noplaylist"] is True
+    with sessions.get_pool("download", opts).session() as ydl:
+        info = ydl.extract_info(URL, download=False)
+    assert ydl.params["noplaylist"] is True
+    assert info["id"] == "video1"
+
+
+def test_archived_files_are_not_downloaded_again(config, progress, tmp_path):
+    downloaded = tmp_path / "video1.mp4"
+    downloaded.write_bytes(b"\0" * 16)
+    engine = DownloadEngine(VIDEO_MP4, config, progress)
+    with DownloadArchive(str(tmp_path / "archive.sqlite3")) as archive:
+        engine.archive = archive
+        archive.record(("stub", "video1"), str(downloaded), url=URL)
+        assert not engine.needs_download(DownloadItem(URL), 1, 2)
+        assert engine.needs_download(DownloadItem(OTHER_URL), 2, 2)
+        # Downloaded again if the file is gone
+        downloaded.unlink()
+        assert engine.needs_download(DownloadItem(URL), 1, 2)
+
+
+def test_resumed_journal_skips_finished_items(config, progress, tmp_path):
+    journal_path = str(tmp_path / "journal.jsonl")
+    with RunJournal(journal_path).open() as journal:
+        journal.record(URL, None, JournalState.VERIFIED)
+        journal.record(OTHER_URL, None, JournalState.DOWNLOADED)
+
+    engine = DownloadEngine(VIDEO_MP4, config, progress)
+    with RunJournal(journal_path).open(resume=True) as journal:
+        engine.journal = journal
+        items = list(build_download_items([URL, OTHER_URL], UnusedExpander(), [journal]))
+        assert [item.url for item in items] == [OTHER_URL]
+        assert not engine.needs_download(DownloadItem(URL), 1, 2)
+        assert engine.needs_download(DownloadItem(OTHER_URL), 2, 2)
+        with pytest.raises(ValueError, match="video2"):
+            ensure_all_processed(journal)
+        engine.mark_processed(OTHER_URL, None)
+        ensure_all_processed(journal)
+
+
+@pytest.mark.parametrize("profile, reencodes", [
+    (VIDEO_MP4, True),
+    (VIDEO_MP4.without_reencode(), False),
+])
+def test_no_reencode_drops_the_convertor(config, progress, sessions, profile, reencodes):
+    engine = DownloadEngine(profile, config, progress)
+    with engine.make_download_pool(sessions).session() as ydl:
+        convertors = [pp for pp in ydl._pps["post_process"] if isinstance(pp, CodecAwareConvertorPP)]
+    assert bool(convertors) == reencodes
+
+
+def test_no_reencode_keeps_opus_and_m4a_audio():
+    assert AUDIO_MP3.without_reencode().postprocessors() == [
+        {"key": "FFmpegExtractAudio", "preferredcodec": KEEP_OPUS_M4A_AUDIO_CODEC, "preferredquality": "192"}]
+    assert AUDIO_OPUS.without_reencode() == AUDIO_OPUS
@@ -0,0 +1,137 @@
+import pytest
+import requests
+
+from youtube_downloader.governor import BACKOFF_FACTOR, HostLimiter, RATE_INCREASE, RequestGovernor
+
+THROTTLED = Exception("HTTP Error 429: Too Many Requests")
+
+
+def http_error(status_code: int, retry_after: str = None) -> requests.HTTPError:
+    response = requests.Response()
+    response.status_code = status_code
+    if retry_after is not None:
+        response.headers["Retry-After"] = retry_after
+    return requests.HTTPError(f"{status_code} Client Error", response=response)
+
+
+@pytest.fixture
+def limiter():
+    return HostLimiter("youtube.com", requests_per_second=100.0, burst=10, max_concurrency=8)
+
+
+def test_throttled_request_halves_the_limits(limiter):
+    started = limiter.acquire()
+    limiter.release(started, THROTTLED)
+    assert limiter.limit == 8 * BACKOFF_FACTOR
+    assert limiter.rate == 100.0 * BACKOFF_FACTOR
+    assert limiter.throttled == 1
+    assert "backing off" in limiter.status()
+
+
+def test_successful_requests_raise_the_limits_up_to_the_max(limiter):
+    with pytest.raises(requests.HTTPError):
+        with limiter.request():
+            # No cooldown
+            raise http_error(429, retry_after="0")
+    with limiter.request():
+        pass
+    assert limiter.limit == 4 + 1 / 4
+    assert limiter.rate == pytest.approx(50.0 + RATE_INCREASE)
+    for _ in range(30):
+        with limiter.request():
+            pass
+    assert limiter.limit == 8
+    assert limiter.in_flight == 0
+
+
+def test_rate_does_not_grow_above_the_max(limiter):
+    with limiter.request():
+        pass
+    assert (limiter.limit, limiter.rate) == (8, 100.0)
+
+
+def test_requests_started_before_a_decrease_do_not_decrease_again(limiter):
+    first = limiter.acquire()
+    second = limiter.acquire()
+    limiter.release(first, THROTTLED)
+    limiter.release(second, THROTTLED)
+    assert limiter.limit == 4
+    assert limiter.throttled == 2
+
+
+def test_other_errors_leave_the_limits_unchanged(limiter):
+    with pytest.raises(ValueError):
+        with limiter.request():
+            raise ValueError("Video unavailable")
+    assert (limiter.limit, limiter.rate, limiter.in_flight, limiter.throttled) == (8, 100.0, 0, 0)
+
+
+def test_invalid_limits():
+    with pytest.raises(ValueError):
+        HostLimiter("youtube.com", requests_per_second=0)
+
+
+def test_hosts_of_the_same_site_share_a_limiter():
+    governor = RequestGovernor()
+    assert governor.limiter("https://youtu.be/dQw4w9WgXcQ") is \
+           governor.limiter("https://www.youtube.com/watch?v=dQw4w9WgXcQ")
+    assert governor.limiter("https://example.com/") is not governor.limiter("https://www.youtube.com/")
+
+
+@pytest.mark.parametrize("url", [
+    "https://youtu.be/dQw4w9WgXcQ",
+    "https://m.youtube.com/watch?v=dQw4w9WgXcQ",
+    "https://music.youtube.com/watch?v=dQw4w9WgXcQ",
+    "https://gaming.youtube.com/watch?v=dQw4w9WgXcQ",
+    "https://youtube-nocookie.com/embed/dQw4w9WgXcQ",
+    "https://www.youtube-nocookie.com/embed/dQw4w9WgXcQ",
+    "https://www.youtube.com/watch?v=dQw4w9WgXcQ",
+])
+def test_host_of_youtube_hosts(url):
+    assert RequestGovernor.host_of(url) == "youtube.com"
+
+
+def test_host_of_other_hosts():
+    assert RequestGovernor.host_of("https://www.example.com/page") == "example.com"
+    assert RequestGovernor.host_of("https://cdn.example.com/page") == "cdn.example.com"
+
+
+def test_call_retries_throttled_requests():
+    governor = RequestGovernor(requests_per_second=1000.0, throttle_retries=2)
+    results = [http_error(429, retry_after="0"), "Title"]
+
+    def fetch():
+        result = results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    assert governor.call("https://www.youtube.com/watch?v=dQw4w9WgXcQ", fetch) == "Title"
+    assert "youtube.com: 1 throttled" in governor.summary()
+
+
+def test_call_gives_up_after_the_throttle_retries():
+    governor = RequestGovernor(requests_per_second=1000.0, throttle_retries=2)
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        raise http_error(403, retry_after="0")
+
+    with pytest.raises(requests.HTTPError):
+        governor.call("https://www.youtube.com/watch?v=dQw4w9WgXcQ", fetch)
+    assert len(calls) == 3
+
+
+def test_call_does_not_retry_other_errors():
+    governor = RequestGovernor()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        raise http_error(404)
+
+    with pytest.raises(requests.HTTPError):
+        governor.call("https://www.youtube.com/watch?v=dQw4w9WgXcQ", fetch)
+    assert len(calls) == 1
+    assert governor.summary() == ""
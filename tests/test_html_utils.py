@@ -0,0 +1,139 @@
+import pytest
+
+from benchmarks.stub_http_server import StubHttpServer
+from youtube_downloader.governor import RequestGovernor
+from youtube_downloader.html_utils import HeadTitleExtractor, HtmlParser, STREAM_CHUNK_SIZE, TitleFetcher
+
+
+@pytest.fixture
+def large_pages():
+    with StubHttpServer(body_bytes=512 * 1024) as server:
+        yield server
+
+
+@pytest.fixture
+def small_pages():
+    with StubHttpServer(body_bytes=1024) as server:
+        yield server
+
+
+def test_fetch_head_stops_reading_after_the_title(large_pages):
+    with TitleFetcher() as fetcher:
+        content, charset = fetcher.fetch_head(large_pages.page_url("a"))
+    assert content.startswith(b"<!DOCTYPE html>")
+    assert b"<title>Stub page a - YouTube</title>" in content
+    assert len(content) <= STREAM_CHUNK_SIZE
+    assert charset == "utf-8"
+
+
+def test_small_bodies_are_drained_and_the_connection_is_reused(small_pages):
+    with TitleFetcher() as fetcher:
+        for page_id in ("a", "b", "c"):
+            fetcher.fetch_head(small_pages.page_url(page_id))
+    assert small_pages.requests == 3
+    assert small_pages.connections == 1
+
+
+def test_large_bodies_are_not_drained(large_pages):
+    with TitleFetcher() as fetcher:
+        for page_id in ("a", "b"):
+            fetcher.fetch_head(large_pages.page_url(page_id))
+    assert large_pages.connections == 2
+
+
+def test_fetch_title_through_a_governor(small_pages):
+    governor = RequestGovernor(requests_per_second=1000.0)
+    with TitleFetcher(governor=governor) as fetcher:
+        assert HtmlParser.fetch_title(small_pages.page_url("a"), fetcher=fetcher) == "Stub page a - YouTube"
+    assert governor.limiter(small_pages.base_url).current_rate > 0
+
+
+def test_use_governor_keeps_the_shared_fetcher(small_pages, monkeypatch):
+    monkeypatch.setattr(HtmlParser, "_fetcher", None)
+    monkeypatch.setattr(HtmlParser, "_governor", None)
+    assert HtmlParser.fetch_title(small_pages.page_url("a")) == "Stub page a - YouTube"
+    fetcher = HtmlParser._fetcher
+    governor = RequestGovernor(requests_per_second=1000.0)
+    HtmlParser.use_governor(governor)
+    assert HtmlParser.fetch_title(small_pages.page_url("b")) == "Stub page b - YouTube"
+    assert HtmlParser._fetcher is fetcher
+    assert governor.limiter(small_pages.base_url).current_rate > 0
+    assert small_pages.connections == 1
+    fetcher.close()
+
+
+def extract(*chunks: str, **kwargs) -> HeadTitleExtractor:
+    extractor = HeadTitleExtractor(**kwargs)
+    for chunk in chunks:
+        extractor.feed(chunk)
+    return extractor
+
+
+def test_title_split_across_feeds():
+    extractor = extract("<html><head><title>Never Gonna ", "Give &amp; You Up</title>")
+    assert extractor.done
+    assert extractor.title == "Never Gonna Give & You Up"
+
+
+def test_not_done_before_the_end_of_the_title():
+    extractor = extract("<html><head><title>Never Gonna")
+    assert not extractor.done
+    assert extractor.title is None
+
+
+def test_og_title_before_the_title():
+    extractor = extract('<head><meta property="og:title" content="Open Graph"><title>Page</title>')
+    assert extractor.done
+    assert extractor.title == "Open Graph"
+
+
+def test_feeding_after_done_is_ignored():
+    extractor = extract("<title>First</title>", "<title>Second</title>")
+    assert extractor.title == "First"
+
+
+def test_body_without_a_title():
+    extractor = extract("<html><head><meta charset='utf-8'></head><body><title>In the body</title>")
+    assert extractor.done
+    assert extractor.title is None
+    assert extractor.charset == "utf-8"
+
+
+def test_gives_up_after_max_chars():
+    extractor = extract("<head><script>" + "x" * 200, "y" * 200, max_chars=300)
+    assert extractor.done
+    assert extractor.title is None
+    assert extractor.fed == 414
+
+
+def test_non_utf8_meta_charset_falls_back_to_beautifulsoup():
+    extractor = extract('<head><meta http-equiv="Content-Type" content="text/html; charset=ISO-8859-2">'
+                        '<title>Mojibake</title>')
+    assert extractor.charset == "ISO-8859-2"
+    assert HtmlParser._get_extracted_title(extractor, None) is None
+    # The charset of the response header is what the page was decoded with
+    assert HtmlParser._get_extracted_title(extractor, "iso-8859-2") == "Mojibake"
+    assert HtmlParser._get_extracted_title(extract("<meta charset='UTF-8'><title>Ok</title>"), None) == "Ok"
+
+
+def test_parse_title_decodes_with_the_declared_charset():
+    content = '<html><head><meta charset="iso-8859-2"><title>Árvíztűrő</title></head></html>'.encode("iso-8859-2")
+    assert HtmlParser.parse_title(content) == "Árvíztűrő"
+    assert HtmlParser.parse_title("<title>Árvíztűrő</title>".encode("iso-8859-2"), "iso-8859-2") == "Árvíztűrő"
+    assert HtmlParser.parse_title(b"<html><body>No title</body></html>") is None
+
+
+def test_fetch_title_falls_back_to_beautifulsoup(monkeypatch):
+    page = '<html><head><meta charset="iso-8859-2"><title>Árvíztűrő</title></head></html>'.encode("iso-8859-2")
+
+    class Fetcher:
+        def fetch_head(self, url, extractor=None):
+            extractor.feed(page.decode("utf-8", errors="replace"))
+            return page, None
+
+    parsed = []
+    parse_title = HtmlParser.parse_title
+    monkeypatch.setattr(HtmlParser, "parse_title",
+                        staticmethod(lambda content, charset=None: parsed.append(content) or parse_title(content)))
+    assert HtmlParser.fetch_title("https://example.com/", fetcher=Fetcher()) == "Árvíztűrő"
+    assert parsed == [page]
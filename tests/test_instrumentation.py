@@ -0,0 +1,49 @@
+import threading
+
+import pytest
+
+from youtube_downloader.instrumentation import Instrumentation
+
+URL = "https://www.youtube.com/watch?v=dQw4w9WgXcQ"
+
+
+@pytest.fixture
+def instrumentation():
+    instrumentation = Instrumentation()
+    instrumentation.enable()
+    yield instrumentation
+    instrumentation.disable()
+
+
+def test_spans_without_a_key_belong_to_the_enclosing_span(instrumentation):
+    with instrumentation.span("download_url", key=URL):
+        with instrumentation.span("verify_output"):
+            pass
+        instrumentation.record("encode", 2.0)
+    with instrumentation.span("unrelated"):
+        pass
+    report = instrumentation.report()
+    assert set(report["urls"]) == {URL}
+    assert set(report["urls"][URL]) == {"download_url", "verify_output", "encode"}
+    assert report["urls"][URL]["encode"] == 2.0
+    assert report["spans"]["unrelated"]["count"] == 1
+
+
+def test_keys_of_spans_are_per_thread(instrumentation):
+    def other_thread():
+        with instrumentation.span("fetch_title"):
+            pass
+
+    with instrumentation.span("download_url", key=URL):
+        thread = threading.Thread(target=other_thread)
+        thread.start()
+        thread.join()
+    assert set(instrumentation.report()["urls"][URL]) == {"download_url"}
+    assert instrumentation.report()["spans"]["fetch_title"]["count"] == 1
+
+
+def test_nothing_is_recorded_while_disabled():
+    instrumentation = Instrumentation()
+    with instrumentation.span("download_url", key=URL):
+        instrumentation.record("encode", 1.0)
+    assert instrumentation.report() == {"spans": {}, "urls": {}}
@@ -0,0 +1,95 @@
+import json
+
+import pytest
+
+from youtube_downloader.journal import JournalState, RunJournal
+from youtube_downloader.playlist import ExpandedPlaylist, PlaylistEntry
+
+URL = "https://www.youtube.com/watch?v=dQw4w9WgXcQ"
+OTHER_URL = "https://www.youtube.com/watch?v=9bZkp7q19f0"
+
+
+@pytest.fixture
+def journal_path(tmp_path):
+    return str(tmp_path / "journals" / "urls.txt-abc.jsonl")
+
+
+def test_states_only_move_forward(journal_path):
+    with RunJournal(journal_path).open() as journal:
+        assert journal.record(URL, None, JournalState.QUEUED)
+        assert journal.record(URL, None, JournalState.DOWNLOADED)
+        assert not journal.record(URL, None, JournalState.EXTRACTED)
+        assert not journal.record(URL, None, JournalState.DOWNLOADED)
+        assert journal.state(URL) is JournalState.DOWNLOADED
+        assert journal.record(URL, None, JournalState.VERIFIED)
+        assert journal.is_finished(URL)
+
+
+def test_queued_and_failed_are_always_recorded(journal_path):
+    with RunJournal(journal_path).open() as journal:
+        journal.record(URL, None, JournalState.VERIFIED)
+        # A new attempt
+        assert journal.record(URL, None, JournalState.QUEUED)
+        assert journal.record(URL, None, JournalState.EXTRACTED)
+        assert journal.record(URL, None, JournalState.FAILED, error="boom")
+        # Retried after the failure
+        assert journal.record(URL, None, JournalState.EXTRACTED)
+        assert journal.unfinished() == {(None, URL): JournalState.EXTRACTED}
+
+
+def test_states_are_kept_per_playlist(journal_path):
+    with RunJournal(journal_path).open() as journal:
+        journal.record(URL, None, JournalState.VERIFIED)
+        journal.record(URL, "PL1", JournalState.QUEUED)
+        assert journal.is_finished(URL)
+        assert not journal.is_finished(URL, "PL1")
+
+
+def test_resume_replays_states_and_playlists(journal_path):
+    playlist = ExpandedPlaylist(playlist_id="PL1", url="https://www.youtube.com/playlist?list=PL1", title="Mix",
+                                entries=[PlaylistEntry("dQw4w9WgXcQ", URL, "Title", 212.0)])
+    with RunJournal(journal_path).open() as journal:
+        journal.record(URL, "PL1", JournalState.VERIFIED, filepath="/tmp/a.mp4")
+        journal.record(OTHER_URL, None, JournalState.DOWNLOADED)
+        journal.record_playlist(playlist)
+
+    with RunJournal(journal_path).open(resume=True) as journal:
+        assert journal.is_finished(URL, "PL1")
+        assert journal.unfinished() == {(None, OTHER_URL): JournalState.DOWNLOADED}
+        assert journal.playlist(playlist.url) == playlist
+
+
+def test_new_run_starts_an_empty_journal(journal_path):
+    with RunJournal(journal_path).open() as journal:
+        journal.record(URL, None, JournalState.VERIFIED)
+    with RunJournal(journal_path).open(resume=False) as journal:
+        assert journal.state(URL) is None
+    with RunJournal(journal_path).open(resume=True) as journal:
+        assert journal.state(URL) is None
+
+
+def test_torn_last_line_is_skipped(journal_path):
+    with RunJournal(journal_path).open() as journal:
+        journal.record(URL, None, JournalState.VERIFIED)
+    with open(journal_path, "a", encoding="utf-8") as f:
+        # Killed while writing a line
+        f.write('{"t": 1.0, "url": "' + OTHER_URL + '", "sta')
+
+    with RunJournal(journal_path).open(resume=True) as journal:
+        assert journal.is_finished(URL)
+        assert journal.state(OTHER_URL) is None
+        journal.record(OTHER_URL, None, JournalState.QUEUED)
+
+    # The record after the torn line starts on its own line and is replayed
+    with open(journal_path, encoding="utf-8") as f:
+        lines = f.read().splitlines()
+    assert json.loads(lines[-1])["url"] == OTHER_URL
+    with RunJournal(journal_path).open(resume=True) as journal:
+        assert journal.state(OTHER_URL) is JournalState.QUEUED
+
+
+def test_path_for_run_depends_on_the_urls_file_output_dir_and_profile(tmp_path):
+    path = RunJournal.path_for_run("urls.txt", "out", journal_dir=str(tmp_path))
+    assert path == RunJournal.path_for_run("urls.txt", "out", journal_dir=str(tmp_path))
+    assert path != RunJournal.path_for_run("urls.txt", "other", journal_dir=str(tmp_path))
+    assert path != RunJournal.path_for_run("urls.txt", "out", journal_dir=str(tmp_path), profile="mp3")
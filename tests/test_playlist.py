@@ -0,0 +1,82 @@
+import contextlib
+
+import pytest
+import requests
+
+from youtube_downloader.cache import VideoTitleCache
+from youtube_downloader.governor import RequestGovernor
+from youtube_downloader.playlist import PlaylistExpander
+
+PLAYLIST_URL = "https://www.youtube.com/playlist?list=PL1"
+
+
+class FakeYoutubeDL:
+    def __init__(self, info):
+        self.info = info
+        self.extracted = []
+
+    def extract_info(self, url, download=True):
+        self.extracted.append(url)
+        if isinstance(self.info, Exception):
+            info, self.info = self.info, listing()
+            raise info
+        return self.info
+
+
+class FakePool:
+    def __init__(self, info):
+        self.ydl = FakeYoutubeDL(info)
+
+    @contextlib.contextmanager
+    def session(self):
+        yield self.ydl
+
+
+@pytest.fixture
+def cache(tmp_path):
+    with VideoTitleCache(file_path=str(tmp_path / "titles.sqlite3"), legacy_shelf_path=None) as cache:
+        yield cache
+
+
+def listing(*entries):
+    return {"id": "PL1", "title": "Mix", "entries": list(entries)}
+
+
+def test_expand_lists_entries_once(cache):
+    pool = FakePool(listing({"id": "dQw4w9WgXcQ", "url": "dQw4w9WgXcQ", "title": "Song", "duration": 212},
+                            None,
+                            {"id": "x", "url": "https://example.com/x", "title": "Other", "duration": 5}))
+    expander = PlaylistExpander(pool, cache=cache)
+    playlist = expander.expand(PLAYLIST_URL)
+    assert expander.expand(PLAYLIST_URL) is playlist
+    assert pool.ydl.extracted == [PLAYLIST_URL]
+    assert [e.url for e in playlist.entries] == ["https://www.youtube.com/watch?v=dQw4w9WgXcQ",
+                                                "https://example.com/x"]
+    assert playlist.extra_info(2)["playlist_index"] == 2
+    assert cache.get("https://youtu.be/dQw4w9WgXcQ") == "Song"
+    assert cache.get(PLAYLIST_URL) == "Mix"
+
+
+def test_placeholder_titles_are_not_cached(cache):
+    pool = FakePool(listing(
+        {"id": "aaaaaaaaaaa", "url": "aaaaaaaaaaa", "title": "[Private video]", "duration": None},
+        {"id": "bbbbbbbbbbb", "url": "bbbbbbbbbbb", "title": "[Deleted video]", "duration": None},
+        {"id": "ccccccccccc", "url": "ccccccccccc", "title": "Listed without a duration", "duration": None},
+        {"id": "ddddddddddd", "url": "ddddddddddd", "title": "Song", "duration": 212},
+    ))
+    PlaylistExpander(pool, cache=cache).expand(PLAYLIST_URL)
+    for video_id in ("aaaaaaaaaaa", "bbbbbbbbbbb", "ccccccccccc"):
+        assert cache.get(f"https://www.youtube.com/watch?v={video_id}") is None
+    assert cache.get("https://www.youtube.com/watch?v=ddddddddddd") == "Song"
+
+
+def test_listings_go_through_the_governor(cache):
+    response = requests.Response()
+    response.status_code = 429
+    response.headers["Retry-After"] = "0"
+    pool = FakePool(requests.HTTPError("429 Client Error", response=response))
+    governor = RequestGovernor(requests_per_second=1000.0, throttle_retries=1)
+    playlist = PlaylistExpander(pool, cache=cache, governor=governor).expand(PLAYLIST_URL)
+    assert pool.ydl.extracted == [PLAYLIST_URL, PLAYLIST_URL]
+    assert playlist.playlist_id == "PL1"
+    assert "youtube.com: 1 throttled" in governor.summary()
@@ -0,0 +1,81 @@
+import io
+
+import pytest
+
+from youtube_downloader.progress import EventKind, METRIC_PREFIX, ProgressMetrics, ProgressReporter, percentile
+
+JOB = "/out/video.mp4"
+
+
+@pytest.mark.parametrize("q, expected", [
+    (0.0, 1.0),
+    (0.25, 1.0),
+    (0.5, 2.0),
+    (0.51, 3.0),
+    (0.9, 4.0),
+    (1.0, 4.0),
+])
+def test_percentile_is_the_nearest_rank(q, expected):
+    assert percentile([4.0, 2.0, 1.0, 3.0], q) == expected
+
+
+def test_percentile_of_no_values():
+    assert percentile([], 0.5) is None
+
+
+def test_apply_aggregates_download_events():
+    metrics = ProgressMetrics()
+    metrics.apply((EventKind.DOWNLOADING, JOB, 1.0, (512, 1024, 256.0, 2)))
+    assert metrics.jobs[JOB].percent == 50.0
+    assert metrics.current_speed == 256.0
+    metrics.apply((EventKind.DOWNLOAD_FINISHED, JOB, 2.0, (1024, 4.0)))
+    metrics.apply((EventKind.DOWNLOAD_ERROR, "/out/other.mp4", 3.0, None))
+    metrics.apply((EventKind.STAGE, "worker-1", 3.0, ("verify", 0.5)))
+    assert metrics.jobs == {}
+    assert (metrics.downloaded_bytes, metrics.downloads_finished, metrics.download_errors) == (1024, 1, 1)
+    assert metrics.download_speeds == [256.0]
+    assert metrics.stage_seconds == {"verify": [0.5]}
+
+
+def test_to_prometheus():
+    metrics = ProgressMetrics()
+    metrics.apply((EventKind.DOWNLOAD_FINISHED, JOB, 1.0, (2048, 2.0)))
+    metrics.apply((EventKind.STAGE, "worker-1", 1.0, ("encode", 1.5)))
+    metrics.set_queue_depth("transcode", 3)
+    metrics.set_queue_depth("transcode", 1)
+    lines = metrics.to_prometheus().splitlines()
+    p = METRIC_PREFIX
+    assert f"{p}_downloaded_bytes_total 2048" in lines
+    assert f"{p}_downloads_finished_total 1" in lines
+    assert f'{p}_download_bytes_per_second{{quantile="0.5"}} 1024.0' in lines
+    assert f"{p}_download_bytes_per_second_count 1" in lines
+    assert f'{p}_queue_depth_max{{queue="transcode"}} 3' in lines
+    assert f'{p}_stage_seconds{{stage="encode",quantile="0.99"}} 1.5' in lines
+    assert f'{p}_stage_seconds_count{{stage="encode"}} 1' in lines
+
+
+def test_to_prometheus_leaves_out_quantiles_without_downloads():
+    assert "quantile" not in ProgressMetrics().to_prometheus()
+
+
+def test_messages_are_printed_in_order_and_nothing_after_close():
+    stream = io.StringIO()
+    progress = ProgressReporter(refresh_interval=60.0, stream=stream)
+    progress.message("first")
+    progress.emit(EventKind.DOWNLOADING, (1, 2, 1.0, 1), job=JOB)
+    progress.message("second")
+    progress.close()
+    assert stream.getvalue() == "first\nsecond\n"
+    assert progress.metrics.jobs[JOB].downloaded_bytes == 1
+
+    progress.message("after close")
+    progress.emit(EventKind.DOWNLOADING, (2, 2, 1.0, 0), job=JOB)
+    assert stream.getvalue() == "first\nsecond\n"
+    assert progress.metrics.jobs[JOB].downloaded_bytes == 1
+
+
+def test_status_lines_are_printed_when_they_change():
+    stream = io.StringIO()
+    with ProgressReporter(refresh_interval=0.0, stream=stream) as progress:
+        progress.emit(EventKind.DOWNLOADING, (1, 2, None, None), job=JOB)
+    assert f"50.0%  {JOB}" in stream.getvalue()
@@ -0,0 +1,99 @@
+import time
+from typing import Dict, Iterable, Iterator, List
+
+import pytest
+
+from youtube_downloader.cache import CacheEntry, VideoTitleCache
+from youtube_downloader.constants import TitleProvider
+from youtube_downloader.service import TitleService
+
+VIDEO_URL = "https://www.youtube.com/watch?v=dQw4w9WgXcQ"
+PAGE_URL = "https://example.com/page"
+_DAY_SECONDS = 24 * 60 * 60
+
+
+class StubTitleService(TitleService):
+    def __init__(self, cache: VideoTitleCache, titles: Dict[str, object], **kwargs):
+        super().__init__(cache, {}, **kwargs)
+        self.fetched: List[str] = []
+        self._titles = titles
+        self._title_provider = self._fetch
+
+    def _fetch(self, url: str):
+        self.fetched.append(url)
+        title = self._titles.get(url)
+        if isinstance(title, Exception):
+            raise title
+        return title
+
+
+@pytest.fixture
+def cache(tmp_path):
+    with VideoTitleCache(file_path=str(tmp_path / "titles.sqlite3"), legacy_shelf_path=None) as cache:
+        yield cache
+
+
+def store(cache: VideoTitleCache, url: str, title: str, provider: TitleProvider, age: float) -> None:
+    cache.put_entries({url: CacheEntry(title=title, provider=provider.value, fetched_at=time.time() - age)})
+
+
+def test_titles_are_fetched_again_after_the_ttl_of_their_provider(cache):
+    store(cache, VIDEO_URL, "Fresh", TitleProvider.YT_DLP, age=10 * _DAY_SECONDS)
+    store(cache, PAGE_URL, "Stale", TitleProvider.BEAUTIFULSOUP, age=10 * _DAY_SECONDS)
+    with StubTitleService(cache, {PAGE_URL: "Refreshed"}) as service:
+        assert service.fetch_titles([VIDEO_URL, PAGE_URL]) == {VIDEO_URL: "Fresh", PAGE_URL: "Refreshed"}
+    assert service.fetched == [PAGE_URL]
+
+
+def test_refresh_older_than_overrides_longer_ttls(cache):
+    store(cache, VIDEO_URL, "Old", TitleProvider.YT_DLP, age=2 * _DAY_SECONDS)
+    with StubTitleService(cache, {VIDEO_URL: "New"}, refresh_older_than=_DAY_SECONDS) as service:
+        assert service.fetch_titles([VIDEO_URL]) == {VIDEO_URL: "New"}
+    assert cache.get(VIDEO_URL) == "New"
+
+
+def test_expired_title_is_kept_if_fetching_it_again_fails(cache):
+    store(cache, VIDEO_URL, "Old", TitleProvider.YT_DLP, age=40 * _DAY_SECONDS)
+    with StubTitleService(cache, {VIDEO_URL: TimeoutError("timed out")}) as service:
+        assert service.fetch_titles([VIDEO_URL]) == {VIDEO_URL: "Old"}
+    assert cache.get_failure(VIDEO_URL).error_class == "timeout"
+
+
+def test_titles_without_a_ttl_never_expire(cache):
+    store(cache, VIDEO_URL, "Forever", TitleProvider.YT_DLP, age=400 * _DAY_SECONDS)
+    with StubTitleService(cache, {}, ttls={TitleProvider.YT_DLP: None}) as service:
+        assert service.fetch_titles([VIDEO_URL]) == {VIDEO_URL: "Forever"}
+    assert service.fetched == []
+
+
+def test_iter_titles_reads_the_input_batch_by_batch(cache):
+    read: List[str] = []
+
+    def urls(count: int) -> Iterator[str]:
+        for i in range(count):
+            read.append(f"https://example.com/{i}")
+            yield f"https://example.com/{i}"
+
+    titles = {f"https://example.com/{i}": f"Page {i}" for i in range(5)}
+    with StubTitleService(cache, titles, batch_size=2, workers=2) as service:
+        results = service.iter_titles(urls(5))
+        assert next(results) == ("https://example.com/0", "Page 0")
+        assert len(read) == 2
+        # Titles of the batch are cached before the next batch is read
+        assert cache.get("https://example.com/1") == "Page 1"
+        assert next(results) == ("https://example.com/1", "Page 1")
+        assert [url for url, _ in results] == [f"https://example.com/{i}" for i in range(2, 5)]
+    assert len(read) == 5
+
+
+def test_iter_titles_skips_other_forms_of_urls_seen_in_earlier_batches(cache):
+    urls: Iterable[str] = [VIDEO_URL, PAGE_URL, "https://youtu.be/dQw4w9WgXcQ", "https://EXAMPLE.com/page"]
+    with StubTitleService(cache, {VIDEO_URL: "Video", PAGE_URL: "Page"}, batch_size=1) as service:
+        assert list(service.iter_titles(urls)) == [(VIDEO_URL, "Video"), (PAGE_URL, "Page")]
+    assert service.fetched == [VIDEO_URL, PAGE_URL]
+
+
+def test_urls_without_a_title_are_yielded_as_none(cache):
+    with StubTitleService(cache, {PAGE_URL: ValueError("Video unavailable")}) as service:
+        assert list(service.iter_titles([PAGE_URL])) == [(PAGE_URL, None)]
+        assert service.fetch_titles([PAGE_URL]) == {}
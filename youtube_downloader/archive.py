@@ -0,0 +1,176 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, Optional, Tuple
+
+from youtube_downloader.canonical import UrlCanonicalizer
+from youtube_downloader.constants import FilePath
+
+LOG = logging.getLogger(__name__)
+BUSY_TIMEOUT_SECONDS = 30
+# (extractor, video id), extractor is the lowercase yt-dlp extractor key, e.g. 'youtube'
+ArchiveKey = Tuple[str, str]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS downloads (
+    extractor TEXT NOT NULL,
+    video_id TEXT NOT NULL,
+    output_path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    verified INTEGER NOT NULL,
+    recorded_at REAL NOT NULL,
+    PRIMARY KEY (extractor, video_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS urls (
+    url TEXT PRIMARY KEY,
+    extractor TEXT NOT NULL,
+    video_id TEXT NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+@dataclass
+class ArchiveEntry:
+    extractor: str
+    video_id: str
+    output_path: str
+    # File size in bytes when the entry was recorded
+    size: int
+    # False for files imported from an existing output tree, without ffprobe verification
+    verified: bool
+    recorded_at: float
+
+    @property
+    def key(self) -> ArchiveKey:
+        return self.extractor, self.video_id
+
+    def file_present(self) -> bool:
+        """
+        True if the output file is still there with the recorded size. Only a stat call, no probing.
+        """
+        try:
+            return os.path.getsize(self.output_path) == self.size
+        except OSError:
+            return False
+
+
+class DownloadArchive:
+    """
+    Persistent index of downloaded videos, keyed by extractor and video id.
+
+    Checked before a URL is handed to yt-dlp, so already downloaded videos are skipped without any network call.
+    YouTube video ids are read from the URL itself, other URLs are found by the URL they were downloaded from.
+    """
+    def __init__(self, file_path: str = FilePath.DOWNLOAD_ARCHIVE_DB_FILE):
+        self._file_path = file_path
+        self._lock = threading.Lock()
+        # The connection is shared by download workers, access is serialized by self._lock
+        self._conn = sqlite3.connect(file_path, timeout=BUSY_TIMEOUT_SECONDS, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @staticmethod
+    def key_from_url(url: str) -> Optional[ArchiveKey]:
+        """
+        Archive key of a URL without any network call, None if the video id can't be told from the URL.
+        """
+        canonical = UrlCanonicalizer.canonicalize(url)
+        if canonical and canonical.is_video:
+            return canonical.extractor, canonical.id
+        return None
+
+    @staticmethod
+    def key_from_info(info: Dict) -> Optional[ArchiveKey]:
+        """
+        Archive key of a yt-dlp info dict, the same one yt-dlp builds for its download archive.
+        """
+        extractor = info.get("extractor_key") or info.get("ie_key")
+        video_id = info.get("id")
+        if not extractor or not video_id:
+            return None
+        return extractor.lower(), video_id
+
+    def get(self, key: ArchiveKey) -> Optional[ArchiveEntry]:
+        with self._lock:
+            row = self._conn.execute("SELECT extractor, video_id, output_path, size, verified, recorded_at "
+                                     "FROM downloads WHERE extractor = ? AND video_id = ?", key).fetchone()
+        return ArchiveEntry(*row[:4], bool(row[4]), row[5]) if row else None
+
+    def lookup_url(self, url: str) -> Optional[ArchiveEntry]:
+        """
+        :return: The archive entry of the URL if it was downloaded and its file is still present
+        """
+        key = self.key_from_url(url)
+        if not key:
+            with self._lock:
+                key = self._conn.execute("SELECT extractor, video_id FROM urls WHERE url = ?", (url,)).fetchone()
+            if not key:
+                return None
+        entry = self.get(key)
+        if entry and entry.file_present():
+            return entry
+        return None
+
+    def record(self, key: ArchiveKey, output_path: str, verified: bool = True, url: Optional[str] = None) -> None:
+        """
+        :param url: URL the video was downloaded from, so it's found by lookup_url() even if the id is not in the URL
+        """
+        output_path = os.path.abspath(output_path)
+        entry = ArchiveEntry(*key, output_path=output_path, size=os.path.getsize(output_path),
+                             verified=verified, recorded_at=time.time())
+        self.record_entries([entry], {url: key} if url else None)
+
+    def record_entries(self, entries: Iterable[ArchiveEntry], urls: Optional[Dict[str, ArchiveKey]] = None) -> int:
+        rows = [(e.extractor, e.video_id, e.output_path, e.size, int(e.verified), e.recorded_at) for e in entries]
+        url_rows = [(url, *key) for url, key in (urls or {}).items()]
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO downloads "
+                                   "(extractor, video_id, output_path, size, verified, recorded_at) "
+                                   "VALUES (?, ?, ?, ?, ?, ?)", rows)
+            self._conn.executemany("INSERT OR REPLACE INTO urls (url, extractor, video_id) VALUES (?, ?, ?)", url_rows)
+        return len(rows)
+
+    def import_existing(self, output_dir: str, keys_by_filename: Dict[str, ArchiveKey],
+                        extensions: Tuple[str, ...] = (".mp4",)) -> int:
+        """
+        Records files of an existing output tree that were downloaded before the archive existed.
+        Files are matched by their name without extension, imported entries are not verified.
+        Videos that are already archived are left as they are.
+        :param keys_by_filename: Archive keys by file name without extension, as yt-dlp names the files
+        :return: Number of imported files
+        """
+        now = time.time()
+        entries = []
+        unmatched = 0
+        for dirpath, _, filenames in os.walk(output_dir):
+            for filename in filenames:
+                stem, ext = os.path.splitext(filename)
+                if ext.lower() not in extensions:
+                    continue
+                key = keys_by_filename.get(stem)
+                if not key:
+                    unmatched += 1
+                    continue
+                if self.get(key):
+                    continue
+                path = os.path.abspath(os.path.join(dirpath, filename))
+                entries.append(ArchiveEntry(*key, output_path=path, size=os.path.getsize(path),
+                                            verified=False, recorded_at=now))
+        imported = self.record_entries(entries)
+        LOG.info("Imported %d files from %s into the download archive, %d files did not match a known title",
+                 imported, output_dir, unmatched)
+        return imported
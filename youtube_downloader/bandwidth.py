@@ -0,0 +1,264 @@
+import contextlib
+import logging
+import math
+import re
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, FrozenSet, Iterator, List, Optional, Sequence, Tuple
+
+from yt_dlp.utils import parse_bytes
+
+from youtube_downloader.progress import format_speed
+
+LOG = logging.getLogger(__name__)
+
+# Seconds between rebalances triggered by progress updates, jobs starting or finishing always rebalance
+DEFAULT_REBALANCE_INTERVAL = 1.0
+# A download running at this fraction of its rate limit is held back by it, it may get a bigger share
+LIMITED_FRACTION = 0.9
+# Rate limit over the measured speed of downloads that don't use their share, so they can speed up
+DEMAND_HEADROOM = 1.25
+# Rate of running downloads while a window pauses downloads: yt-dlp can't pause and 0 is no valid rate limit
+PAUSED_RATE = 1024
+# Downloads waiting for a paused window to end check the schedule again after at most this many seconds
+PAUSE_POLL_SECONDS = 30.0
+_DAYS = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+_WINDOW_RE = re.compile(r"\s*(?:(?P<days>[a-z,-]+)\s+)?(?P<start>\d{1,2}:\d{2})-(?P<end>\d{1,2}:\d{2})=(?P<rate>\S+)\s*")
+
+
+def parse_rate(value: str) -> float:
+    """
+    Parses rates like '500K', '4M' or '4M/s' to bytes / second, units are powers of 1024 like in yt-dlp's --limit-rate
+    """
+    rate = parse_bytes(value.strip().removesuffix("/s")) if value.strip() else None
+    if rate is None:
+        raise ValueError(f"Invalid rate: '{value}', expected bytes / second with an optional unit (K, M, G)")
+    return float(rate)
+
+
+def fair_shares(budget: float, demands: Sequence[Optional[float]]) -> List[float]:
+    """
+    Max-min fair split of the budget: downloads that need less than an equal share get what they need,
+    the rest is split equally among the others. Left over budget is split equally among all downloads.
+    :param demands: Rate each download needs, None if it could use any share
+    """
+    shares = [0.0] * len(demands)
+    remaining = budget
+    order = sorted(range(len(demands)), key=lambda i: math.inf if demands[i] is None else demands[i])
+    for n, i in enumerate(order):
+        share = remaining / (len(order) - n)
+        if demands[i] is not None:
+            share = min(share, demands[i])
+        shares[i] = share
+        remaining -= share
+    if shares and remaining > 0:
+        shares = [share + remaining / len(shares) for share in shares]
+    return shares
+
+
+def _parse_minutes(value: str) -> int:
+    hours, minutes = value.split(":")
+    if int(hours) > 24 or int(minutes) > 59 or int(hours) * 60 + int(minutes) > 24 * 60:
+        raise ValueError(f"Invalid time of day: '{value}'")
+    return int(hours) * 60 + int(minutes)
+
+
+def _parse_days(value: str) -> FrozenSet[int]:
+    days = set()
+    for part in value.split(","):
+        first, _, last = part.partition("-")
+        if first not in _DAYS or (last and last not in _DAYS):
+            raise ValueError(f"Invalid days: '{value}', expected e.g. mon-fri or sat,sun")
+        start = _DAYS.index(first)
+        end = _DAYS.index(last) if last else start
+        # mon-fri, or fri-mon across the end of the week
+        days.update(day % 7 for day in range(start, end + 1 if end >= start else end + 8))
+    return frozenset(days)
+
+
+@dataclass(frozen=True)
+class BandwidthWindow:
+    """
+    Bandwidth budget for a time of day, e.g. 'mon-fri 09:00-17:00=0' (no downloads during business hours)
+    or '01:00-07:00=20M'. Windows that end before they start last over midnight, the days are those it starts on.
+    """
+    text: str
+    # Minutes since midnight
+    start: int
+    end: int
+    # Bytes / second, 0 pauses downloads
+    rate: float
+    # Weekdays the window starts on, 0 is Monday, empty means every day
+    days: FrozenSet[int] = frozenset()
+
+    @staticmethod
+    def parse(value: str) -> 'BandwidthWindow':
+        m = _WINDOW_RE.fullmatch(value.lower())
+        if not m:
+            raise ValueError(f"Invalid bandwidth window: '{value}', expected [DAYS ]HH:MM-HH:MM=RATE, "
+                             "e.g. 'mon-fri 09:00-17:00=0' or '01:00-07:00=20M'")
+        return BandwidthWindow(text=value.strip(),
+                               start=_parse_minutes(m.group("start")),
+                               end=_parse_minutes(m.group("end")),
+                               rate=0.0 if m.group("rate") == "0" else parse_rate(m.group("rate")),
+                               days=_parse_days(m.group("days")) if m.group("days") else frozenset())
+
+    def contains(self, now: datetime) -> bool:
+        minute = now.hour * 60 + now.minute
+        weekday = now.weekday()
+        if self.start < self.end:
+            return self.start <= minute < self.end and self._on(weekday)
+        if self.start == self.end:
+            return self._on(weekday)
+        # Over midnight: the part after midnight belongs to the previous day
+        return (minute >= self.start and self._on(weekday)) or (minute < self.end and self._on((weekday - 1) % 7))
+
+    def _on(self, weekday: int) -> bool:
+        return not self.days or weekday in self.days
+
+    def __str__(self):
+        return self.text
+
+
+class _Job:
+    __slots__ = ("params", "saved", "speed", "limit")
+
+    def __init__(self, params: Dict[str, Any]):
+        # Options of the YoutubeDL instance of the download, its rate limit is read for every downloaded block
+        self.params = params
+        self.saved = {key: params[key] for key in ("ratelimit", "concurrent_fragment_downloads") if key in params}
+        self.speed: Optional[float] = None
+        self.limit: Optional[float] = None
+
+    def restore(self) -> None:
+        for key in ("ratelimit", "concurrent_fragment_downloads"):
+            if key in self.saved:
+                self.params[key] = self.saved[key]
+            else:
+                self.params.pop(key, None)
+
+
+class BandwidthManager:
+    """
+    Shares a bytes / second budget among the running downloads of a process.
+    The budget is max_bandwidth, or the rate of the first schedule window that contains the current time.
+    Each download gets a max-min fair share as the 'ratelimit' option of its YoutubeDL instance, which yt-dlp reads
+    for every downloaded block, so the shares follow downloads starting and finishing and their measured speeds.
+    Fragmented (HLS / DASH fragment) downloads copy the options when they start: with a budget they download
+    one fragment at a time, otherwise the concurrent fragment downloads are split among the running downloads.
+    """
+    def __init__(self, max_bandwidth: Optional[float] = None,
+                 schedule: Sequence[BandwidthWindow] = (),
+                 max_fragments: int = 1,
+                 rebalance_interval: float = DEFAULT_REBALANCE_INTERVAL):
+        """
+        :param max_bandwidth: Budget outside of the schedule windows in bytes / second, None means unlimited
+        :param max_fragments: Concurrent fragment downloads of all running downloads together, without a budget
+        """
+        self._max_bandwidth = max_bandwidth
+        self._schedule = list(schedule)
+        self._max_fragments = max_fragments
+        self._rebalance_interval = rebalance_interval
+        self._jobs: List[_Job] = []
+        self._waiting = 0
+        self._rebalanced_at = 0.0
+        self._local = threading.local()
+        self._cond = threading.Condition()
+
+    def budget(self, now: Optional[datetime] = None) -> Tuple[Optional[float], Optional[BandwidthWindow]]:
+        """
+        :return: Current budget in bytes / second (None if unlimited, 0 if paused) and the window it comes from
+        """
+        now = now or datetime.now()
+        for window in self._schedule:
+            if window.contains(now):
+                return window.rate, window
+        return self._max_bandwidth, None
+
+    def wait_for_window(self) -> None:
+        """
+        Blocks while a schedule window pauses downloads
+        """
+        rate, window = self.budget()
+        if rate != 0:
+            return
+        LOG.info("Downloads are paused by the bandwidth window '%s', waiting for it to end", window)
+        with self._cond:
+            self._waiting += 1
+            try:
+                while self.budget()[0] == 0:
+                    self._cond.wait(PAUSE_POLL_SECONDS)
+            finally:
+                self._waiting -= 1
+
+    @contextlib.contextmanager
+    def job(self, params: Dict[str, Any]) -> Iterator[None]:
+        """
+        Registers a download running with a YoutubeDL instance that has these options, in the calling thread
+        """
+        job = _Job(params)
+        with self._cond:
+            self._jobs.append(job)
+            self._rebalance()
+        self._local.job = job
+        try:
+            yield
+        finally:
+            self._local.job = None
+            with self._cond:
+                self._jobs.remove(job)
+                job.restore()
+                self._rebalance()
+
+    def progress_hook(self, status: Dict[str, Any]) -> None:
+        """
+        yt-dlp progress hook measuring the speed of the download of the calling thread.
+        Fragment downloads report from their own threads, they are not measured.
+        """
+        job = getattr(self._local, "job", None)
+        if job is None or status.get("status") != "downloading":
+            return
+        job.speed = status.get("speed")
+        if time.monotonic() - self._rebalanced_at >= self._rebalance_interval:
+            with self._cond:
+                self._rebalance()
+
+    def _rebalance(self) -> None:
+        self._rebalanced_at = time.monotonic()
+        if not self._jobs:
+            return
+        budget, _ = self.budget()
+        if budget is None:
+            fragments = max(1, self._max_fragments // len(self._jobs))
+            for job in self._jobs:
+                job.limit = None
+                job.params["ratelimit"] = job.saved.get("ratelimit")
+                job.params["concurrent_fragment_downloads"] = fragments
+            return
+        demands = [None if job.speed is None or job.limit is None or job.speed >= LIMITED_FRACTION * job.limit
+                   else job.speed * DEMAND_HEADROOM for job in self._jobs]
+        shares = fair_shares(budget, demands) if budget else [PAUSED_RATE] * len(self._jobs)
+        for job, share in zip(self._jobs, shares):
+            job.limit = max(PAUSED_RATE, share)
+            job.params["ratelimit"] = int(job.limit)
+            # Every fragment thread is limited to the rate on its own
+            job.params["concurrent_fragment_downloads"] = 1
+
+    def status(self) -> str:
+        """
+        Budget and rate limits of the running downloads, empty if the bandwidth is not limited
+        """
+        budget, window = self.budget()
+        if budget is None:
+            return ""
+        source = f" (window {window})" if window else ""
+        with self._cond:
+            limits = [job.limit for job in self._jobs if job.limit is not None]
+            waiting = self._waiting
+        if budget == 0:
+            return f"Paused{source}, {len(limits)} running at {format_speed(PAUSED_RATE)}, {waiting} waiting"
+        return (f"Budget {format_speed(budget)}{source}, "
+                + (f"{len(limits)} downloads limited to {' / '.join(format_speed(limit) for limit in limits)}"
+                   if limits else "no downloads running"))
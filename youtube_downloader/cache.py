@@ -1,67 +1,519 @@
-import pickle
+import dbm
+import logging
+import re
 import shelve
-from pathlib import Path
-from typing import Dict, Optional
+import sqlite3
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, astuple, replace
+from typing import Dict, List, Optional, Set, Tuple
+from urllib.parse import urlsplit, urlunsplit
 
+from youtube_downloader.canonical import UrlCanonicalizer
 from youtube_downloader.constants import FilePath
 
+LOG = logging.getLogger(__name__)
+DEFAULT_BATCH_SIZE = 500
+BUSY_TIMEOUT_SECONDS = 30
+META_MIGRATED_FROM_SHELF = "migrated_from_shelf"
+META_CANONICAL_URLS = "canonical_urls"
+DEFAULT_HOT_CACHE_SIZE = 10000
+# Hot tier hits are recorded without locking, so their access times are only kept up to this many hits per flush
+MAX_UNFLUSHED_HOT_ACCESSES = 100000
+_WHITESPACE_RE = re.compile(r'[\n\t\r]+')
+_MULTIPLE_SPACES_RE = re.compile(r' {2,}')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS titles (
+    url TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    video_id TEXT,
+    duration REAL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS failures (
+    url TEXT PRIMARY KEY,
+    error_class TEXT NOT NULL,
+    message TEXT,
+    attempts INTEGER NOT NULL,
+    failed_at REAL NOT NULL,
+    retry_after REAL NOT NULL
+) WITHOUT ROWID;
+"""
+# Columns added after the first version of the schema: name -> type
+_ADDED_COLUMNS = {
+    "provider": "TEXT",
+    "fetched_at": "REAL",
+    "last_accessed": "REAL",
+    "size": "INTEGER",
+}
+_ENTRY_COLUMNS = "title, video_id, duration, provider, fetched_at"
+
+
+@dataclass
+class CacheEntry:
+    title: str
+    video_id: Optional[str] = None
+    duration: Optional[float] = None
+    # Title provider that fetched the title, e.g. TitleProvider.YT_DLP.value
+    provider: Optional[str] = None
+    # Unix timestamp, set by the cache when the entry is stored without one
+    fetched_at: Optional[float] = None
+
+    def age(self, now: Optional[float] = None) -> float:
+        if self.fetched_at is None:
+            return 0.0
+        return (now if now is not None else time.time()) - self.fetched_at
+
+    @property
+    def size(self) -> int:
+        # Approximate number of bytes an entry takes, used for the max_bytes limit
+        return len(self.title.encode("utf-8"))
+
+
+@dataclass
+class FailureEntry:
+    """
+    Negative cache entry: the title of the URL could not be fetched.
+    """
+    # FetchErrorClass value
+    error_class: str
+    message: Optional[str]
+    # Number of failed attempts in a row
+    attempts: int
+    failed_at: float
+    # Unix timestamp, the title should not be fetched again before this
+    retry_after: float
+
+    def should_retry(self, now: Optional[float] = None) -> bool:
+        return (now if now is not None else time.time()) >= self.retry_after
+
+
+def normalize_title(title: str) -> str:
+    """
+    Replaces newlines and tabs with a space and collapses runs of spaces.
+    The cache stores titles normalized, so readers can use them as is.
+    """
+    title = _WHITESPACE_RE.sub(' ', title)
+    # Replace only two or more consecutive spaces with a single space
+    return _MULTIPLE_SPACES_RE.sub(' ', title)
+
+
+def normalize_url(url: str) -> str:
+    """
+    Cache key of a URL: whitespace stripped, scheme and host lowercased.
+    Path and query are kept as is, video ids are case-sensitive.
+    """
+    url = url.strip()
+    parts = urlsplit(url)
+    if not parts.scheme:
+        return url
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path, parts.query, parts.fragment))
+
+
+def cache_key(url: str) -> str:
+    """
+    Cache key of a URL: the canonical URL of YouTube videos and playlists (see UrlCanonicalizer),
+    so all URL forms of the same video share one entry. normalize_url() for other URLs.
+    """
+    canonical = UrlCanonicalizer.canonicalize(url)
+    return canonical.url if canonical else normalize_url(url)
+
+
+class HotTitleCache:
+    """
+    Bounded in-process tier of the title cache, keyed by normalized URL.
+
+    Reads don't take a lock: a dict lookup plus setting a reference bit, both atomic in CPython.
+    Writes and evictions are serialized by a lock. Eviction is CLOCK style (second chance):
+    the oldest entry is evicted, unless it was read since it was last considered, then it's moved to the end.
+    Counters are updated without locking, so they are approximate when read from several threads.
+    """
+    def __init__(self, max_entries: int = DEFAULT_HOT_CACHE_SIZE):
+        if max_entries < 1:
+            raise ValueError("Hot cache size should be at least 1, got: {}".format(max_entries))
+        self._max_entries = max_entries
+        # Insertion order is the order of the clock
+        self._entries: Dict[str, CacheEntry] = {}
+        self._referenced: Set[str] = set()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._referenced.add(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key: str, entry: CacheEntry) -> None:
+        with self._lock:
+            if key not in self._entries:
+                while len(self._entries) >= self._max_entries:
+                    self._evict_one()
+            self._entries[key] = entry
+
+    def pop(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+            self._referenced.discard(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._referenced.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+    def _evict_one(self) -> None:
+        # Caller should hold self._lock. Terminates: every pass clears a reference bit.
+        while True:
+            key = next(iter(self._entries))
+            entry = self._entries.pop(key)
+            if key in self._referenced:
+                self._referenced.discard(key)
+                self._entries[key] = entry
+                continue
+            self.evictions += 1
+            return
+
 
 class VideoTitleCache:
-    def __init__(self, file_path: str = FilePath.WEBPAGE_TITLE_CACHE_FILE):
+    def __init__(self,
+                 file_path: str = FilePath.WEBPAGE_TITLE_CACHE_DB_FILE,
+                 legacy_shelf_path: Optional[str] = FilePath.WEBPAGE_TITLE_CACHE_FILE,
+                 batch_size: int = DEFAULT_BATCH_SIZE,
+                 max_entries: Optional[int] = None,
+                 max_bytes: Optional[int] = None,
+                 hot_cache_size: int = DEFAULT_HOT_CACHE_SIZE):
         """
-        Initializes the cache by opening the shelf file.
+        Initializes the cache by opening the SQLite database, creating it if it doesn't exist.
 
-        The 'shelve.open()' function automatically creates the file
-        if it doesn't exist and opens it in read/write mode.
+        The database runs in WAL mode, so other processes can read it while this one writes.
+        Writes are buffered in memory and written in a single transaction by save(),
+        or as soon as batch_size writes are pending.
+        :param legacy_shelf_path: Shelf file of the old shelve based cache. Its entries are imported once.
+        :param max_entries: If given, least recently used entries are evicted on save() above this number of entries.
+        :param max_bytes: If given, least recently used entries are evicted on save() above this size of titles.
+        :param hot_cache_size: Max number of entries kept in memory in front of the database, see HotTitleCache.
         """
-        # The shelf object acts exactly like a dictionary
-        # writeback=True ensures that changes to the cache are held in memory
-        # until close() or sync() is called.
-        self._shelf = shelve.open(file_path, writeback=True)
-        # Store the path in case we need it
         self._file_path = file_path
+        self._batch_size = batch_size
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._pending: Dict[str, CacheEntry] = {}
+        # Last access time of entries read since the last flush, written in the same transaction as the entries
+        self._accessed: Dict[str, float] = {}
+        self._pending_failures: Dict[str, FailureEntry] = {}
+        self._hot = HotTitleCache(hot_cache_size)
+        # Keys of hot tier hits, appended without locking and turned into access times on flush
+        self._hot_accessed: deque = deque(maxlen=MAX_UNFLUSHED_HOT_ACCESSES)
+        # The connection is shared by threads, access is serialized by self._lock
+        self._conn = sqlite3.connect(file_path, timeout=BUSY_TIMEOUT_SECONDS, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._add_missing_columns()
+        if legacy_shelf_path:
+            self._migrate_from_shelf(legacy_shelf_path)
+        self._collapse_duplicate_urls()
 
     # --- Cleanup and Persistence ---
 
     def save(self) -> None:
         """
-        Saves any cached changes to disk.
-        For a shelve object opened with writeback=True, sync() forces the data
-        from memory to be written to the file.
+        Writes all pending changes to disk in a single transaction, then evicts entries above the size limits.
         """
-        self._shelf.sync()
+        with self._lock:
+            self._flush()
+            self._evict()
 
     def close(self) -> None:
         """
-        Closes the shelf file, ensuring all data is persisted.
+        Saves pending changes, evicts entries above the size limits like save() and closes the database.
         This should always be called when the cache is no longer needed.
         """
-        self._shelf.close()
+        with self._lock:
+            self._flush()
+            self._evict()
+            self._conn.close()
 
     def __enter__(self):
         """Allows use with the 'with' statement."""
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        """Ensures the shelf is closed automatically when exiting a 'with' block."""
+        """Ensures the database is closed automatically when exiting a 'with' block."""
         self.close()
 
-    # Optional: Implement basic dictionary methods for better compatibility
     def __len__(self) -> int:
-        return len(self._shelf)
+        with self._lock:
+            self._flush()
+            return self._conn.execute("SELECT COUNT(*) FROM titles").fetchone()[0]
+
+    @property
+    def hot_stats(self) -> Dict[str, int]:
+        """
+        Size, hits, misses and evictions of the in-memory tier.
+        """
+        return self._hot.stats()
 
     def __contains__(self, url: str) -> bool:
-        return url in self._shelf
+        return self.get_entry(url) is not None
 
     def get(self, url: str) -> Optional[str]:
         """
-        Retrieves a title. Handled directly by the shelf object.
-        dict.get() handles the 'key not found' case, returning None.
+        Retrieves a title, None if the URL is not cached.
         """
-        return self._shelf.get(url)
+        entry = self.get_entry(url)
+        return entry.title if entry else None
 
-    def put(self, url: str, title: str) -> None:
+    def get_entry(self, url: str) -> Optional[CacheEntry]:
         """
-        Stores a title. Handled directly by the shelf object.
+        Retrieves the cached title with its metadata (video id, duration) if known.
+        Stale entries are returned too, callers decide about expiry based on the provider and age of the entry.
+        The title is normalized (see normalize_title()). Returned entries are shared, they should not be modified.
         """
-        self._shelf[url] = title
\ No newline at end of file
+        key = cache_key(url)
+        entry = self._hot.get(key)
+        if entry is not None:
+            self._hot_accessed.append(key)
+            return entry
+
+        with self._lock:
+            if key in self._pending:
+                return self._pending[key]
+            row = self._conn.execute(f"SELECT {_ENTRY_COLUMNS} FROM titles WHERE url = ?", (key,)).fetchone()
+            if not row:
+                return None
+            self._accessed[key] = time.time()
+            entry = CacheEntry(*row)
+            title = normalize_title(entry.title)
+            if title != entry.title:
+                # Stored by an older version without normalization, write it back normalized
+                entry = replace(entry, title=title)
+                self._pending[key] = entry
+            self._hot.put(key, entry)
+        return entry
+
+    def entries(self) -> List[Tuple[str, CacheEntry]]:
+        """
+        All cached (normalized URL, entry) pairs, e.g. to match downloaded files with their URL by title.
+        Doesn't count as an access of the entries.
+        """
+        with self._lock:
+            self._flush()
+            rows = self._conn.execute(f"SELECT url, {_ENTRY_COLUMNS} FROM titles").fetchall()
+        return [(row[0], CacheEntry(*row[1:])) for row in rows]
+
+    def put(self, url: str, title: str, provider: Optional[str] = None) -> str:
+        """
+        Stores a title.
+        :return: The title as stored, normalized
+        """
+        entry = CacheEntry(title=normalize_title(title), provider=provider)
+        self._put_normalized({url: entry})
+        return entry.title
+
+    def put_entries(self, entries: Dict[str, CacheEntry]) -> None:
+        """
+        Stores titles with their metadata in bulk, e.g. all entries of an expanded playlist.
+        Titles are normalized before they are stored, the given entries are not modified.
+        """
+        self._put_normalized({url: replace(entry, title=normalize_title(entry.title))
+                              for url, entry in entries.items()})
+
+    def _put_normalized(self, entries: Dict[str, CacheEntry]) -> None:
+        now = time.time()
+        with self._lock:
+            for url, entry in entries.items():
+                if entry.fetched_at is None:
+                    entry.fetched_at = now
+                key = cache_key(url)
+                self._pending[key] = entry
+                self._pending_failures.pop(key, None)
+                self._hot.put(key, entry)
+            if len(self._pending) >= self._batch_size:
+                self._flush()
+
+    def delete(self, url: str) -> None:
+        key = cache_key(url)
+        self._hot.pop(key)
+        with self._lock:
+            self._pending.pop(key, None)
+            self._pending_failures.pop(key, None)
+            with self._conn:
+                self._conn.execute("DELETE FROM titles WHERE url = ?", (key,))
+                self._conn.execute("DELETE FROM failures WHERE url = ?", (key,))
+
+    def get_failure(self, url: str) -> Optional[FailureEntry]:
+        """
+        Retrieves the last failure of fetching the title of the URL, if the last attempt failed.
+        A successful put() of the URL clears the failure.
+        """
+        key = cache_key(url)
+        with self._lock:
+            if key in self._pending_failures:
+                return self._pending_failures[key]
+            if key in self._pending:
+                return None
+            row = self._conn.execute("SELECT error_class, message, attempts, failed_at, retry_after "
+                                     "FROM failures WHERE url = ?", (key,)).fetchone()
+        return FailureEntry(*row) if row else None
+
+    def put_failure(self, url: str, failure: FailureEntry) -> None:
+        key = cache_key(url)
+        with self._lock:
+            self._pending_failures[key] = failure
+            if len(self._pending_failures) >= self._batch_size:
+                self._flush()
+
+    def _flush(self) -> None:
+        # Caller should hold self._lock
+        now = time.time()
+        while self._hot_accessed:
+            self._accessed[self._hot_accessed.popleft()] = now
+        if not self._pending and not self._accessed and not self._pending_failures:
+            return
+        rows = [(url, *astuple(entry), now, entry.size) for url, entry in self._pending.items()]
+        accessed = [(ts, url) for url, ts in self._accessed.items() if url not in self._pending]
+        failures = [(url, *astuple(failure)) for url, failure in self._pending_failures.items()]
+        with self._conn:
+            self._conn.executemany(f"INSERT OR REPLACE INTO titles (url, {_ENTRY_COLUMNS}, last_accessed, size) "
+                                   "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            self._conn.executemany("UPDATE titles SET last_accessed = ? WHERE url = ?", accessed)
+            # A title stored after a failure means the URL works again
+            self._conn.executemany("DELETE FROM failures WHERE url = ?", [(url,) for url in self._pending])
+            self._conn.executemany("INSERT OR REPLACE INTO failures "
+                                   "(url, error_class, message, attempts, failed_at, retry_after) "
+                                   "VALUES (?, ?, ?, ?, ?, ?)", failures)
+        LOG.debug("Saved %d title cache entries, %d failures", len(rows), len(failures))
+        self._pending = {}
+        self._accessed = {}
+        self._pending_failures = {}
+
+    def _evict(self) -> None:
+        # Caller should hold self._lock, pending writes should be flushed
+        evicted = 0
+        with self._conn:
+            if self._max_entries is not None:
+                evicted += self._conn.execute(
+                    "DELETE FROM titles WHERE url IN "
+                    "(SELECT url FROM titles ORDER BY last_accessed DESC LIMIT -1 OFFSET ?)",
+                    (self._max_entries,)).rowcount
+            if self._max_bytes is not None:
+                evicted += self._conn.execute(
+                    "DELETE FROM titles WHERE url IN "
+                    "(SELECT url FROM (SELECT url, SUM(size) OVER (ORDER BY last_accessed DESC, url) AS total "
+                    "FROM titles) WHERE total > ?)",
+                    (self._max_bytes,)).rowcount
+        if evicted:
+            LOG.info("Evicted %d least recently used title cache entries", evicted)
+            # Evicted keys are not known here, don't keep serving them from memory
+            self._hot.clear()
+
+    def _add_missing_columns(self) -> None:
+        """
+        Upgrades databases created with an older version of the schema.
+        Existing entries are treated as fetched and accessed now.
+        """
+        existing = {row[1] for row in self._conn.execute("PRAGMA table_info(titles)")}
+        missing = {name: type_ for name, type_ in _ADDED_COLUMNS.items() if name not in existing}
+        if missing:
+            now = time.time()
+            with self._conn:
+                for name, type_ in missing.items():
+                    self._conn.execute(f"ALTER TABLE titles ADD COLUMN {name} {type_}")
+                self._conn.execute("UPDATE titles SET fetched_at = COALESCE(fetched_at, ?), "
+                                   "last_accessed = COALESCE(last_accessed, ?), "
+                                   "size = COALESCE(size, LENGTH(CAST(title AS BLOB)))", (now, now))
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_titles_last_accessed ON titles (last_accessed)")
+
+    def _migrate_from_shelf(self, shelf_path: str) -> None:
+        """
+        One-shot import of the old shelve based cache. The shelf file is left untouched.
+        """
+        if self._get_meta(META_MIGRATED_FROM_SHELF):
+            return
+        # whichdb: None if the file does not exist, '' if it's not a known dbm format
+        if not dbm.whichdb(shelf_path):
+            return
+
+        LOG.info("Migrating title cache from shelf file: %s", shelf_path)
+        now = time.time()
+        rows = []
+        with shelve.open(shelf_path, flag="r") as shelf:
+            for url, value in shelf.items():
+                # Plain title strings or CacheEntry dicts, depending on the version that wrote the shelf
+                entry = CacheEntry(title=value) if isinstance(value, str) else CacheEntry(**value)
+                if entry.title:
+                    # The shelf did not record fetch times, treat entries as fetched now
+                    entry.fetched_at = now
+                    rows.append((cache_key(url), *astuple(entry), now, entry.size))
+        with self._lock, self._conn:
+            # Existing rows are newer than the shelf, keep them
+            self._conn.executemany(f"INSERT OR IGNORE INTO titles (url, {_ENTRY_COLUMNS}, last_accessed, size) "
+                                   "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                               (META_MIGRATED_FROM_SHELF, shelf_path))
+        LOG.info("Migrated %d title cache entries from shelf file", len(rows))
+
+    def _collapse_duplicate_urls(self) -> None:
+        """
+        One-shot migration of entries written before YouTube URLs were keyed by their canonical URL:
+        every entry is moved to its cache key. Of the entries of the same video, the most recently fetched title
+        and the most recent failure are kept.
+        """
+        if self._get_meta(META_CANONICAL_URLS):
+            return
+        with self._lock, self._conn:
+            titles = self._collapse_rows(f"SELECT url, {_ENTRY_COLUMNS}, last_accessed, size FROM titles",
+                                         newest_column=5)
+            for url_group, row in titles:
+                self._conn.executemany("DELETE FROM titles WHERE url = ?", [(url,) for url in url_group])
+                self._conn.execute(f"INSERT INTO titles (url, {_ENTRY_COLUMNS}, last_accessed, size) "
+                                   "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", row)
+            failures = self._collapse_rows("SELECT url, error_class, message, attempts, failed_at, retry_after "
+                                           "FROM failures", newest_column=4)
+            for url_group, row in failures:
+                self._conn.executemany("DELETE FROM failures WHERE url = ?", [(url,) for url in url_group])
+                self._conn.execute("INSERT INTO failures (url, error_class, message, attempts, failed_at, retry_after) "
+                                   "VALUES (?, ?, ?, ?, ?, ?)", row)
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (META_CANONICAL_URLS, "1"))
+        if titles or failures:
+            LOG.info("Collapsed title cache entries of %d videos and failures of %d videos to their canonical URL",
+                     len(titles), len(failures))
+
+    def _collapse_rows(self, query: str, newest_column: int) -> List[Tuple[List[str], tuple]]:
+        """
+        Groups the rows of the query (url first) by cache key and picks the row with the biggest newest_column value.
+        :return: (URLs of the group, winner row with the cache key as URL) for the groups that have to be rewritten
+        """
+        groups: Dict[str, List[tuple]] = {}
+        for row in self._conn.execute(query):
+            groups.setdefault(cache_key(row[0]), []).append(row)
+        result = []
+        for key, rows in groups.items():
+            if len(rows) == 1 and rows[0][0] == key:
+                continue
+            newest = max(rows, key=lambda r: r[newest_column] or 0)
+            result.append(([row[0] for row in rows], (key, *newest[1:])))
+        return result
+
+    def _get_meta(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
@@ -0,0 +1,100 @@
+import re
+from dataclasses import dataclass
+from typing import Optional
+from urllib.parse import urlsplit, parse_qs
+
+# Lowercase yt-dlp extractor keys, the same as in yt-dlp download archive ids
+YOUTUBE_EXTRACTOR = "youtube"
+YOUTUBE_PLAYLIST_EXTRACTOR = "youtubetab"
+
+_VIDEO_ID_RE = re.compile(r"[0-9A-Za-z_-]{11}")
+_PLAYLIST_ID_RE = re.compile(r"[0-9A-Za-z_-]{2,}")
+_YOUTUBE_HOSTS = {
+    "youtube.com",
+    "www.youtube.com",
+    "m.youtube.com",
+    "music.youtube.com",
+    "gaming.youtube.com",
+    "youtube-nocookie.com",
+    "www.youtube-nocookie.com",
+}
+_SHORT_HOSTS = {"youtu.be", "www.youtu.be"}
+# First path segment of URLs that have the video id as the second segment, e.g. /shorts/<id>
+_VIDEO_ID_PATH_PREFIXES = {"shorts", "embed", "live", "v", "e"}
+
+
+@dataclass(frozen=True)
+class CanonicalUrl:
+    # Lowercase yt-dlp extractor key: YOUTUBE_EXTRACTOR for videos, YOUTUBE_PLAYLIST_EXTRACTOR for playlists
+    extractor: str
+    id: str
+
+    @property
+    def is_video(self) -> bool:
+        return self.extractor == YOUTUBE_EXTRACTOR
+
+    @property
+    def key(self) -> str:
+        return f"{self.extractor}:{self.id}"
+
+    @property
+    def url(self) -> str:
+        if self.is_video:
+            return f"https://www.youtube.com/watch?v={self.id}"
+        return f"https://www.youtube.com/playlist?list={self.id}"
+
+
+class UrlCanonicalizer:
+    """
+    Maps the different URL forms of the same YouTube video or playlist to one (extractor, id) pair,
+    without any network call: youtu.be/<id>, watch?v=<id> with any extra parameters (t, si, list, index, ...),
+    /shorts/, /embed/, /live/ URLs and the mobile, music and nocookie hosts.
+    A watch URL of a playlist member is the video itself, the downloads and title fetches use yt-dlp's noplaylist
+    option to agree.
+    """
+    @staticmethod
+    def canonicalize(url: str) -> Optional[CanonicalUrl]:
+        """
+        :return: None if the URL is not a YouTube video or playlist URL
+        """
+        url = url.strip()
+        if "://" not in url:
+            url = "https://" + url
+        try:
+            parts = urlsplit(url)
+        except ValueError:
+            return None
+        host = (parts.hostname or "").lower()
+        segments = [s for s in parts.path.split("/") if s]
+
+        if host in _SHORT_HOSTS:
+            return UrlCanonicalizer._video(segments[0] if segments else None)
+        if host not in _YOUTUBE_HOSTS:
+            return None
+
+        query = parse_qs(parts.query)
+        if not segments:
+            return None
+        if segments[0] == "watch":
+            return UrlCanonicalizer._video(query.get("v", [None])[0])
+        if segments[0] in _VIDEO_ID_PATH_PREFIXES and len(segments) > 1:
+            return UrlCanonicalizer._video(segments[1])
+        if segments[0] == "playlist":
+            playlist_id = query.get("list", [None])[0]
+            if playlist_id and _PLAYLIST_ID_RE.fullmatch(playlist_id):
+                return CanonicalUrl(YOUTUBE_PLAYLIST_EXTRACTOR, playlist_id)
+        return None
+
+    @staticmethod
+    def canonical_key(url: str) -> Optional[str]:
+        """
+        'youtube:<video id>' or 'youtubetab:<playlist id>', None for other URLs
+        """
+        canonical = UrlCanonicalizer.canonicalize(url)
+        return canonical.key if canonical else None
+
+    @staticmethod
+    def _video(video_id: Optional[str]) -> Optional[CanonicalUrl]:
+        if video_id and _VIDEO_ID_RE.fullmatch(video_id):
+            return CanonicalUrl(YOUTUBE_EXTRACTOR, video_id)
+        return None
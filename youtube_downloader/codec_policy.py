@@ -0,0 +1,142 @@
+import logging
+import os
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+from youtube_downloader.ffmpeg_utils import FFmpegUtils, COPY_CODEC, MP4_EXT
+
+LOG = logging.getLogger(__name__)
+H264_ENCODER = "libx264"
+AAC_ENCODER = "aac"
+# Video codecs that are re-encoded to H.264, by prefix of the yt-dlp vcodec or the ffprobe codec_name.
+# Everything else (H.264 itself, HEVC, ...) is copied as is.
+TRANSCODED_VIDEO_CODECS = ("vp9", "vp09", "av01", "av1")
+# Audio codecs that most players can't play from an MP4 container, re-encoded to AAC. Cheap compared to video.
+TRANSCODED_AUDIO_CODECS = ("opus", "vorbis")
+# Seconds of libx264 encoding per second of video, used to estimate the saved encode time
+# until a re-encode of the run was measured
+DEFAULT_ENCODE_SECONDS_PER_MEDIA_SECOND = 1.0
+
+
+@dataclass
+class TranscodePlan:
+    # ffmpeg encoder of each stream, COPY_CODEC to keep the stream as is
+    video_codec: str = COPY_CODEC
+    audio_codec: str = COPY_CODEC
+    # Codecs of the source, for logging
+    source_vcodec: Optional[str] = None
+    source_acodec: Optional[str] = None
+
+    @property
+    def transcodes_video(self) -> bool:
+        return self.video_codec != COPY_CODEC
+
+    @property
+    def is_copy(self) -> bool:
+        return self.video_codec == COPY_CODEC and self.audio_codec == COPY_CODEC
+
+    def needs_ffmpeg(self, filepath: str) -> bool:
+        """
+        False if the file can be kept as it is: only compatible streams, already in an MP4 container
+        """
+        ext = os.path.splitext(filepath)[1].lstrip(".").lower()
+        return not self.is_copy or ext != MP4_EXT
+
+
+class CodecPolicy:
+    """
+    Decides per stream whether a download has to be re-encoded to play everywhere from MP4:
+    VP9 and AV1 video is re-encoded to H.264, Opus and Vorbis audio to AAC, every other stream is copied.
+    H.264 / AAC downloads are only remuxed, if they are not in an MP4 container already.
+    """
+    @staticmethod
+    def plan(vcodec: Optional[str], acodec: Optional[str]) -> TranscodePlan:
+        """
+        :param vcodec: yt-dlp vcodec (e.g. 'avc1.640028', 'vp09.00.40.08') or ffprobe codec_name (e.g. 'h264')
+        :param acodec: yt-dlp acodec (e.g. 'mp4a.40.2') or ffprobe codec_name (e.g. 'aac')
+        """
+        plan = TranscodePlan(source_vcodec=vcodec, source_acodec=acodec)
+        if CodecPolicy._matches(vcodec, TRANSCODED_VIDEO_CODECS):
+            plan.video_codec = H264_ENCODER
+        if CodecPolicy._matches(acodec, TRANSCODED_AUDIO_CODECS):
+            plan.audio_codec = AAC_ENCODER
+        return plan
+
+    @staticmethod
+    def plan_for_info(info: Dict[str, Any]) -> Optional[TranscodePlan]:
+        """
+        Plan from the formats yt-dlp selected, without probing the file.
+        :return: None if yt-dlp doesn't know the codecs of the selected formats
+        """
+        formats = info.get("requested_formats") or [info]
+        vcodec = next((f["vcodec"] for f in formats if f.get("vcodec") not in (None, "none")), None)
+        acodec = next((f["acodec"] for f in formats if f.get("acodec") not in (None, "none")), None)
+        if vcodec is None and acodec is None:
+            return None
+        return CodecPolicy.plan(vcodec, acodec)
+
+    @staticmethod
+    def plan_for_file(filepath: str) -> Tuple[TranscodePlan, Optional[float]]:
+        """
+        Plan from the streams of the file, probed with ffprobe.
+        :return: The plan and the duration of the file in seconds
+        """
+        streams = FFmpegUtils.probe_streams(filepath)
+        vcodec = next((s.get("codec_name") for s in streams if s.get("codec_type") == "video"), None)
+        acodec = next((s.get("codec_name") for s in streams if s.get("codec_type") == "audio"), None)
+        return CodecPolicy.plan(vcodec, acodec), FFmpegUtils.probe_duration(streams)
+
+    @staticmethod
+    def _matches(codec: Optional[str], prefixes: Tuple[str, ...]) -> bool:
+        return bool(codec) and codec.lower().startswith(prefixes)
+
+
+class EncodeStats:
+    """
+    Counts re-encoded and copied files of a run, to estimate how much encode time copying saved.
+    The encode speed is measured on the re-encodes of the run.
+    Files with only their audio re-encoded are counted on their own, they are neither copied nor a video re-encode.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.transcoded_files = 0
+        self.audio_transcoded_files = 0
+        self.copied_files = 0
+        self.encode_seconds = 0.0
+        self.transcoded_media_seconds = 0.0
+        self.copied_media_seconds = 0.0
+
+    def record(self, plan: TranscodePlan, media_seconds: Optional[float], elapsed_seconds: float) -> None:
+        with self._lock:
+            if plan.transcodes_video:
+                self.transcoded_files += 1
+                if media_seconds:
+                    self.encode_seconds += elapsed_seconds
+                    self.transcoded_media_seconds += media_seconds
+            elif plan.is_copy:
+                self.copied_files += 1
+                self.copied_media_seconds += media_seconds or 0.0
+            else:
+                self.audio_transcoded_files += 1
+
+    @property
+    def encode_seconds_per_media_second(self) -> float:
+        with self._lock:
+            if self.transcoded_media_seconds:
+                return self.encode_seconds / self.transcoded_media_seconds
+            return DEFAULT_ENCODE_SECONDS_PER_MEDIA_SECOND
+
+    @property
+    def estimated_saved_seconds(self) -> float:
+        return self.copied_media_seconds * self.encode_seconds_per_media_second
+
+    def summary(self) -> str:
+        measured = "measured" if self.transcoded_media_seconds else "estimated"
+        return (f"{self.transcoded_files} files re-encoded in {self.encode_seconds:.0f}s, "
+                + (f"{self.audio_transcoded_files} files with only their audio re-encoded, "
+                   if self.audio_transcoded_files else "")
+                + f"{self.copied_files} files copied without re-encoding "
+                f"({self.copied_media_seconds:.0f}s of video). "
+                f"Encode time saved: ~{self.estimated_saved_seconds:.0f}s "
+                f"at a {measured} {self.encode_seconds_per_media_second:.2f}s of encoding per second of video")
@@ -1,6 +1,7 @@
 import logging
 import os.path
 import os
+from datetime import datetime
 from enum import Enum
 
 from pythoncommons.file_utils import FileUtils, FindResultType
@@ -11,6 +12,15 @@ LOG = logging.getLogger(__name__)
 PROJECT_NAME = "youtube-downloader"
 
 
+class TitleProvider(Enum):
+    BEAUTIFULSOUP = 'beautifulsoup'
+    YT_DLP = 'yt-dlp'
+
+    @classmethod
+    def values(cls):
+        return [p.value for p in cls]
+
+
 class FilePath:
     REPO_ROOT_DIRNAME = "youtube-downloader"
     MODULE_ROOT_NAME = "youtube_downloader"
@@ -23,11 +33,39 @@ class FilePath:
         find_result_type=FindResultType.DIRS,
         exclude_dirs=[],
     )
+    # Old shelve based title cache, only read to migrate it to the SQLite database
     WEBPAGE_TITLE_CACHE_FILE = FileUtils.join_path(DEFAULT_OUTPUT_DIR, 'webpage_title_cache')
+    WEBPAGE_TITLE_CACHE_DB_FILE = FileUtils.join_path(DEFAULT_OUTPUT_DIR, 'webpage_title_cache.sqlite3')
+    DOWNLOAD_ARCHIVE_DB_FILE = FileUtils.join_path(DEFAULT_OUTPUT_DIR, 'download_archive.sqlite3')
+    # ffprobe results of verified files, see ProbeCache
+    PROBE_CACHE_DB_FILE = FileUtils.join_path(DEFAULT_OUTPUT_DIR, 'probe_cache.sqlite3')
+    # One journal per URL file and output directory, see RunJournal
+    RUN_JOURNAL_DIR = FileUtils.join_path(DEFAULT_OUTPUT_DIR, 'run_journals')
+    # One directory per run with its reports, see get_session_dir
+    SESSIONS_DIR = FileUtils.join_path(DEFAULT_OUTPUT_DIR, 'sessions')
     FileUtils.ensure_dir_created(DEFAULT_OUTPUT_DIR)
 
     SESSION_DIR = None
 
+    @classmethod
+    def get_session_dir(cls) -> str:
+        """
+        Directory of the current run, named after its start time. Created on first use.
+        """
+        if FilePath.SESSION_DIR is None:
+            session = datetime.now().strftime("%Y%m%d_%H%M%S") + f"_{os.getpid()}"
+            FilePath.SESSION_DIR = cls._get_child_dir(FilePath.SESSIONS_DIR, session, create=True)
+        return FilePath.SESSION_DIR
+
+    @classmethod
+    def download_archive_db_file(cls, profile=None):
+        """
+        :param profile: Media profile with an archive of its own, None for the archive of video downloads
+        """
+        if not profile:
+            return FilePath.DOWNLOAD_ARCHIVE_DB_FILE
+        return FileUtils.join_path(FilePath.DEFAULT_OUTPUT_DIR, f'download_archive_{profile}.sqlite3')
+
     @classmethod
     def get_file_from_root(cls, fname):
         return SimpleProjectUtils.get_project_file(basedir=FilePath.REPO_ROOT_DIR,
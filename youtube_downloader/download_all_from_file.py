@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+import argparse
+import contextlib
+import itertools
+import logging
+import sys
+import threading
+from typing import Any, Dict, List, Optional
+
+from yt_dlp.utils import DownloadError
+
+from youtube_downloader.cache import CacheEntry, VideoTitleCache
+from youtube_downloader.constants import TitleProvider
+from youtube_downloader.download_engine import DownloadEngine, DownloadItem, EngineConfig, MEDIA_PROFILES, \
+    VIDEO_MP4, AUDIO_MP3, DEBUG_MODE, DEFAULT_CONCURRENT_FRAGMENT_DOWNLOADS, Fore, Style, \
+    add_engine_arguments, add_transcode_arguments, build_download_items, ensure_all_processed, export_metrics, \
+    make_bandwidth_manager, make_governor, make_playlist_expander
+from youtube_downloader.instrumentation import profile_report
+from youtube_downloader.progress import ProgressReporter
+from youtube_downloader.scheduler import DownloadScheduler
+from youtube_downloader.utils import FileUtils, LoggingUtils
+from youtube_downloader.ydl_session import YoutubeDLSessionManager
+
+LOG = logging.getLogger(__name__)
+DEFAULT_PROFILES = [VIDEO_MP4.name, AUDIO_MP3.name]
+
+
+def record_title(cache: VideoTitleCache, url: str, info: Dict[str, Any]) -> None:
+    """
+    Caches the title of the URL from its extracted metadata, the same way youtube-downloader-get-titles does with yt-dlp.
+    """
+    if info.get("title"):
+        cache.put_entries({url: CacheEntry(title=info["title"], video_id=info.get("id"), duration=info.get("duration"),
+                                           provider=TitleProvider.YT_DLP.value)})
+
+
+class CombinedDownload:
+    """
+    Downloads several media profiles of every URL (e.g. video and audio) from a single metadata extraction.
+    The metadata of each URL is extracted once, its title is cached, then each profile selects its formats
+    from a copy of it and downloads them. A profile is left out for URLs it already has in its archive or journal,
+    URLs that all profiles have are not extracted at all.
+    """
+    def __init__(self, engines: List[DownloadEngine], config: EngineConfig, progress: ProgressReporter):
+        if not engines:
+            raise ValueError("At least one media profile should be downloaded")
+        # Audio first: if a site only has formats with video, the audio profile downloads the same file name
+        # as the video profile and would take the video file as already downloaded, then delete it after extracting
+        self._engines = sorted(engines, key=lambda e: not e.profile.is_audio)
+        self._config = config
+        self._progress = progress
+        self._lock = threading.Lock()
+        self.extractions = 0
+        self.downloads = 0
+
+    def run(self, urls) -> None:
+        scheduler = DownloadScheduler(jobs=self._config.jobs)
+        # Profiles of a URL are downloaded one after the other by the same worker
+        fragments_per_job = DownloadScheduler.split_evenly(DEFAULT_CONCURRENT_FRAGMENT_DOWNLOADS, scheduler.jobs)
+        with YoutubeDLSessionManager() as sessions, VideoTitleCache() as cache, contextlib.ExitStack() as engines:
+            for engine in self._engines:
+                engines.enter_context(engine.open(sessions, cache, fragments_per_job))
+            # The engines share the governor
+            playlist_expander = make_playlist_expander(sessions, cache, self._config, self._engines[0].governor)
+            items = build_download_items(urls, playlist_expander, [engine.journal for engine in self._engines])
+
+            def job(item: DownloadItem, idx: int, total: Optional[int]):
+                self.download(item, idx, total, cache)
+
+            scheduler.run(items, job)
+        for engine in self._engines:
+            engine.print_summary()
+        # The engines share the governor
+        self._engines[0].print_rate_summary()
+        self._progress.message(f"{Fore.GREEN}[EXTRACT]{Style.RESET_ALL} {self.extractions} metadata extractions "
+                               f"for {self.downloads} downloads of {len(self._engines)} profiles")
+
+    def download(self, item: DownloadItem, idx: int, total: Optional[int], cache: VideoTitleCache) -> None:
+        engines = [engine for engine in self._engines if engine.needs_download(item, idx, total)]
+        if not engines:
+            return
+        try:
+            info = engines[0].extract_info(item)
+        except Exception as e:
+            for engine in engines:
+                engine.record_failure(item, e)
+            self._progress.message(f"{Fore.RED}[ERROR]{Style.RESET_ALL} Failed to extract {item.url}: {e}")
+            return
+        with self._lock:
+            self.extractions += 1
+            self.downloads += len(engines)
+        record_title(cache, item.url, info)
+        if "entries" in info:
+            # Playlist that could not be listed up front, its entries may be a one-shot generator.
+            # Each profile lets yt-dlp expand it.
+            info = None
+        for engine in engines:
+            engine.download_url(item, idx, total, info=info)
+
+
+def build_argparser() -> argparse.ArgumentParser:
+    p = argparse.ArgumentParser(description="Cache titles and download audio and video of YouTube URLs "
+                                            "(one per line) with a single metadata extraction per URL.")
+    add_engine_arguments(p)
+    p.add_argument("--profiles", nargs="+", choices=list(MEDIA_PROFILES), default=DEFAULT_PROFILES,
+                   help=f"Media profiles to download of every URL (default: {' '.join(DEFAULT_PROFILES)}).")
+    p.add_argument("--no-reencode", action="store_true",
+                   help="Never re-encode video, don't re-encode Opus or M4A audio to MP3.")
+    add_transcode_arguments(p)
+    return p
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = build_argparser().parse_args(argv)
+    LoggingUtils.init_with_basic_config(debug=DEBUG_MODE)
+
+    try:
+        urls = FileUtils.iter_urls(args.urls_file)
+    except FileNotFoundError as e:
+        print(f"{Fore.RED}{e}{Style.RESET_ALL}")
+        sys.exit(2)
+
+    # The file is streamed while the URLs are processed, only the first one is read up front
+    first_url = next(urls, None)
+    if first_url is None:
+        print(f"{Fore.YELLOW}No URLs found in {args.urls_file}{Style.RESET_ALL}")
+        sys.exit(0)
+    urls = itertools.chain([first_url], urls)
+
+    config = EngineConfig.from_args(args)
+    profiles = [MEDIA_PROFILES[name] for name in dict.fromkeys(args.profiles)]
+    if args.no_reencode:
+        profiles = [profile.without_reencode() for profile in profiles]
+    try:
+        with profile_report(args), ProgressReporter(config.progress_interval) as progress:
+            # Extractions and downloads of all profiles count against the same limits and bandwidth budget
+            governor = make_governor(config)
+            bandwidth = make_bandwidth_manager(config)
+            engines = [DownloadEngine(profile, config, progress, governor=governor, bandwidth=bandwidth)
+                       for profile in profiles]
+            CombinedDownload(engines, config, progress).run(urls)
+    except DownloadError as e:
+        # Raised while the engines are opened, e.g. if ffprobe is not installed
+        print(f"{Fore.RED}{e}{Style.RESET_ALL}")
+        sys.exit(2)
+    export_metrics(progress.metrics, config)
+    for engine in engines:
+        ensure_all_processed(engine.journal)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,824 @@
+from __future__ import annotations
+
+import argparse
+import contextlib
+import copy
+import itertools
+import logging
+import os
+import sys
+import threading
+import time
+from dataclasses import dataclass, field, replace
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Sequence, Tuple
+from yt_dlp import YoutubeDL
+from yt_dlp.utils import DownloadError, sanitize_filename
+
+from youtube_downloader.archive import DownloadArchive, ArchiveKey
+from youtube_downloader.bandwidth import BandwidthManager, BandwidthWindow, parse_rate
+from youtube_downloader.cache import VideoTitleCache
+from youtube_downloader.codec_policy import CodecPolicy, EncodeStats
+from youtube_downloader.constants import FilePath
+from youtube_downloader.governor import RequestGovernor, DEFAULT_REQUESTS_PER_SECOND, DEFAULT_MAX_CONCURRENCY, \
+    retry_sleep
+from youtube_downloader.instrumentation import INSTRUMENTATION, add_profile_report_arguments, profile_report
+from youtube_downloader.journal import RunJournal, JournalState, JournalPP
+from youtube_downloader.pipeline import DownloadedFile, PostDownloadPipeline, PipelineHandoffPP, \
+    DEFAULT_TRANSCODE_WORKERS, DEFAULT_TRANSCODE_QUEUE_DEPTH, DEFAULT_VERIFY_WORKERS, DEFAULT_VERIFY_QUEUE_DEPTH
+from youtube_downloader.playlist import PlaylistExpander
+from youtube_downloader.progress import ProgressMetrics, ProgressReporter, DEFAULT_REFRESH_INTERVAL
+from youtube_downloader.scheduler import DownloadScheduler
+from youtube_downloader.transcode import TranscodeService, CodecAwareConvertorPP, apply_plan, TRANSCODE_PROFILES, \
+    DEFAULT_TRANSCODE_PROFILE, DEFAULT_THREADS_PER_JOB, available_cpus
+from youtube_downloader.utils import FileUtils, LoggingUtils, ProgressUtils
+from youtube_downloader.verification import VerificationService, ProbeCache, DEFAULT_PROBE_WORKERS
+from youtube_downloader.ydl_session import YoutubeDLPool, YoutubeDLSessionManager
+
+try:
+    from colorama import init as colorama_init, Fore, Style
+    colorama_init()
+except Exception:
+    # fallback to no color if colorama not installed
+    class _C:
+        def __getattr__(self, _): return ""
+    Fore = Style = _C()
+
+LOG = logging.getLogger(__name__)
+DEBUG_MODE = False
+# Total number of fragment downloads, split across download workers
+DEFAULT_CONCURRENT_FRAGMENT_DOWNLOADS = 5
+# FFmpegExtractAudio codec that keeps the downloaded audio stream as it is, only extracted into its own container
+PASSTHROUGH_AUDIO_CODEC = "best"
+# FFmpegExtractAudio mapping by extension of the download: Opus (in WebM) and M4A are kept, anything else is MP3
+KEEP_OPUS_M4A_AUDIO_CODEC = "m4a>m4a/webm>opus/opus>opus/mp3"
+# yt-dlp postprocessors of the encode stage
+ENCODING_POSTPROCESSORS = (CodecAwareConvertorPP.pp_key(), "ExtractAudio")
+
+
+@dataclass(frozen=True)
+class MediaProfile:
+    """
+    What to download of each URL and what to convert it to.
+    Video profiles are converted to MP4 according to CodecPolicy, audio profiles are extracted
+    with yt-dlp's FFmpegExtractAudio.
+    """
+    name: str
+    # yt-dlp format selector
+    format: str
+    # Container of merged video and audio downloads, None for audio only profiles
+    merge_output_format: Optional[str] = None
+    # Convert downloads to MP4 with CodecAwareConvertorPP
+    transcode_video: bool = False
+    # FFmpegExtractAudio preferredcodec, None for video profiles
+    audio_codec: Optional[str] = None
+    # FFmpegExtractAudio preferredquality (kbps), ignored for audio that is not re-encoded
+    audio_quality: Optional[str] = None
+
+    @property
+    def is_audio(self) -> bool:
+        return self.audio_codec is not None
+
+    def without_reencode(self) -> 'MediaProfile':
+        """
+        Video is kept as yt-dlp merged it. Opus and M4A audio is kept as it is, other audio codecs are still converted.
+        """
+        if not self.is_audio:
+            return replace(self, transcode_video=False)
+        if self.audio_codec == PASSTHROUGH_AUDIO_CODEC:
+            return self
+        return replace(self, audio_codec=KEEP_OPUS_M4A_AUDIO_CODEC)
+
+    def postprocessors(self) -> List[Dict[str, Any]]:
+        """
+        Postprocessors of the yt-dlp options. Video conversion is not part of these, see DownloadEngine.make_download_pool.
+        """
+        if not self.is_audio:
+            return []
+        pp = {"key": "FFmpegExtractAudio", "preferredcodec": self.audio_codec}
+        if self.audio_quality:
+            pp["preferredquality"] = self.audio_quality
+        return [pp]
+
+
+VIDEO_MP4 = MediaProfile("video-mp4", format="bestvideo[ext=mp4]+bestaudio[ext=m4a]/mp4",
+                         merge_output_format="mp4", transcode_video=True)
+AUDIO_MP3 = MediaProfile("audio-mp3", format="bestaudio/best", audio_codec="mp3", audio_quality="192")
+# Prefers Opus streams, kept without re-encoding in an .opus file
+AUDIO_OPUS = MediaProfile("audio-opus", format="bestaudio[acodec=opus]/bestaudio/best",
+                          audio_codec=PASSTHROUGH_AUDIO_CODEC)
+MEDIA_PROFILES: Dict[str, MediaProfile] = {p.name: p for p in (VIDEO_MP4, AUDIO_MP3, AUDIO_OPUS)}
+# Stores of this profile keep their original file names, from before there were other profiles
+DEFAULT_MEDIA_PROFILE = VIDEO_MP4.name
+
+
+@dataclass
+class EngineConfig:
+    urls_file: str
+    output_dir: str
+    cookiefile: Optional[str] = None
+    use_browser_cookies: bool = True
+    jobs: int = 1
+    pipeline: bool = False
+    transcode_workers: int = DEFAULT_TRANSCODE_WORKERS
+    transcode_queue_depth: int = DEFAULT_TRANSCODE_QUEUE_DEPTH
+    verify_workers: int = DEFAULT_VERIFY_WORKERS
+    verify_queue_depth: int = DEFAULT_VERIFY_QUEUE_DEPTH
+    probe_workers: int = DEFAULT_PROBE_WORKERS
+    transcode_profile: str = DEFAULT_TRANSCODE_PROFILE
+    cpu_budget: Optional[int] = None
+    threads_per_job: int = DEFAULT_THREADS_PER_JOB
+    use_archive: bool = True
+    import_existing: bool = False
+    resume: bool = False
+    progress_interval: float = DEFAULT_REFRESH_INTERVAL
+    metrics_json: Optional[str] = None
+    metrics_prometheus: Optional[str] = None
+    max_requests_per_second: float = DEFAULT_REQUESTS_PER_SECOND
+    # Bytes / second of all downloads together, None means unlimited
+    max_bandwidth: Optional[float] = None
+    bandwidth_schedule: List[BandwidthWindow] = field(default_factory=list)
+
+    @staticmethod
+    def from_args(args: argparse.Namespace) -> 'EngineConfig':
+        """
+        :param args: Parsed by a parser set up with add_engine_arguments, transcode arguments are optional
+        """
+        return EngineConfig(urls_file=args.urls_file,
+                            output_dir=args.output_dir,
+                            cookiefile=args.cookiefile,
+                            use_browser_cookies=not args.no_browser_cookies,
+                            jobs=args.jobs,
+                            pipeline=args.pipeline,
+                            transcode_workers=args.transcode_workers,
+                            transcode_queue_depth=args.transcode_queue_depth,
+                            verify_workers=args.verify_workers,
+                            verify_queue_depth=args.verify_queue_depth,
+                            probe_workers=args.probe_workers,
+                            transcode_profile=getattr(args, "transcode_profile", DEFAULT_TRANSCODE_PROFILE),
+                            cpu_budget=getattr(args, "cpu_budget", None),
+                            threads_per_job=getattr(args, "threads_per_job", DEFAULT_THREADS_PER_JOB),
+                            use_archive=not args.no_archive,
+                            import_existing=args.import_existing,
+                            resume=args.resume,
+                            progress_interval=args.progress_interval,
+                            metrics_json=args.metrics_json,
+                            metrics_prometheus=args.metrics_prometheus,
+                            max_requests_per_second=args.max_requests_per_second,
+                            max_bandwidth=args.max_bandwidth,
+                            bandwidth_schedule=args.bandwidth_window or [])
+
+
+def add_engine_arguments(p: argparse.ArgumentParser) -> None:
+    """
+    Arguments shared by the download entry points
+    """
+    p.add_argument("urls_file", help="Path to the text file containing URLs (one per line).")
+    p.add_argument("output_dir", nargs="?", default=FilePath.DEFAULT_OUTPUT_DIR,
+                   help="Optional output directory (default: YT-DLP-downloads)")
+    p.add_argument("--cookiefile", "-c", default=None,
+                   help="Path to cookies.txt exported from browser (optional).")
+    p.add_argument("--no-browser-cookies", action="store_true",
+                   help="Don't attempt to read cookies from the browser automatically.")
+    p.add_argument("--jobs", "-j", type=int, default=1,
+                   help="Number of URLs to download in parallel (default: 1). "
+                        f"The {DEFAULT_CONCURRENT_FRAGMENT_DOWNLOADS} concurrent fragment downloads are split across the jobs.")
+    p.add_argument("--pipeline", action="store_true",
+                   help="Re-encode and verify downloaded files on separate worker pools, "
+                        "so downloads continue while previous files are being encoded.")
+    p.add_argument("--transcode-workers", type=int, default=DEFAULT_TRANSCODE_WORKERS,
+                   help="Number of files handed to the transcode service at once in pipeline mode, "
+                        f"it runs as many of them as the CPU budget allows (default: {DEFAULT_TRANSCODE_WORKERS}).")
+    p.add_argument("--transcode-queue-depth", type=int, default=DEFAULT_TRANSCODE_QUEUE_DEPTH,
+                   help="Number of downloaded files waiting for re-encode in pipeline mode, "
+                        "downloads block when the queue is full "
+                        f"(default: {DEFAULT_TRANSCODE_QUEUE_DEPTH}).")
+    p.add_argument("--verify-workers", type=int, default=DEFAULT_VERIFY_WORKERS,
+                   help=f"Number of parallel ffprobe verifications in pipeline mode (default: {DEFAULT_VERIFY_WORKERS}).")
+    p.add_argument("--verify-queue-depth", type=int, default=DEFAULT_VERIFY_QUEUE_DEPTH,
+                   help="Number of files waiting for verification in pipeline mode, "
+                        f"re-encodes block when the queue is full (default: {DEFAULT_VERIFY_QUEUE_DEPTH}).")
+    p.add_argument("--probe-workers", type=int, default=DEFAULT_PROBE_WORKERS,
+                   help=f"Number of parallel ffprobe verifications (default: {DEFAULT_PROBE_WORKERS}).")
+    p.add_argument("--no-archive", action="store_true",
+                   help="Don't use the download archive: check and download every URL with yt-dlp.")
+    p.add_argument("--import-existing", action="store_true",
+                   help="Before downloading, record files already in the output directory in the download archive, "
+                        "matched by their cached titles.")
+    p.add_argument("--resume", action="store_true",
+                   help="Continue the previous run of the same URL file and output directory from its run journal: "
+                        "only URLs that were not verified are downloaded, playlists are not listed again.")
+    p.add_argument("--progress-interval", type=float, default=DEFAULT_REFRESH_INTERVAL,
+                   help=f"Seconds between refreshes of the download progress lines (default: {DEFAULT_REFRESH_INTERVAL}).")
+    p.add_argument("--metrics-json", default=None,
+                   help="Write the metrics of the run (bytes/s, queue depths, extract / download / encode / verify "
+                        "latencies) to this JSON file at the end of the run.")
+    p.add_argument("--metrics-prometheus", default=None,
+                   help="Write the metrics of the run to this file in the Prometheus text format "
+                        "(e.g. for the node_exporter textfile collector).")
+    p.add_argument("--max-requests-per-second", type=float, default=DEFAULT_REQUESTS_PER_SECOND,
+                   help="Max number of extractions and downloads started per second on the same host, "
+                        "lowered while the host throttles requests (HTTP 429 / 403) "
+                        f"(default: {DEFAULT_REQUESTS_PER_SECOND}).")
+    p.add_argument("--max-bandwidth", type=parse_rate, default=None,
+                   help="Download rate of all parallel downloads together, e.g. 500K or 4M (bytes / second), "
+                        "shared fairly among the running downloads (default: unlimited).")
+    p.add_argument("--bandwidth-window", type=BandwidthWindow.parse, action="append", default=None,
+                   help="Download rate during a time of day instead of --max-bandwidth, can be given several times, "
+                        "the first matching window applies. Format: [DAYS ]HH:MM-HH:MM=RATE, "
+                        "e.g. 'mon-fri 09:00-17:00=0' to pause downloads during business hours or '01:00-07:00=20M'.")
+    add_profile_report_arguments(p)
+
+
+def add_transcode_arguments(p: argparse.ArgumentParser) -> None:
+    """
+    Arguments of the transcode service, for entry points that download video
+    """
+    p.add_argument("--transcode-profile", choices=list(TRANSCODE_PROFILES), default=DEFAULT_TRANSCODE_PROFILE,
+                   help="x264 preset and CRF of re-encodes: 'fast' (veryfast, CRF 23) or "
+                        f"'archival' (slow, CRF 18) (default: {DEFAULT_TRANSCODE_PROFILE}).")
+    p.add_argument("--cpu-budget", type=int, default=None,
+                   help="Number of encoder threads of all parallel ffmpeg jobs together "
+                        f"(default: the number of available CPUs, {available_cpus()}).")
+    p.add_argument("--threads-per-job", type=int, default=DEFAULT_THREADS_PER_JOB,
+                   help=f"Number of encoder threads of each re-encode (default: {DEFAULT_THREADS_PER_JOB}).")
+
+
+def make_ydl_opts(output_dir: str,
+                  cookiefile: Optional[str],
+                  use_browser_cookies: bool,
+                  profile: MediaProfile = VIDEO_MP4,
+                  debug_mode=False,
+                  concurrent_fragment_downloads: int = DEFAULT_CONCURRENT_FRAGMENT_DOWNLOADS,
+                  progress_hooks: Optional[List] = None,
+                  postprocessor_hooks: Optional[List] = None) -> Dict[str, Any]:
+    """
+    :param profile: Format to download and audio extraction. Re-encoding video is not part of the options,
+    see DownloadEngine.make_download_pool.
+    """
+    # Ensure output_dir exists
+    os.makedirs(output_dir, exist_ok=True)
+
+    # Other formats
+    ### best video + best audio
+    # "format": "bv*+ba/b",
+    # "format": "bv*[height=1080]+ba/b",
+    ### merge into mp4 (container) and force conversion to mp4 (H.264) later
+    # "format": "bestvideo[ext=mp4]+bestaudio[ext=m4a]/mp4", # forces MP4 output
+    ### prefer 1080p video + best audio; fallback to best available
+    # format": "bv*[height=1080]+ba/best",
+    ### merge into mp4 (container) and force conversion to mp4 (H.264) later
+    # "format": "bv*[height=1080]+ba/best",
+    # "format": "bestvideo[ext=mp4]+bestaudio[ext=m4a]/mp4", # forces MP4 output
+    # "format": "bv*+ba/b",
+    log_configs: Dict[str, Any] = {"verbose": False, "quiet": False}
+    if debug_mode:
+        log_configs["verbose"] = True
+        log_configs["quiet"] = False
+        log_configs["extractor_args"] = {
+            'youtube': {  # or the specific extractor name you need
+                'jsc_trace': ['false'] # it's weird but it expects a list and lowercase boolean str.
+            }
+        }
+    ydl_opts: Dict[str, Any] = {
+        # Template: base / playlist_title / title.ext
+        "outtmpl": os.path.join(output_dir, "%(playlist_title)s/%(title)s.%(ext)s"),
+        "ignoreerrors": False,         # continue on errors
+        # watch?v=<id>&list=<playlist> URLs are the video only, like in canonical.UrlCanonicalizer and the archive.
+        # Playlist URLs are still downloaded as playlists.
+        "noplaylist": True,
+        "continuedl": True,           # resume partial downloads
+        "retries": 10,                # retry network issues
+        # wait before retries instead of retrying right away, see governor.RequestGovernor for throttled URLs
+        "retry_sleep_functions": {"http": retry_sleep, "fragment": retry_sleep, "extractor": retry_sleep},
+        "concurrent_fragment_downloads": concurrent_fragment_downloads,
+        "nooverwrites": True,
+        "format": profile.format,
+        # be a bit quieter about cookies/js runtime if we set extractor args below
+        # "extractor_args": {"youtube": {"player_client": "default"}},
+        # hooks: progress (download), postprocessor events
+        "progress_hooks": progress_hooks or [],
+        "postprocessors": profile.postprocessors(),
+        "postprocessor_hooks": postprocessor_hooks or [],
+
+        # This is to correctly set up Deno JS challenge solver
+        "remote_components": ["ejs:github", 'ejs:npm'], # this is to allow to download JS dependencies for Deno. By default it is false
+    }
+    if profile.merge_output_format:
+        ydl_opts.update({
+            # Fail if merge can't happen
+            # abort if incompatible streams are selected
+            # print a clear FFmpeg error
+            # never produce a silent broken MP4
+            "force_no_merge": False,
+            "merge_output_format": profile.merge_output_format,
+            "compat_opts": ["force-merge"],
+        })
+    ydl_opts.update(log_configs)
+
+    # Use browser cookies if requested
+    if use_browser_cookies:
+    # youtube extraction works with many browsers; we use chrome by default
+    # yt-dlp accepts tuple for cookiesfrombrowser
+        ydl_opts["cookiesfrombrowser"] = ("chrome",)
+
+    # If user provided a cookiefile, add it (explicit cookie file takes precedence)
+    if cookiefile:
+        ydl_opts["cookiefile"] = cookiefile
+
+    return ydl_opts
+
+def post_hook(d):
+    LOG.info("post_hook: %s, %s", d["status"], d.get("info_dict", {}).get("filepath"))
+
+
+@dataclass
+class DownloadItem:
+    url: str
+    # Playlist fields of entries coming from an expanded playlist, see ExpandedPlaylist.extra_info
+    extra_info: Optional[Dict[str, Any]] = None
+
+    @property
+    def playlist_id(self) -> Optional[str]:
+        return self.extra_info.get("playlist_id") if self.extra_info else None
+
+
+def build_download_items(urls: Iterable[str], playlist_expander: PlaylistExpander,
+                         journals: Sequence[RunJournal] = ()) -> Iterator[DownloadItem]:
+    """
+    Replaces playlists with their entries, so they are scheduled one by one.
+    Playlists are expanded lazily, when the scheduler gets to them.
+    Playlists that could not be expanded are left for yt-dlp to expand.
+    :param journals: Run journals of the profiles being downloaded. Items are recorded as queued in the journals
+    that don't have them as finished, items finished in all of them are left out.
+    Playlists any of them has a listing of are not listed again.
+    """
+    for url in urls:
+        if not PlaylistExpander.is_playlist_url(url):
+            yield from _journaled(journals, DownloadItem(url))
+            continue
+        playlist = next((p for p in (j.playlist(url) for j in journals) if p is not None), None)
+        if playlist is None:
+            try:
+                playlist = playlist_expander.expand(url)
+            except Exception as e:
+                LOG.error("Failed to list playlist %s: %s", url, e)
+                yield from _journaled(journals, DownloadItem(url))
+                continue
+            for journal in journals:
+                journal.record_playlist(playlist)
+        for index, entry in enumerate(playlist.entries, start=1):
+            yield from _journaled(journals, DownloadItem(entry.url, playlist.extra_info(index)))
+
+
+def _journaled(journals: Sequence[RunJournal], item: DownloadItem) -> Iterator[DownloadItem]:
+    unfinished = [j for j in journals if not j.is_finished(item.url, item.playlist_id)]
+    if journals and not unfinished:
+        LOG.debug("Finished in a previous run: %s", item.url)
+        return
+    for journal in unfinished:
+        journal.record(item.url, item.playlist_id, JournalState.QUEUED)
+    yield item
+
+
+def make_playlist_expander(sessions: YoutubeDLSessionManager, cache: VideoTitleCache,
+                           config: EngineConfig, governor: Optional[RequestGovernor] = None) -> PlaylistExpander:
+    """
+    :param governor: Limits of the listings, the governor of the engines that download the entries
+    """
+    # Playlists are listed once: the same entries are downloaded and checked by ensure_all_processed
+    playlist_opts = PlaylistExpander.make_ydl_opts(cookiefile=config.cookiefile,
+                                                   use_browser_cookies=config.use_browser_cookies)
+    return PlaylistExpander(sessions.get_pool("playlists", playlist_opts), cache=cache, governor=governor)
+
+
+def import_existing_downloads(archive: DownloadArchive, cache: VideoTitleCache, output_dir: str) -> int:
+    """
+    Records files of the output directory that were downloaded before the archive existed.
+    Files are matched by name with the cached titles of YouTube URLs, named the way yt-dlp names them.
+    """
+    keys_by_filename: Dict[str, ArchiveKey] = {}
+    for url, entry in cache.entries():
+        key = DownloadArchive.key_from_url(url)
+        if key:
+            keys_by_filename[sanitize_filename(entry.title)] = key
+    return archive.import_existing(output_dir, keys_by_filename)
+
+
+def ensure_all_processed(journal: RunJournal):
+    """
+    Checks from the run journal that the file of every queued URL was verified by ffprobe.
+    Playlists are not listed again, the journal has the entries that were scheduled.
+    Playlists that were left for yt-dlp to expand are checked by the entries yt-dlp reported.
+    """
+    unfinished_urls = {}
+    unprocessed: Dict[str, Dict[str, str]] = {}
+    for (playlist_id, url), state in journal.unfinished().items():
+        if playlist_id:
+            unprocessed.setdefault(playlist_id, {})[url] = state.value
+        elif not PlaylistExpander.is_playlist_url(url):
+            unfinished_urls[url] = state.value
+
+    if unfinished_urls:
+        raise ValueError("The following URLs result files were not processed by ffprobe (URL: last state): {}. "
+                         "Rerun with --resume to retry them.".format(unfinished_urls))
+    if unprocessed:
+        raise ValueError("The following URLs result files were not processed by ffprobe for playlists "
+                         "(URL: last state): {}. Rerun with --resume to retry them.".format(unprocessed))
+
+
+class DownloadEngine:
+    """
+    Downloads the URLs of a file with yt-dlp according to a MediaProfile: parallel download workers,
+    download archive, run journal, conversion on the transcode service and ffprobe verification of every file.
+    The stores are opened by run() and shared by the hooks of all download workers.
+    """
+    def __init__(self, profile: MediaProfile, config: EngineConfig, progress: ProgressReporter,
+                 governor: Optional[RequestGovernor] = None,
+                 bandwidth: Optional[BandwidthManager] = None):
+        """
+        :param progress: Progress display and metrics, all output of the engine goes through it
+        :param governor: Rate and concurrency limits of extractions and downloads on each host,
+        shared by engines that download from the same hosts. If not given, the engine creates its own.
+        :param bandwidth: Budget of the downloads, shared by engines that download at the same time.
+        If not given, the engine creates its own.
+        """
+        self.profile = profile
+        self.config = config
+        self.progress = progress
+        self.governor = governor if governor else make_governor(config)
+        self.bandwidth = bandwidth if bandwidth else make_bandwidth_manager(config)
+        # Start of the running postprocessors, per download worker
+        self._timings = threading.local()
+        # Verified downloads are recorded here, unless the archive is disabled
+        self.archive: Optional[DownloadArchive] = None
+        # State of every URL of the run, written from hooks of several download workers
+        self.journal: Optional[RunJournal] = None
+        # Runs all ffmpeg conversions within the CPU budget, only for profiles that re-encode video
+        self.transcoder: Optional[TranscodeService] = None
+        # Verifies downloaded files, with ffprobe results cached across runs
+        self.verifier: Optional[VerificationService] = None
+        # Re-encoded and copied files of the run
+        self.encode_stats = EncodeStats()
+        self._stores = contextlib.ExitStack()
+        self._ydl_pool: Optional[YoutubeDLPool] = None
+        # Journal states recorded when a yt-dlp postprocessor starts or finishes, by (postprocessor, status)
+        self._journal_states_by_pp: Dict[Tuple[str, str], JournalState] = {
+            (CodecAwareConvertorPP.pp_key(), "started"): JournalState.DOWNLOADED,
+            (CodecAwareConvertorPP.pp_key(), "finished"): JournalState.ENCODED,
+            ("ExtractAudio", "started"): JournalState.DOWNLOADED,
+            ("ExtractAudio", "finished"): JournalState.ENCODED,
+            # Runs after the conversion, if any: only recorded if the file was not converted
+            ("MoveFiles", "started"): JournalState.DOWNLOADED,
+        }
+
+    @property
+    def _store_suffix(self) -> Optional[str]:
+        # Profiles have their own archive and journals: the audio of a video is not downloaded by the video
+        return None if self.profile.name == DEFAULT_MEDIA_PROFILE else self.profile.name
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def open(self, sessions: YoutubeDLSessionManager, cache: Optional[VideoTitleCache] = None,
+             concurrent_fragment_downloads: int = DEFAULT_CONCURRENT_FRAGMENT_DOWNLOADS) -> 'DownloadEngine':
+        """
+        Opens the stores and creates the pool of YoutubeDL instances of the download workers.
+        :param cache: Title cache to match existing downloads with, if the config asks to import them
+        """
+        config = self.config
+        probe_cache = ProbeCache()
+        self.verifier = VerificationService(workers=config.probe_workers, cache=probe_cache,
+                                            require_video=not self.profile.is_audio)
+        pipeline = None
+        if config.pipeline:
+            pipeline = PostDownloadPipeline(transcode=self.transcode_file if self.profile.transcode_video else lambda d: d,
+                                            verify=self.verify_file,
+                                            transcode_workers=config.transcode_workers,
+                                            transcode_queue_depth=config.transcode_queue_depth,
+                                            verify_workers=config.verify_workers,
+                                            verify_queue_depth=config.verify_queue_depth)
+
+        if self.profile.transcode_video:
+            self.transcoder = TranscodeService(cpu_budget=config.cpu_budget,
+                                               threads_per_job=config.threads_per_job,
+                                               profile=TRANSCODE_PROFILES[config.transcode_profile])
+        if config.use_archive:
+            self.archive = DownloadArchive(FilePath.download_archive_db_file(self._store_suffix))
+        self.journal = RunJournal(RunJournal.path_for_run(config.urls_file, config.output_dir,
+                                                          profile=self._store_suffix)).open(resume=config.resume)
+        self.progress.message(f"Run journal: {self.journal.file_path}")
+
+        # Closed in reverse order: stores of the verify stage are closed after the pipeline,
+        # it records the files it verifies while it's being closed
+        for store in (self.archive, self.journal, probe_cache, self.transcoder, pipeline):
+            if store is not None:
+                self._stores.enter_context(store)
+        if pipeline is not None:
+            for stage in pipeline.queue_depths():
+                self.progress.add_gauge(f"{self.profile.name} {stage}", lambda stage=stage: pipeline.queue_depths()[stage])
+        if self.transcoder is not None:
+            self.progress.add_gauge("ffmpeg", lambda: self.transcoder.queue_depth)
+        self.progress.add_status("RATE", self.governor.status)
+        self.progress.add_status("BW", self.bandwidth.status)
+        if self.archive and cache is not None and config.import_existing:
+            import_existing_downloads(self.archive, cache, config.output_dir)
+        self._ydl_pool = self.make_download_pool(sessions, concurrent_fragment_downloads, pipeline)
+        return self
+
+    def close(self) -> None:
+        self._stores.close()
+
+    def run(self, urls: Iterable[str]) -> None:
+        """
+        Downloads all URLs of this profile
+        """
+        scheduler = DownloadScheduler(jobs=self.config.jobs)
+        fragments_per_job = DownloadScheduler.split_evenly(DEFAULT_CONCURRENT_FRAGMENT_DOWNLOADS, scheduler.jobs)
+        with YoutubeDLSessionManager() as sessions, VideoTitleCache() as cache, \
+                self.open(sessions, cache, fragments_per_job):
+            items = build_download_items(urls, make_playlist_expander(sessions, cache, self.config, self.governor),
+                                         [self.journal])
+
+            def job(item: DownloadItem, idx: int, total: Optional[int]):
+                if self.needs_download(item, idx, total):
+                    self.download_url(item, idx, total)
+
+            scheduler.run(items, job)
+        self.print_summary()
+        self.print_rate_summary()
+
+    def print_summary(self) -> None:
+        if self.encode_stats.transcoded_files or self.encode_stats.audio_transcoded_files \
+                or self.encode_stats.copied_files:
+            self.progress.message(f"{Fore.GREEN}[ENCODE]{Style.RESET_ALL} {self.encode_stats.summary()}")
+            self.progress.message(f"{Fore.GREEN}[ENCODE]{Style.RESET_ALL} {self.transcoder.summary()}")
+
+    def print_rate_summary(self) -> None:
+        """
+        Throttled requests of the governor, it may be shared with other engines
+        """
+        summary = self.governor.summary()
+        if summary:
+            self.progress.message(f"{Fore.YELLOW}[RATE]{Style.RESET_ALL} Throttled requests: {summary}")
+
+    def make_download_pool(self, sessions: YoutubeDLSessionManager,
+                           concurrent_fragment_downloads: int = DEFAULT_CONCURRENT_FRAGMENT_DOWNLOADS,
+                           pipeline: Optional[PostDownloadPipeline] = None) -> YoutubeDLPool:
+        """
+        Creates the pool of YoutubeDL instances shared by all download workers.
+        :param pipeline: If given, downloaded files are handed over to it for re-encoding and verification,
+        otherwise they are verified as part of the yt-dlp download.
+        """
+        hooks = [post_hook, self.journal_hook, self.timing_hook]
+        if pipeline is None:
+            hooks.append(self.verify_output)
+        ydl_opts = make_ydl_opts(output_dir=self.config.output_dir,
+                                 cookiefile=self.config.cookiefile,
+                                 use_browser_cookies=self.config.use_browser_cookies,
+                                 profile=self.profile,
+                                 debug_mode=DEBUG_MODE,
+                                 concurrent_fragment_downloads=concurrent_fragment_downloads,
+                                 progress_hooks=[self.progress.progress_hook, self.download_timing_hook,
+                                                 self.bandwidth.progress_hook],
+                                 postprocessor_hooks=hooks)
+        # Additional user-friendly options
+        ydl_opts.update({
+            "nopart": False,   # keep .part files to allow resuming
+        })
+        journal = self.journal
+
+        def on_create(ydl: YoutubeDL):
+            if journal:
+                ydl.add_post_processor(JournalPP(journal, JournalState.EXTRACTED, ydl), when="pre_process")
+            if pipeline:
+                ydl.add_post_processor(PipelineHandoffPP(pipeline, ydl), when="after_move")
+            elif self.profile.transcode_video:
+                ydl.add_post_processor(CodecAwareConvertorPP(self.transcoder, self.encode_stats, ydl),
+                                       when="post_process")
+        return sessions.get_pool(f"download-{self.profile.name}", ydl_opts, on_create=on_create)
+
+    def journal_hook(self, d: Dict[str, Any]) -> None:
+        """
+        postprocessor hook recording the downloaded and encoded states in the run journal.
+        """
+        state = self._journal_states_by_pp.get((d.get("postprocessor"), d.get("status")))
+        info_dict = d.get("info_dict", {})
+        url = info_dict.get("original_url")
+        if self.journal and state and url:
+            self.journal.record(url, info_dict.get("playlist_id"), state)
+
+    def download_timing_hook(self, d: Dict[str, Any]) -> None:
+        """
+        progress hook adding the download time of finished files to the profile report
+        """
+        if d.get("status") == "finished" and d.get("elapsed") is not None:
+            INSTRUMENTATION.record("download", d["elapsed"])
+
+    def record_stage(self, stage: str, seconds: float, url: Optional[str] = None) -> None:
+        """
+        :param url: URL of the file, if the stage doesn't run in the thread that downloaded it
+        """
+        self.progress.stage(stage, seconds)
+        INSTRUMENTATION.record(stage, seconds, url)
+
+    def timing_hook(self, d: Dict[str, Any]) -> None:
+        """
+        postprocessor hook measuring the encode stage of a download, in the thread of the download.
+        The extract stage is measured by extract_info.
+        """
+        postprocessor, status = d.get("postprocessor"), d.get("status")
+        now = time.perf_counter()
+        if postprocessor in ENCODING_POSTPROCESSORS:
+            if status == "started":
+                self._timings.encode_started = now
+            elif status == "finished" and getattr(self._timings, "encode_started", None) is not None:
+                self.record_stage("encode", now - self._timings.encode_started)
+                self._timings.encode_started = None
+
+    def verify_output(self, d: Dict[str, Any]) -> None:
+        """
+        postprocessor hook to verify the final output file, once it was moved to its final path.
+        """
+        if d.get("postprocessor") != "MoveFiles" or d.get("status") != "finished":
+            return
+        info_dict = d.get("info_dict", {})
+        filepath = info_dict.get("filepath")
+        LOG.debug("Verify output. Filepath: %s", filepath)
+        if not filepath:
+            LOG.debug("Skipping verification — no filepath")
+            return
+
+        with INSTRUMENTATION.span("verify_output"):
+            self.verify_file(DownloadedFile(url=info_dict.get("original_url"),
+                                            playlist_id=info_dict.get("playlist_id"),
+                                            filepath=filepath,
+                                            archive_key=DownloadArchive.key_from_info(info_dict),
+                                            duration=info_dict.get("duration")))
+
+    def verify_file(self, downloaded: DownloadedFile) -> None:
+        """
+        Verifies the output file with ffprobe (video stream and resolution for video profiles, duration, audio)
+        and marks its URL as processed.
+        Used by the verify_output postprocessor hook and by the verify stage of the post-download pipeline.
+        """
+        # Normalize
+        filepath = os.path.abspath(downloaded.filepath)
+
+        if not os.path.exists(filepath):
+            return
+            # raise DownloadError(f"Postprocessor expected output file not found: {filepath}")
+
+        start = time.perf_counter()
+        result = self.verifier.verify(filepath, expected_duration=downloaded.duration)
+        self.record_stage("verify", time.perf_counter() - start, downloaded.url)
+        if not result.ok:
+            problems = ", ".join(result.problems)
+            if self.journal:
+                self.journal.record(downloaded.url, downloaded.playlist_id, JournalState.FAILED,
+                                    filepath=filepath, error=problems)
+            raise DownloadError(f"Output file failed verification ({problems}): {filepath}")
+
+        self.mark_processed(downloaded.url, downloaded.playlist_id, filepath)
+        if self.archive and downloaded.archive_key:
+            self.archive.record(downloaded.archive_key, filepath, verified=True, url=downloaded.url)
+
+    def transcode_file(self, downloaded: DownloadedFile) -> DownloadedFile:
+        """
+        Transcode stage of the post-download pipeline, does what the CodecAwareConvertorPP postprocessor does otherwise.
+        The file is only probed if yt-dlp didn't know the codecs of the selected formats.
+        """
+        start = time.perf_counter()
+        plan, duration = downloaded.transcode_plan, downloaded.duration
+        if plan is None:
+            plan, duration = CodecPolicy.plan_for_file(downloaded.filepath)
+        downloaded.filepath = apply_plan(downloaded.filepath, plan, duration, self.transcoder, self.encode_stats)
+        self.record_stage("encode", time.perf_counter() - start, downloaded.url)
+        if self.journal:
+            self.journal.record(downloaded.url, downloaded.playlist_id, JournalState.ENCODED)
+        return downloaded
+
+    def mark_processed(self, url: str, playlist_id: Optional[str], filepath: Optional[str] = None) -> None:
+        if self.journal:
+            self.journal.record(url, playlist_id, JournalState.VERIFIED, filepath=filepath)
+
+    def needs_download(self, item: DownloadItem, idx: int, total: Optional[int]) -> bool:
+        """
+        :return: False if the item was verified by a previous run or is in the download archive
+        """
+        if self.journal and self.journal.is_finished(item.url, item.playlist_id):
+            return False
+        return not (self.archive and self.skip_if_archived(item, idx, total))
+
+    def skip_if_archived(self, item: DownloadItem, idx: int, total: Optional[int]) -> bool:
+        """
+        Checks the download archive before any yt-dlp call.
+        :return: True if the URL was already downloaded and its file is still present
+        """
+        entry = self.archive.lookup_url(item.url)
+        if not entry:
+            return False
+        self.progress.message(f"{Fore.GREEN}[SKIP]{Style.RESET_ALL} {ProgressUtils.format_count(idx, total)} Already downloaded ({self.profile.name}): {item.url} -> {entry.output_path}")
+        self.mark_processed(item.url, item.playlist_id, entry.output_path)
+        return True
+
+    def extract_info(self, item: DownloadItem) -> Dict[str, Any]:
+        """
+        Extracts the metadata of the URL without selecting formats, see download_url
+        """
+        def extract() -> Dict[str, Any]:
+            with self._ydl_pool.session() as ydl:
+                return ydl.extract_info(item.url, download=False, process=False)
+
+        start = time.perf_counter()
+        info = self.governor.call(item.url, extract)
+        self.record_stage("extract", time.perf_counter() - start, item.url)
+        return info
+
+    def download_url(self, item: DownloadItem, idx: int, total: Optional[int],
+                     info: Optional[Dict[str, Any]] = None) -> None:
+        """
+        Download a YouTube video or playlist using yt-dlp.
+        Playlists that were not expanded up front are expanded by yt-dlp.
+        :param info: Metadata of the URL from extract_info, formats of this profile are selected from a copy of it
+        instead of extracting the URL again.
+        Only the extraction goes through the governor: it's the request to the host of the URL, the transfer of the
+        media is limited by the bandwidth manager and a throttled extraction doesn't restart a transfer.
+        """
+        url = item.url
+        self.bandwidth.wait_for_window()
+        self.progress.message(f"\n{Fore.YELLOW}=== Downloading {ProgressUtils.format_count(idx, total)} ({self.profile.name}): {url} ==={Style.RESET_ALL}")
+        try:
+            with INSTRUMENTATION.span("download_url", key=url):
+                # The entries of playlists extracted here are a one-shot generator, they can't be copied
+                info = self.extract_info(item) if info is None else copy.deepcopy(info)
+                self._download(item, info)
+        except DownloadError as e:
+            self.record_failure(item, e)
+            self.progress.message(f"{Fore.RED}[ERROR]{Style.RESET_ALL} Failed to download {url}: {e}")
+        except Exception as e:
+            self.record_failure(item, e)
+            self.progress.message(f"{Fore.RED}[ERROR]{Style.RESET_ALL} Unexpected error for {url}: {e}")
+
+    def _download(self, item: DownloadItem, info: Dict[str, Any]) -> None:
+        with self._ydl_pool.session() as ydl, self.bandwidth.job(ydl.params):
+            ydl.process_ie_result(info, download=True, extra_info=item.extra_info or {})
+
+    def record_failure(self, item: DownloadItem, error: Exception) -> None:
+        if self.journal:
+            self.journal.record(item.url, item.playlist_id, JournalState.FAILED, error=str(error))
+
+
+def make_governor(config: EngineConfig) -> RequestGovernor:
+    # Throttling lowers the concurrency limit below the number of jobs, it doesn't start lower
+    return RequestGovernor(requests_per_second=config.max_requests_per_second,
+                           max_concurrency=max(config.jobs, DEFAULT_MAX_CONCURRENCY))
+
+
+def make_bandwidth_manager(config: EngineConfig) -> BandwidthManager:
+    return BandwidthManager(max_bandwidth=config.max_bandwidth, schedule=config.bandwidth_schedule,
+                            max_fragments=DEFAULT_CONCURRENT_FRAGMENT_DOWNLOADS)
+
+
+def export_metrics(metrics: ProgressMetrics, config: EngineConfig) -> None:
+    if config.metrics_json:
+        metrics.write_json(config.metrics_json)
+        LOG.info("Wrote metrics of the run to: %s", config.metrics_json)
+    if config.metrics_prometheus:
+        metrics.write_prometheus(config.metrics_prometheus)
+        LOG.info("Wrote metrics of the run to: %s", config.metrics_prometheus)
+
+
+def run_download(args: argparse.Namespace, profile: MediaProfile) -> None:
+    """
+    Main of the download entry points, after they parsed their arguments and picked the profile
+    """
+    LoggingUtils.init_with_basic_config(debug=DEBUG_MODE)
+
+    try:
+        urls = FileUtils.iter_urls(args.urls_file)
+    except FileNotFoundError as e:
+        print(f"{Fore.RED}{e}{Style.RESET_ALL}")
+        sys.exit(2)
+
+    # The file is streamed while the URLs are processed, only the first one is read up front
+    first_url = next(urls, None)
+    if first_url is None:
+        print(f"{Fore.YELLOW}No URLs found in {args.urls_file}{Style.RESET_ALL}")
+        sys.exit(0)
+    urls = itertools.chain([first_url], urls)
+
+    config = EngineConfig.from_args(args)
+    try:
+        with profile_report(args), ProgressReporter(config.progress_interval) as progress:
+            engine = DownloadEngine(profile, config, progress)
+            engine.run(urls)
+    except DownloadError as e:
+        # Download errors of the URLs are handled by the engine, this one is raised while it's opened,
+        # e.g. if ffprobe is not installed
+        print(f"{Fore.RED}{e}{Style.RESET_ALL}")
+        sys.exit(2)
+    export_metrics(progress.metrics, config)
+    ensure_all_processed(engine.journal)
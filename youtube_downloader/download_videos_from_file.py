@@ -1,372 +1,30 @@
 from __future__ import annotations
 
-import collections
-import json
-import logging
-import os
-import subprocess
-import sys
 import argparse
-import pathlib
-import threading
-from collections import defaultdict
-from typing import List, Dict, Any, Optional
-from yt_dlp import YoutubeDL
-from yt_dlp.utils import DownloadError
+from typing import List, Optional
 
-from youtube_downloader.constants import FilePath
-from youtube_downloader.utils import FileUtils, LoggingUtils
+from youtube_downloader.download_engine import VIDEO_MP4, add_engine_arguments, add_transcode_arguments, \
+    run_download, Fore, Style
 
-try:
-    from colorama import init as colorama_init, Fore, Style
-    colorama_init()
-except Exception:
-    # fallback to no color if colorama not installed
-    class _C:
-        def __getattr__(self, _): return ""
-    Fore = Style = _C()
-
-LOCK = threading.Lock()
-DEFAULT_OUTPUT_DIR = os.path.join(os.path.expanduser("~"), "yt-dlp-downloads")
-PROCESSED_URLS = set()
-PROCESSED_PLAYLIST_URLS = defaultdict(list)
-DEBUG_MODE = False
-
-import logging
-LOG = logging.getLogger(__name__)
-
-def make_ydl_opts(output_dir: str,
-                  cookiefile: Optional[str],
-                  use_browser_cookies: bool,
-                  debug_mode=False) -> Dict[str, Any]:
-    # Ensure output_dir exists
-    os.makedirs(output_dir, exist_ok=True)
-
-    # Other formats
-    ### best video + best audio
-    # "format": "bv*+ba/b",
-    # "format": "bv*[height=1080]+ba/b",
-    ### merge into mp4 (container) and force conversion to mp4 (H.264) later
-    # "format": "bestvideo[ext=mp4]+bestaudio[ext=m4a]/mp4", # forces MP4 output
-    ### prefer 1080p video + best audio; fallback to best available
-    # format": "bv*[height=1080]+ba/best",
-    ### merge into mp4 (container) and force conversion to mp4 (H.264) later
-    # "format": "bv*[height=1080]+ba/best",
-    # "format": "bestvideo[ext=mp4]+bestaudio[ext=m4a]/mp4", # forces MP4 output
-    # "format": "bv*+ba/b",
-    log_configs: Dict[str, Any] = {"verbose": False, "quiet": False}
-    if debug_mode:
-        log_configs["verbose"] = True
-        log_configs["quiet"] = False
-        log_configs["extractor_args"] = {
-            'youtube': {  # or the specific extractor name you need
-                'jsc_trace': ['false'] # it's weird but it expects a list and lowercase boolean str.
-            }
-        }
-    ydl_opts: Dict[str, Any] = {
-        # Template: base / playlist_title / title.ext
-        "outtmpl": os.path.join(output_dir, "%(playlist_title)s/%(title)s.%(ext)s"),
-        "ignoreerrors": False,         # continue on errors
-        "noplaylist": False,          # allow playlists
-        "continuedl": True,           # resume partial downloads
-        "retries": 10,                # retry network issues
-        "concurrent_fragment_downloads": 5,
-        "nooverwrites": True,
-        "format": "bestvideo[ext=mp4]+bestaudio[ext=m4a]/mp4",
-        # be a bit quieter about cookies/js runtime if we set extractor args below
-        # "extractor_args": {"youtube": {"player_client": "default"}},
-        # hooks: progress (download), postprocessor events
-        "progress_hooks": [progress_hook],
-        # Fail if merge can't happen
-        # abort if incompatible streams are selected
-        # print a clear FFmpeg error
-        # never produce a silent broken MP4
-        "force_no_merge": False,
-        "merge_output_format": "mp4",
-        "compat_opts": ["force-merge"],
-        "postprocessor_hooks": [post_hook, verify_output],
-
-        # This is to correctly set up Deno JS challenge solver
-        "remote_components": ["ejs:github", 'ejs:npm'], # this is to allow to download JS dependencies for Deno. By default it is false
-    }
-    ydl_opts.update(log_configs)
-
-    # Use browser cookies if requested
-    if use_browser_cookies:
-    # youtube extraction works with many browsers; we use chrome by default
-    # yt-dlp accepts tuple for cookiesfrombrowser
-        ydl_opts["cookiesfrombrowser"] = ("chrome",)
-
-    # If user provided a cookiefile, add it (explicit cookie file takes precedence)
-    if cookiefile:
-        ydl_opts["cookiefile"] = cookiefile
-
-    # Force re-encode to mp4/h264 using ffmpeg postprocessor to avoid silent remux no-video issues
-    ydl_opts["postprocessors"] = [
-        {
-            "key": "FFmpegVideoConvertor",
-            "preferedformat": "mp4",  # re-encode to mp4 (H.264)
-        }
-    ]
-
-    return ydl_opts
-
-# Progress state printed by hooks. We use a lock to avoid interleaving prints
-def progress_hook(status: Dict[str, Any]) -> None:
-    """
-    progress_hook receives dicts from yt-dlp with keys like:
-    - status: "downloading" | "finished" | "error"
-    - filename, downloaded_bytes, total_bytes, eta, speed, percent
-    - info_dict / tmpfilename etc.
-    """
-    with LOCK:
-        st = status.get("status")
-        if st == "downloading":
-            # percent might be None; show bytes
-            percent = status.get("percent")
-            speed = status.get("speed")
-            eta = status.get("eta")
-            filename = status.get("filename") or status.get("tmpfilename") or ""
-            if percent is not None:
-                print(f"{Fore.CYAN}[DL]{Style.RESET_ALL} {percent:.1f}%  {filename}  ETA:{eta}  {format_speed(speed)}")
-            else:
-                print(f"{Fore.CYAN}[DL]{Style.RESET_ALL} {filename}  {format_speed(speed)}")
-        elif st == "finished":
-            filename = status.get("filename") or status.get("tmpfilename") or ""
-            print(f"{Fore.GREEN}[MERGE]{Style.RESET_ALL} Download finished, now post-processing: {filename}")
-            # store the filename for later verification by postprocessor hook
-        elif st == "error":
-            print(f"{Fore.RED}[ERROR]{Style.RESET_ALL} {status}")
-        else:
-            # unknown statuses
-            pass
-
-def format_speed(speed: Optional[float]) -> str:
-    if not speed:
-        return ""
-    # speed is bytes/sec
-    units = ["B/s", "KB/s", "MB/s", "GB/s"]
-    s = float(speed)
-    for u in units:
-        if s < 1024.0:
-            return f"{s:0.1f}{u}"
-        s /= 1024.0
-    return f"{s:.1f}TB/s"
-
-def post_hook(d):
-    LOG.info("post_hook: %s, %s", d["status"], d.get("info_dict", {}).get("filepath"))
-
-def verify_output(d: Dict[str, Any]) -> None:
-    """
-    postprocessor hook to verify the final output file has a video stream.
-    Falls back to recently finished filenames captured from progress_hook.
-    """
-    # Try common keys first
-    # filepath = info.get("filepath") or info.get("filename") or info.get("_filename")
-    info_dict = d.get("info_dict", {})
-    filepath = info_dict.get("filepath")
-    status = d.get("status")
-    playlist_id = info_dict.get("playlist_id")
-
-    if status != "finished":
-        return
-    url = info_dict.get("original_url")
-    LOG.debug("Verify output. Filepath: %s", filepath)
-
-    if not filepath:
-        LOG.debug("Skipping verification — no filepath yet (status=%s)", status)
-        return
-
-    # Only verify MP4 output files
-    if not filepath.lower().endswith(".mp4"):
-        LOG.debug("Skipping verification for file: %s", filepath)
-        return  # skip verification for non-MP4 artifacts
-
-    if not filepath:
-        # Still nothing to verify (best effort) — log and raise to make it loud
-        pass
-        # raise DownloadError(f"verify_output: No filename available in postprocessor info for video: {d.get('id') or d.get('url') or d.get('title')}")
-
-    LOG.debug("Starting verification. Filepath: %s", filepath)
-    # Normalize
-    filepath = os.path.abspath(filepath)
-
-    if not os.path.exists(filepath):
-        return
-        # raise DownloadError(f"Postprocessor expected output file not found: {filepath}")
-
-    # Run ffprobe to get stream info as JSON
-    try:
-        cmd = ["ffprobe", "-v", "error", "-print_format", "json", "-show_streams", filepath]
-        proc = subprocess.run(cmd, capture_output=True, text=True, check=False)
-        if proc.returncode != 0:
-            raise DownloadError(f"ffprobe failed for {filepath}: {proc.stderr.strip()}")
-        probe = json.loads(proc.stdout) if proc.stdout else {}
-    except FileNotFoundError:
-        raise DownloadError("ffprobe not found — please install ffmpeg (ffprobe).")
-    except json.JSONDecodeError:
-        raise DownloadError(f"ffprobe returned invalid JSON for {filepath}")
-
-    streams = probe.get("streams", [])
-    video_streams = [s for s in streams if s.get("codec_type") == "video"]
-    if not video_streams:
-        raise DownloadError(f"Output file has NO video stream: {filepath}")
-
-    # Skip duplicates
-    if playlist_id:
-        PROCESSED_PLAYLIST_URLS[playlist_id].append(url)
-    else:
-        if url in PROCESSED_URLS:
-            return
-        PROCESSED_URLS.add(url)
-    # optional: also check duration > 0, width/height, etc.
-
-
-def download_url(url: str, output_dir: str, idx: int, total: int,
-                 cookiefile: Optional[str], use_browser_cookies: bool) -> None:
-    """
-    Download a YouTube video or playlist using yt-dlp.
-    Automatically expands playlists.
-    :param total_videos:
-    """
-    print(f"\n{Fore.YELLOW}=== Downloading {idx}/{total}: {url} ==={Style.RESET_ALL}")
-
-    ydl_opts = make_ydl_opts(output_dir=output_dir,
-                             cookiefile=cookiefile,
-                             use_browser_cookies=use_browser_cookies,
-                             debug_mode=DEBUG_MODE)
-    # Additional user-friendly options
-    ydl_opts.update({
-        "nopart": False,   # keep .part files to allow resuming
-        "progress_hooks": [progress_hook],
-    })
-
-    try:
-        with YoutubeDL(ydl_opts) as ydl:
-            ydl.download([url])
-    except DownloadError as e:
-        print(f"{Fore.RED}[ERROR]{Style.RESET_ALL} Failed to download {url}: {e}")
-    except Exception as e:
-        print(f"{Fore.RED}[ERROR]{Style.RESET_ALL} Unexpected error for {url}: {e}")
-
-def get_playlist_urls(playlist_url: str) -> list[str]:
-    ydl_opts = {
-        "quiet": True,
-        "skip_download": True,
-        "extract_flat": True,   # IMPORTANT: don't resolve each video, fast listing
-    }
-
-    urls = []
-
-    with YoutubeDL(ydl_opts) as ydl:
-        info = ydl.extract_info(playlist_url, download=False)
-
-        # YouTube playlists store entries under "entries"
-        for entry in info.get("entries", []):
-            if entry is None:
-                continue
-
-            # entry["url"] is a video ID or full URL depending on extractor
-            video_id_or_url = entry.get("url")
-
-            # If it's just an ID, make it a full link
-            if len(video_id_or_url) == 11:  # YouTube video ID length
-                urls.append(f"https://www.youtube.com/watch?v={video_id_or_url}")
-            else:
-                urls.append(video_id_or_url)
-
-    return urls
-
-def extract_playlist_id(url: str) -> str | None:
-    from urllib.parse import urlparse, parse_qs
-    parsed = urlparse(url)
-    query_params = parse_qs(parsed.query)
-    return query_params.get("list", [None])[0]
 
 def build_argparser() -> argparse.ArgumentParser:
     p = argparse.ArgumentParser(description="Download YouTube URLs (one per line) via yt-dlp.")
-    p.add_argument("urls_file", help="Path to the text file containing URLs (one per line).")
-    p.add_argument("output_dir", nargs="?", default=FilePath.DEFAULT_OUTPUT_DIR,
-                   help="Optional output directory (default: YT-DLP-downloads)")
-    p.add_argument("--cookiefile", "-c", default=None,
-                   help="Path to cookies.txt exported from browser (optional).")
-    p.add_argument("--no-browser-cookies", action="store_true",
-                   help="Don't attempt to read cookies from the browser automatically.")
+    add_engine_arguments(p)
     p.add_argument("--no-reencode", action="store_true",
-                   help="Don't force re-encoding to H.264; may result in MP4 with no visible video for VP9 sources.")
+                   help="Never re-encode. By default only VP9 / AV1 video is re-encoded to H.264, "
+                        "H.264 downloads are kept as they are. "
+                        "May result in MP4 with no visible video for VP9 sources.")
+    add_transcode_arguments(p)
     return p
 
 
-def ensure_all_videos_processed(urls: List[str]):
-    videos_by_playlist_id: Dict[str, List[str]] = {}
-    playlist_urls = [url for url in urls if "playlist?" in url]
-    for playlist_url in playlist_urls:
-        # example: https://youtube.com/playlist?list=PLZRRxQcaEjA4qyEuYfAMCazlL0vQDkIj2&si=8vpeWaSLHyCdQ0pr
-        # extract the playlist id: 'PLZRRxQcaEjA4qyEuYfAMCazlL0vQDkIj2'
-        playlist_id = extract_playlist_id(playlist_url)
-        videos_by_playlist_id[playlist_id] = get_playlist_urls(playlist_url)
-
-    # Ensure all files were processed by ffprobe
-    normal_video_urls = set([url for url in urls if "playlist?" not in url])
-    diff = normal_video_urls.difference(PROCESSED_URLS)
-    if diff:
-        raise ValueError("The following URLs result files were not processed by ffprobe: {}".format(diff))
-
-
-    unprocessed = {}
-    found_diff = False
-    for playlist_id, videos in videos_by_playlist_id.items():
-        if playlist_id not in PROCESSED_PLAYLIST_URLS:
-            unprocessed[playlist_id] = videos
-        else:
-            diff = set(videos).difference(set(PROCESSED_PLAYLIST_URLS[playlist_id]))
-            if diff:
-                found_diff = True
-                unprocessed[playlist_id] = diff
-    if found_diff:
-        raise ValueError("The following URLs result files were not processed by ffprobe for playlists: {}".format(unprocessed))
-
-
 def main(argv: Optional[List[str]] = None) -> None:
     args = build_argparser().parse_args(argv)
-    level = LoggingUtils.init_with_basic_config(debug=DEBUG_MODE)
-
-    try:
-        urls = FileUtils.load_urls(args.urls_file)
-    except FileNotFoundError as e:
-        print(f"{Fore.RED}{e}{Style.RESET_ALL}")
-        sys.exit(2)
-
-    if not urls:
-        print(f"{Fore.YELLOW}No URLs found in {args.urls_file}{Style.RESET_ALL}")
-        sys.exit(0)
-
-    # If user asked to skip browser cookies, disable that behavior
-    use_browser_cookies = not args.no_browser_cookies
-
-    # If user disabled re-encode, remove postprocessor from options by toggling in make_ydl_opts
+    profile = VIDEO_MP4
     if args.no_reencode:
-        # We will monkey-patch make_ydl_opts behavior by re-calling it and removing postprocessors
-        ydl_opts_sample = make_ydl_opts(output_dir=args.output_dir, cookiefile=args.cookiefile,
-                                        use_browser_cookies=use_browser_cookies,
-                                        debug_mode=DEBUG_MODE)
-        if "postprocessors" in ydl_opts_sample:
-            del ydl_opts_sample["postprocessors"]
-        # But since download_url builds its own opts, we'll pass a flag via environment variable
-        # Simpler approach: warn the user that no re-encode is set and rely on default in make_ydl_opts
         print(f"{Fore.YELLOW}Warning: No re-encode requested; certain VP9 WebM -> MP4 merges may not display video.{Style.RESET_ALL}")
-
-
-    total = len(urls)
-    for idx, url in enumerate(urls, start=1):
-        download_url(url=url,
-                     output_dir=args.output_dir,
-                     idx=idx,
-                     total=total,
-                     cookiefile=args.cookiefile,
-                     use_browser_cookies=use_browser_cookies)
-
-    ensure_all_videos_processed(urls)
+        profile = profile.without_reencode()
+    run_download(args, profile)
 
 if __name__ == "__main__":
     main()
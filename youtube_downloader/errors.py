@@ -0,0 +1,128 @@
+import enum
+import socket
+from typing import Dict, Optional, Tuple
+
+import requests
+from yt_dlp.utils import DownloadError, GeoRestrictedError
+
+_MINUTE = 60
+_HOUR = 60 * _MINUTE
+_DAY = 24 * _HOUR
+
+
+class FetchErrorClass(enum.Enum):
+    # Private, deleted, removed or non-existent (404) video / page
+    UNAVAILABLE = 'unavailable'
+    GEO_BLOCKED = 'geo-blocked'
+    TIMEOUT = 'timeout'
+    # Too many requests (429), forbidden (403) or a bot check, see governor.RequestGovernor
+    RATE_LIMITED = 'rate-limited'
+    UNKNOWN = 'unknown'
+
+
+# (first retry delay, max retry delay) in seconds, the delay doubles with each failed attempt
+RETRY_BACKOFF: Dict[FetchErrorClass, Tuple[float, float]] = {
+    # Practically permanent, but videos do get published again sometimes
+    FetchErrorClass.UNAVAILABLE: (30 * _DAY, 180 * _DAY),
+    FetchErrorClass.GEO_BLOCKED: (7 * _DAY, 90 * _DAY),
+    FetchErrorClass.TIMEOUT: (10 * _MINUTE, 1 * _DAY),
+    FetchErrorClass.RATE_LIMITED: (10 * _MINUTE, 1 * _DAY),
+    FetchErrorClass.UNKNOWN: (1 * _HOUR, 7 * _DAY),
+}
+
+_UNAVAILABLE_MESSAGES = (
+    "video unavailable",
+    "private video",
+    "this video is private",
+    "has been removed",
+    "account associated with this video has been terminated",
+    "does not exist",
+    "http error 404",
+    "http error 410",
+    "404 client error",
+    "410 client error",
+)
+_GEO_BLOCKED_MESSAGES = (
+    "not available in your country",
+    "not made this video available in your country",
+    "geo restriction",
+    "geo-restricted",
+)
+_RATE_LIMITED_MESSAGES = (
+    "http error 429",
+    "429 client error",
+    "too many requests",
+    "http error 403",
+    "403 client error",
+    # "Sign in to confirm you're not a bot", with a straight or a typographic apostrophe
+    "not a bot",
+)
+_TIMEOUT_MESSAGES = (
+    "timed out",
+    "timeout",
+)
+
+
+class ErrorClassifier:
+    @staticmethod
+    def classify(error: Optional[BaseException]) -> FetchErrorClass:
+        """
+        Classifies a title fetch failure. A None error means the page was fetched but had no title.
+        """
+        if error is None:
+            return FetchErrorClass.UNKNOWN
+        # yt-dlp wraps the extractor error into a DownloadError
+        cause = error.exc_info[1] if isinstance(error, DownloadError) and error.exc_info else None
+        if isinstance(error, GeoRestrictedError) or isinstance(cause, GeoRestrictedError):
+            return FetchErrorClass.GEO_BLOCKED
+        if isinstance(error, (requests.exceptions.Timeout, socket.timeout, TimeoutError)):
+            return FetchErrorClass.TIMEOUT
+        if isinstance(error, requests.exceptions.HTTPError) and error.response is not None:
+            if error.response.status_code in (404, 410):
+                return FetchErrorClass.UNAVAILABLE
+            if error.response.status_code in (403, 429):
+                return FetchErrorClass.RATE_LIMITED
+
+        message = str(error).lower()
+        if any(m in message for m in _GEO_BLOCKED_MESSAGES):
+            return FetchErrorClass.GEO_BLOCKED
+        if any(m in message for m in _RATE_LIMITED_MESSAGES):
+            return FetchErrorClass.RATE_LIMITED
+        if any(m in message for m in _UNAVAILABLE_MESSAGES):
+            return FetchErrorClass.UNAVAILABLE
+        if any(m in message for m in _TIMEOUT_MESSAGES):
+            return FetchErrorClass.TIMEOUT
+        return FetchErrorClass.UNKNOWN
+
+    @staticmethod
+    def retry_after(error: Optional[BaseException]) -> Optional[float]:
+        """
+        :return: Seconds from the Retry-After header of the HTTP error response behind the error, if any
+        """
+        seen = set()
+        while error is not None and id(error) not in seen:
+            seen.add(id(error))
+            response = getattr(error, "response", None)
+            headers = getattr(response, "headers", None)
+            value = headers.get("Retry-After") if headers is not None else None
+            if value is not None:
+                try:
+                    return max(0.0, float(value))
+                except ValueError:
+                    # HTTP date form, rare for rate limiting
+                    return None
+            # yt-dlp wraps errors into DownloadError (exc_info) and ExtractorError (cause)
+            if isinstance(error, DownloadError) and error.exc_info:
+                error = error.exc_info[1]
+            else:
+                error = getattr(error, "cause", None) or error.__cause__
+        return None
+
+    @staticmethod
+    def retry_delay(error_class: FetchErrorClass, attempts: int) -> float:
+        """
+        :param attempts: Number of failed attempts so far, including the last one
+        :return: Seconds to wait before trying again
+        """
+        first_delay, max_delay = RETRY_BACKOFF[error_class]
+        return min(max_delay, first_delay * 2 ** max(0, attempts - 1))
@@ -0,0 +1,98 @@
+import json
+import logging
+import os
+import subprocess
+from typing import Any, Callable, Dict, List, Optional
+
+from yt_dlp.utils import DownloadError
+
+LOG = logging.getLogger(__name__)
+MP4_EXT = "mp4"
+# ffmpeg codec name that copies a stream without re-encoding it
+COPY_CODEC = "copy"
+
+
+class FFmpegUtils:
+    @staticmethod
+    def probe_streams(filepath: str) -> List[Dict[str, Any]]:
+        """
+        Runs ffprobe to get stream info as JSON.
+        :param filepath: Path of the media file
+        :return: List of stream dicts, as reported by ffprobe
+        """
+        return FFmpegUtils.probe(filepath).get("streams", [])
+
+    @staticmethod
+    def probe(filepath: str) -> Dict[str, Any]:
+        """
+        Runs ffprobe to get stream and container info as JSON.
+        :param filepath: Path of the media file
+        :return: ffprobe output with 'streams' and 'format'
+        """
+        try:
+            cmd = ["ffprobe", "-v", "error", "-print_format", "json", "-show_streams", "-show_format", filepath]
+            proc = subprocess.run(cmd, capture_output=True, text=True, check=False)
+            if proc.returncode != 0:
+                raise DownloadError(f"ffprobe failed for {filepath}: {proc.stderr.strip()}")
+            probe = json.loads(proc.stdout) if proc.stdout else {}
+        except FileNotFoundError:
+            raise DownloadError("ffprobe not found — please install ffmpeg (ffprobe).")
+        except json.JSONDecodeError:
+            raise DownloadError(f"ffprobe returned invalid JSON for {filepath}")
+        return probe
+
+    @staticmethod
+    def probe_duration(streams: List[Dict[str, Any]]) -> Optional[float]:
+        """
+        :param streams: Streams reported by probe_streams()
+        :return: Duration of the longest stream in seconds, None if ffprobe reported none
+        """
+        durations = [float(s["duration"]) for s in streams if s.get("duration") not in (None, "N/A")]
+        return max(durations) if durations else None
+
+    @staticmethod
+    def convert_to_mp4(filepath: str, video_codec: str = COPY_CODEC, audio_codec: str = COPY_CODEC,
+                       encoder_args: Optional[List[str]] = None,
+                       on_progress: Optional[Callable[[Dict[str, str]], None]] = None) -> str:
+        """
+        Writes a media file into an MP4 container, encoding each stream with the given ffmpeg encoder
+        or copying it as is with 'copy'. With 'copy' for both, this is a remux without any re-encoding.
+        The source file is replaced by the MP4 file.
+        :param filepath: Path of the downloaded file
+        :param encoder_args: Extra output options, e.g. ['-preset', 'fast', '-crf', '23', '-threads', '4']
+        :param on_progress: Called with each block of ffmpeg -progress key/values, e.g. frame, fps, out_time_us
+        :return: Path of the MP4 file
+        """
+        base, ext = os.path.splitext(filepath)
+        outpath = f"{base}.{MP4_EXT}"
+        # ffmpeg can't write the file it reads
+        tmppath = f"{base}.temp.{MP4_EXT}"
+        LOG.info("Converting video from %s to mp4 (video: %s, audio: %s); Destination: %s",
+                 ext, video_codec, audio_codec, outpath)
+        cmd = ["ffmpeg", "-y", "-loglevel", "error", "-nostats", "-progress", "pipe:1", "-i", filepath,
+               "-map", "0", "-dn", "-ignore_unknown", "-c:v", video_codec, "-c:a", audio_codec,
+               *(encoder_args or []), "-movflags", "+faststart", tmppath]
+        try:
+            proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        except FileNotFoundError:
+            raise DownloadError("ffmpeg not found — please install ffmpeg.")
+        with proc:
+            progress: Dict[str, str] = {}
+            for line in proc.stdout:
+                key, _, value = line.strip().partition("=")
+                progress[key] = value
+                # Each block ends with progress=continue or progress=end
+                if key == "progress":
+                    if on_progress:
+                        on_progress(progress)
+                    progress = {}
+            # Only errors are logged, stderr is small
+            stderr = proc.stderr.read()
+        if proc.returncode != 0:
+            if os.path.exists(tmppath):
+                os.remove(tmppath)
+            raise DownloadError(f"ffmpeg conversion failed for {filepath}: {stderr.strip()}")
+        os.replace(tmppath, outpath)
+        if os.path.abspath(filepath) != os.path.abspath(outpath):
+            os.remove(filepath)
+        return outpath
@@ -1,14 +1,22 @@
 from __future__ import annotations
 
 import argparse
+import itertools
+import logging
 import pathlib
 import sys
 import threading
 from typing import List, Dict, Any, Optional
 
-from youtube_downloader.cache import VideoTitleCache
-from youtube_downloader.service import TitleService, YoutubeOps
-from youtube_downloader.utils import LoggingUtils, FileUtils
+from youtube_downloader.cache import VideoTitleCache, DEFAULT_HOT_CACHE_SIZE
+from youtube_downloader.playlist import PlaylistExpander
+from youtube_downloader.constants import TitleProvider
+from youtube_downloader.governor import RequestGovernor, DEFAULT_REQUESTS_PER_SECOND
+from youtube_downloader.html_utils import HtmlParser
+from youtube_downloader.instrumentation import add_profile_report_arguments, profile_report
+from youtube_downloader.service import TitleService, YoutubeOps, DEFAULT_PER_HOST_LIMIT, DEFAULT_TITLE_TTLS
+from youtube_downloader.utils import LoggingUtils, FileUtils, TimeUtils
+from youtube_downloader.ydl_session import YoutubeDLSessionManager
 
 try:
     from colorama import init as colorama_init, Fore, Style
@@ -19,6 +27,7 @@ except Exception:
         def __getattr__(self, _): return ""
     Fore = Style = _C()
 
+LOG = logging.getLogger(__name__)
 LOCK = threading.Lock()
 
 
@@ -34,6 +43,8 @@ def make_ydl_opts(cookiefile: Optional[str] = None,
         'forcejson': True,      # Force JSON metadata extraction
         'skip_download': True,  # Don't download anything
         'ignore_no_formats_error': True,
+        # Title of the video of watch?v=<id>&list=<playlist> URLs, not of the playlist: they are cached as the video
+        'noplaylist': True,
         # use browser cookies automatically if requested
     }
 
@@ -56,6 +67,34 @@ def build_argparser() -> argparse.ArgumentParser:
                    help="Force download titles, even if title is cached")
     p.add_argument("--no-browser-cookies", action="store_true",
                    help="Don't attempt to read cookies from the browser automatically.")
+    p.add_argument("--jobs", "-j", type=int, default=1,
+                   help="Number of titles to fetch in parallel for URLs that are not cached (default: 1).")
+    p.add_argument("--per-host-limit", type=int, default=DEFAULT_PER_HOST_LIMIT,
+                   help=f"Max number of parallel requests to the same host (default: {DEFAULT_PER_HOST_LIMIT}). "
+                        "Lowered while the host throttles requests.")
+    p.add_argument("--max-requests-per-second", type=float, default=DEFAULT_REQUESTS_PER_SECOND,
+                   help="Max number of requests per second to the same host, lowered while the host throttles "
+                        f"requests (default: {DEFAULT_REQUESTS_PER_SECOND}).")
+    p.add_argument("--refresh-older-than", type=TimeUtils.parse_duration, default=None,
+                   help="Fetch titles again that were cached longer ago than this, e.g. 12h, 7d. "
+                        "Unlike --force-download, fresh titles are still read from the cache.")
+    p.add_argument("--ttl-yt-dlp", type=TimeUtils.parse_duration,
+                   default=DEFAULT_TITLE_TTLS[TitleProvider.YT_DLP],
+                   help="How long titles fetched with yt-dlp are cached, e.g. 30d (default: 30d).")
+    p.add_argument("--ttl-beautifulsoup", type=TimeUtils.parse_duration,
+                   default=DEFAULT_TITLE_TTLS[TitleProvider.BEAUTIFULSOUP],
+                   help="How long scraped page titles are cached, e.g. 7d (default: 7d).")
+    p.add_argument("--retry-failed", action="store_true",
+                   help="Fetch titles of URLs that failed before (unavailable, geo-blocked, timeout), "
+                        "without waiting for their retry time.")
+    p.add_argument("--cache-max-entries", type=int, default=None,
+                   help="Evict least recently used titles above this number of cached titles.")
+    p.add_argument("--cache-max-bytes", type=int, default=None,
+                   help="Evict least recently used titles above this total size of cached titles.")
+    p.add_argument("--cache-memory-entries", type=int, default=DEFAULT_HOT_CACHE_SIZE,
+                   help=f"Number of titles kept in memory in front of the cache database "
+                        f"(default: {DEFAULT_HOT_CACHE_SIZE}).")
+    add_profile_report_arguments(p)
     return p
 
 
@@ -64,24 +103,49 @@ def main(argv: Optional[List[str]] = None) -> None:
     level = LoggingUtils.init_with_basic_config(debug=True)
 
     try:
-        urls = FileUtils.load_urls(args.urls_file)
+        urls = FileUtils.iter_urls(args.urls_file)
     except FileNotFoundError as e:
         print(f"{Fore.RED}{e}{Style.RESET_ALL}")
         sys.exit(2)
 
-    if not urls:
+    # The file is streamed while the URLs are processed, only the first one is read up front
+    first_url = next(urls, None)
+    if first_url is None:
         print(f"{Fore.YELLOW}No URLs found in {args.urls_file}{Style.RESET_ALL}")
         sys.exit(0)
+    urls = itertools.chain([first_url], urls)
 
     # If user asked to skip browser cookies, disable that behavior
     use_browser_cookies = not args.no_browser_cookies
     ydl_opts = make_ydl_opts(use_browser_cookies=use_browser_cookies)
 
-    cache = VideoTitleCache()
-    title_service = TitleService(cache, ydl_opts, force_download=args.force_download)
-    youtube_ops = YoutubeOps(cache, title_service)
-
-    youtube_ops.get_video_titles(urls)
+    ttls = {
+        TitleProvider.YT_DLP: args.ttl_yt_dlp,
+        TitleProvider.BEAUTIFULSOUP: args.ttl_beautifulsoup,
+    }
+    governor = RequestGovernor(requests_per_second=args.max_requests_per_second, max_concurrency=args.per_host_limit)
+    # Page titles scraped outside of the title service count against the same limits
+    HtmlParser.use_governor(governor)
+    with profile_report(args), \
+            VideoTitleCache(max_entries=args.cache_max_entries, max_bytes=args.cache_max_bytes,
+                            hot_cache_size=args.cache_memory_entries) as cache, \
+            YoutubeDLSessionManager() as sessions:
+        playlist_opts = PlaylistExpander.make_ydl_opts(use_browser_cookies=use_browser_cookies)
+        playlist_expander = PlaylistExpander(sessions.get_pool("playlists", playlist_opts), cache=cache,
+                                             governor=governor)
+        with TitleService(cache, ydl_opts, force_download=args.force_download,
+                          workers=args.jobs, per_host_limit=args.per_host_limit,
+                          ydl_pool=sessions.get_pool("titles", ydl_opts),
+                          playlist_expander=playlist_expander,
+                          ttls=ttls,
+                          refresh_older_than=args.refresh_older_than,
+                          retry_failed=args.retry_failed,
+                          governor=governor) as title_service:
+            youtube_ops = YoutubeOps(cache, title_service)
+
+            youtube_ops.get_video_titles(urls)
+    if governor.summary():
+        LOG.info("Throttled requests: %s", governor.summary())
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,233 @@
+import collections
+import contextlib
+import logging
+import random
+import threading
+import time
+from typing import Any, Callable, Deque, Dict, Iterator, Optional, TypeVar
+from urllib.parse import urlparse
+
+from youtube_downloader.errors import ErrorClassifier, FetchErrorClass
+
+LOG = logging.getLogger(__name__)
+T = TypeVar("T")
+
+DEFAULT_REQUESTS_PER_SECOND = 5.0
+# Requests that may start at once after the host was idle
+DEFAULT_BURST = 5
+DEFAULT_MAX_CONCURRENCY = 8
+# Throttled requests are retried this many times, after the cooldown of their host
+DEFAULT_THROTTLE_RETRIES = 3
+MIN_REQUESTS_PER_SECOND = 0.1
+# Multiplicative decrease of the concurrency limit and the rate of a host on a throttled request
+BACKOFF_FACTOR = 0.5
+# Additive increase of the rate of a host on a successful request, in requests / second
+RATE_INCREASE = 0.1
+# Pause of a throttled host, doubles with each throttled request until a request succeeds,
+# unless the host sent a Retry-After header
+DEFAULT_COOLDOWN_SECONDS = 5.0
+MAX_COOLDOWN_SECONDS = 5 * 60.0
+# Requests started in this many seconds are counted for the current rate
+RATE_WINDOW_SECONDS = 10.0
+# Hosts of the same site share one limiter: YouTube throttles all of them together
+_HOST_ALIASES = {
+    "youtu.be": "youtube.com",
+    "m.youtube.com": "youtube.com",
+    "music.youtube.com": "youtube.com",
+    "gaming.youtube.com": "youtube.com",
+    "youtube-nocookie.com": "youtube.com",
+    "www.youtube-nocookie.com": "youtube.com",
+}
+
+
+def retry_sleep(attempt: int, base: float = 1.0, cap: float = 60.0) -> float:
+    """
+    Exponential backoff with full jitter: a random delay up to base * 2 ^ attempt seconds, at most cap.
+    Signature of the yt-dlp retry_sleep_functions, attempt starts at 0.
+    """
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def is_throttled(error: Optional[BaseException]) -> bool:
+    return error is not None and ErrorClassifier.classify(error) == FetchErrorClass.RATE_LIMITED
+
+
+class HostLimiter:
+    """
+    Request limits of one host: a token bucket for the request rate and an AIMD concurrency limit.
+    Successful requests raise the limit by 1 / limit (about 1 per round of requests) and the rate by RATE_INCREASE,
+    a throttled request halves both and pauses the host for a cooldown.
+    Requests that fail for other reasons leave the limits unchanged.
+    """
+    def __init__(self, host: str,
+                 requests_per_second: float = DEFAULT_REQUESTS_PER_SECOND,
+                 burst: int = DEFAULT_BURST,
+                 max_concurrency: int = DEFAULT_MAX_CONCURRENCY):
+        if requests_per_second <= 0 or burst < 1 or max_concurrency < 1:
+            raise ValueError("Requests per second, burst and max concurrency should be positive, got: {}, {}, {}"
+                             .format(requests_per_second, burst, max_concurrency))
+        self.host = host
+        self.max_rate = requests_per_second
+        self.max_concurrency = max_concurrency
+        self.rate = requests_per_second
+        self.limit = float(max_concurrency)
+        self.in_flight = 0
+        self.throttled = 0
+        self._burst = burst
+        self._tokens = float(burst)
+        self._refilled_at = time.monotonic()
+        self._cooldown_until = 0.0
+        self._cooldowns = 0
+        # Requests that started before the last decrease don't decrease the limits again
+        self._decreased_at = 0.0
+        self._started: Deque[float] = collections.deque()
+        self._cond = threading.Condition()
+
+    def acquire(self) -> float:
+        """
+        Blocks until the host may take another request.
+        :return: Start time of the request, to be passed to release()
+        """
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                wait = max(self._cooldown_until - now, (1 - self._tokens) / self.rate)
+                if self.in_flight < int(self.limit) and wait <= 0:
+                    self._tokens -= 1
+                    self.in_flight += 1
+                    self._started.append(now)
+                    return now
+                # Woken up by release() if a request slot frees up
+                self._cond.wait(wait if wait > 0 else None)
+
+    def release(self, started: float, error: Optional[BaseException] = None) -> None:
+        """
+        :param error: Error of the request if it failed, the limits only change if it was throttled
+        """
+        with self._cond:
+            self.in_flight -= 1
+            if error is None:
+                self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+                self.rate = min(self.max_rate, self.rate + RATE_INCREASE)
+                self._cooldowns = 0
+            elif is_throttled(error):
+                self.throttled += 1
+                self._throttle(started, ErrorClassifier.retry_after(error))
+            self._cond.notify_all()
+
+    @contextlib.contextmanager
+    def request(self) -> Iterator[None]:
+        started = self.acquire()
+        try:
+            yield
+        except BaseException as e:
+            self.release(started, e)
+            raise
+        self.release(started)
+
+    def _throttle(self, started: float, retry_after: Optional[float]) -> None:
+        now = time.monotonic()
+        if started >= self._decreased_at:
+            self.limit = max(1.0, self.limit * BACKOFF_FACTOR)
+            self.rate = max(MIN_REQUESTS_PER_SECOND, self.rate * BACKOFF_FACTOR)
+            self._decreased_at = now
+        if retry_after is None:
+            retry_after = min(MAX_COOLDOWN_SECONDS, DEFAULT_COOLDOWN_SECONDS * 2 ** self._cooldowns)
+            self._cooldowns += 1
+        self._cooldown_until = max(self._cooldown_until, now + retry_after)
+        self._tokens = 0.0
+        LOG.warning("Requests to %s are throttled, backing off for %.0fs (limit: %.1f req/s, %d in flight)",
+                    self.host, self._cooldown_until - now, self.rate, int(self.limit))
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self._burst, self._tokens + (now - self._refilled_at) * self.rate)
+        self._refilled_at = now
+
+    @property
+    def current_rate(self) -> float:
+        """
+        Requests started per second in the last RATE_WINDOW_SECONDS
+        """
+        with self._cond:
+            now = time.monotonic()
+            while self._started and self._started[0] < now - RATE_WINDOW_SECONDS:
+                self._started.popleft()
+            return len(self._started) / RATE_WINDOW_SECONDS
+
+    def status(self) -> str:
+        rate = self.current_rate
+        with self._cond:
+            backoff = self._cooldown_until - time.monotonic()
+            return (f"{self.host} {rate:.1f} req/s (limit {self.rate:.1f}/s, "
+                    f"{self.in_flight}/{int(self.limit)} in flight"
+                    + (f", backing off {backoff:.0f}s" if backoff > 0 else "") + ")")
+
+
+class RequestGovernor:
+    """
+    Limits the requests of all title fetchers, scrapers and downloaders of a process to each host.
+    Every request runs through call(), which waits for the HostLimiter of the host of the URL.
+    Throttled requests (HTTP 429 / 403, bot checks) are retried after the cooldown of the host.
+    """
+    def __init__(self,
+                 requests_per_second: float = DEFAULT_REQUESTS_PER_SECOND,
+                 burst: int = DEFAULT_BURST,
+                 max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                 throttle_retries: int = DEFAULT_THROTTLE_RETRIES):
+        """
+        :param requests_per_second: Max request rate of each host, also the rate it starts with
+        :param max_concurrency: Max number of parallel requests to each host, also the limit it starts with
+        """
+        self._requests_per_second = requests_per_second
+        self._burst = burst
+        self._max_concurrency = max_concurrency
+        self._throttle_retries = throttle_retries
+        self._limiters: Dict[str, HostLimiter] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def host_of(url: str) -> str:
+        host = urlparse(url).hostname or ""
+        host = _HOST_ALIASES.get(host, host)
+        return host[len("www."):] if host.startswith("www.") else host
+
+    def limiter(self, url: str) -> HostLimiter:
+        host = self.host_of(url)
+        with self._lock:
+            limiter = self._limiters.get(host)
+            if limiter is None:
+                limiter = self._limiters[host] = HostLimiter(host, self._requests_per_second, self._burst,
+                                                             self._max_concurrency)
+            return limiter
+
+    def call(self, url: str, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """
+        Calls func(*args, **kwargs) as a request to the host of the URL
+        """
+        limiter = self.limiter(url)
+        attempt = 0
+        while True:
+            try:
+                with limiter.request():
+                    return func(*args, **kwargs)
+            except Exception as e:
+                if attempt >= self._throttle_retries or not is_throttled(e):
+                    raise
+                attempt += 1
+                LOG.warning("Throttled by %s, retrying (%d / %d): %s", limiter.host, attempt,
+                            self._throttle_retries, url)
+
+    def status(self) -> str:
+        """
+        Current rate of the hosts with requests in flight or started recently, empty if there are none
+        """
+        with self._lock:
+            limiters = list(self._limiters.values())
+        return "  ".join(limiter.status() for limiter in limiters if limiter.in_flight or limiter.current_rate)
+
+    def summary(self) -> str:
+        with self._lock:
+            limiters = list(self._limiters.values())
+        return ", ".join(f"{limiter.host}: {limiter.throttled} throttled (limit {limiter.rate:.1f} req/s, "
+                         f"{int(limiter.limit)} in flight)" for limiter in limiters if limiter.throttled)
@@ -1,13 +1,214 @@
+import codecs
+import re
+import threading
+from html.parser import HTMLParser
+from typing import Dict, Optional, Tuple
+
 from bs4 import BeautifulSoup
 import requests
+from requests.adapters import HTTPAdapter
+
+from youtube_downloader.governor import RequestGovernor
+from youtube_downloader.instrumentation import INSTRUMENTATION
 
 import logging
 LOG = logging.getLogger(__name__)
 DEFAULT_TIMEOUT_SECONDS = 5
 BS4_HTML_PARSER = "html.parser"
+DEFAULT_CONNECTIONS_PER_HOST = 4
+# Number of hosts that keep their connection pool open
+DEFAULT_POOLED_HOSTS = 32
+STREAM_CHUNK_SIZE = 16 * 1024
+# Stop reading pages that have no </title> in their first bytes
+MAX_TITLE_SCAN_BYTES = 1024 * 1024
+# After the title was found, the rest of the body is read to keep the connection alive if it's at most this big,
+# otherwise the connection is dropped: reading it would take longer than opening a new one
+MAX_DRAIN_BYTES = 64 * 1024
+_TITLE_END_RE = re.compile(rb"</title\s*>", re.IGNORECASE)
+_CHARSET_RE = re.compile(r"charset=[\"']?([\w.:-]+)", re.IGNORECASE)
+# Text HeadTitleExtractor parses before it gives up. HTMLParser keeps script and style content buffered until the
+# end tag arrives and searches it again on each feed, which is quadratic for large inline scripts before the title.
+MAX_PARSED_CHARS = 256 * 1024
+
+
+class HeadTitleExtractor(HTMLParser):
+    """
+    Incremental title parser: feed() it the page in chunks as they arrive and stop feeding once done is True.
+    Done at the first <title> element or og:title meta, whichever comes first, or at <body> if the head had neither.
+    No tree is built, so it's much cheaper than a BeautifulSoup parse of the page.
+    Also done after max_chars of text were fed without finding the title.
+    """
+    def __init__(self, max_chars: int = MAX_PARSED_CHARS):
+        super().__init__(convert_charrefs=True)
+        self._max_chars = max_chars
+        # Number of characters fed so far
+        self.fed = 0
+        self.title: Optional[str] = None
+        # Charset declared by a <meta> tag, if any
+        self.charset: Optional[str] = None
+        self.done = False
+        self._in_title = False
+        self._title_parts = []
+
+    def feed(self, data):
+        if self.done:
+            return
+        self.fed += len(data)
+        super().feed(data)
+        if not self.done and self.fed >= self._max_chars:
+            # The title is taken from a BeautifulSoup parse of what was read, see HtmlParser.fetch_title
+            self.done = True
+
+    def handle_starttag(self, tag, attrs):
+        if self.done:
+            return
+        if tag == "title":
+            self._in_title = True
+        elif tag == "meta":
+            self._handle_meta(dict(attrs))
+        elif tag == "body":
+            self.done = True
+
+    def handle_data(self, data):
+        if self._in_title:
+            self._title_parts.append(data)
+
+    def handle_endtag(self, tag):
+        if tag == "title" and self._in_title:
+            self._in_title = False
+            self.title = "".join(self._title_parts) or None
+            self.done = True
+
+    def _handle_meta(self, attrs: Dict[str, Optional[str]]) -> None:
+        if attrs.get("property") == "og:title" and attrs.get("content"):
+            self.title = attrs["content"]
+            self.done = True
+        elif attrs.get("charset"):
+            self.charset = attrs["charset"]
+        elif (attrs.get("http-equiv") or "").lower() == "content-type":
+            match = _CHARSET_RE.search(attrs.get("content") or "")
+            if match:
+                self.charset = match.group(1)
+
+
+class TitleFetcher:
+    """
+    Fetches the head of HTML pages for title scraping.
+
+    All requests share one requests.Session, so connections are kept alive and reused.
+    Without a governor, the connection pool of each host is bounded and blocking: at most connections_per_host
+    requests run against the same host at once, other threads wait for a free connection.
+    Responses are streamed and only read until the end of the <title> element.
+    """
+    def __init__(self,
+                 connections_per_host: int = DEFAULT_CONNECTIONS_PER_HOST,
+                 timeout: float = DEFAULT_TIMEOUT_SECONDS,
+                 headers: Optional[Dict[str, str]] = None,
+                 governor: Optional[RequestGovernor] = None):
+        """
+        :param governor: If given, requests wait for its rate and concurrency limits of their host
+        and throttled requests are retried
+        """
+        self._timeout = timeout
+        self._governor = governor
+        self._session = requests.Session()
+        if headers:
+            self._session.headers.update(headers)
+        # With a governor, it limits the parallel requests to each host and the pool only keeps connections alive
+        adapter = HTTPAdapter(pool_connections=DEFAULT_POOLED_HOSTS, pool_maxsize=connections_per_host,
+                              pool_block=governor is None)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+
+    def use_governor(self, governor: RequestGovernor) -> None:
+        """
+        Sends the following requests through the governor, the connections of the fetcher are kept.
+        """
+        self._governor = governor
+
+    def close(self) -> None:
+        self._session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def fetch_head(self, url: str, extractor: Optional[HeadTitleExtractor] = None) -> Tuple[bytes, Optional[str]]:
+        """
+        :param extractor: If given, the page is fed to it while it's read and reading stops when it's done.
+        Otherwise reading stops after </title>.
+        :return: The beginning of the page that was read (the whole page if no title was found),
+        and the charset of the Content-Type header if any
+        """
+        if self._governor:
+            return self._governor.call(url, self._fetch_head, url, extractor)
+        return self._fetch_head(url, extractor)
+
+    def _fetch_head(self, url: str, extractor: Optional[HeadTitleExtractor]) -> Tuple[bytes, Optional[str]]:
+        with self._session.get(url, timeout=self._timeout, stream=True) as resp:
+            resp.raise_for_status()
+            match = _CHARSET_RE.search(resp.headers.get("Content-Type", ""))
+            charset = match.group(1) if match else None
+            decoder = self._make_decoder(charset) if extractor else None
+            content = bytearray()
+            found = False
+            for chunk in resp.iter_content(chunk_size=STREAM_CHUNK_SIZE):
+                # Look for the end tag where it may start: it can span two chunks
+                search_from = max(0, len(content) - len(b"</title "))
+                content += chunk
+                if extractor:
+                    extractor.feed(decoder.decode(chunk))
+                    found = extractor.done
+                else:
+                    found = _TITLE_END_RE.search(content, search_from) is not None
+                if found or len(content) >= MAX_TITLE_SCAN_BYTES:
+                    break
+            if found:
+                self._release(resp)
+            return bytes(content), charset
+
+    @staticmethod
+    def _make_decoder(charset: Optional[str]) -> codecs.IncrementalDecoder:
+        try:
+            return codecs.getincrementaldecoder(charset or "utf-8")(errors="replace")
+        except LookupError:
+            return codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+    @staticmethod
+    def _release(resp: requests.Response) -> None:
+        """
+        Reads the rest of a small body, so the connection goes back to the pool instead of being closed.
+        """
+        length = resp.headers.get("Content-Length")
+        if length is None or resp.headers.get("Content-Encoding") or not length.isdigit():
+            return
+        remaining = int(length) - resp.raw.tell()
+        if remaining <= MAX_DRAIN_BYTES:
+            for _ in resp.iter_content(chunk_size=STREAM_CHUNK_SIZE):
+                pass
+
 
 class HtmlParser:
     js_renderer = None
+    # Shared by all threads, created on first use
+    _fetcher: Optional[TitleFetcher] = None
+    # Limits of the requests of the shared fetcher, see use_governor
+    _governor: Optional[RequestGovernor] = None
+    _fetcher_lock = threading.Lock()
+
+    @classmethod
+    def use_governor(cls, governor: RequestGovernor) -> None:
+        """
+        Sends the requests of get_title_from_url and fetch_title without a fetcher through the governor,
+        so they share the limits of the other services of the process, e.g. of the TitleService.
+        The shared fetcher and its connections are kept, requests already running finish with the previous governor.
+        """
+        with cls._fetcher_lock:
+            cls._governor = governor
+            if cls._fetcher is not None:
+                cls._fetcher.use_governor(governor)
 
     @classmethod
     def get_title_from_url(cls, url):
@@ -16,30 +217,71 @@ class HtmlParser:
         :param url:
         :return:
         """
-        LOG.debug("Getting webpage title for URL: {}".format(url))
         try:
-            soup = HtmlParser._create_bs_from_url(url)
+            with INSTRUMENTATION.span("get_title_from_url", key=url):
+                return cls.fetch_title(url)
         except requests.exceptions.ConnectionError as e:
             LOG.error("Failed to get page title from URL: " + url)
             return None
         except requests.exceptions.Timeout as e:
             LOG.error("Failed to get page title from URL (timeout): " + url)
             return None
-        if soup.title is None:
+        except requests.exceptions.HTTPError as e:
+            LOG.error("Failed to get page title from URL (HTTP error: %s): %s", e.response.status_code, url)
             return None
-        title = soup.title.string
+
+    @classmethod
+    def fetch_title(cls, url, fetcher: Optional[TitleFetcher] = None):
+        """
+        Same as get_title_from_url, but request errors (including HTTP error statuses) are raised.
+        Only the beginning of the page is downloaded and parsed, up to the title or og:title meta.
+        BeautifulSoup only parses the page if the fast path found no title.
+        :param fetcher: Fetcher to use instead of the shared one, e.g. with a different connection limit
+        :return: The page title, None if the page has no title
+        """
+        LOG.debug("Getting webpage title for URL: {}".format(url))
+        extractor = HeadTitleExtractor()
+        with INSTRUMENTATION.span("fetch_head"):
+            content, charset = (fetcher or cls._get_fetcher()).fetch_head(url, extractor)
+        title = cls._get_extracted_title(extractor, charset)
+        if title is None:
+            LOG.debug("Falling back to BeautifulSoup for URL: {}".format(url))
+            with INSTRUMENTATION.span("parse_title"):
+                title = cls.parse_title(content, charset)
         LOG.debug("Found webpage title: {}".format(title))
-        return str(title)
+        return title
 
     @staticmethod
-    def _create_bs_from_url(url, headers=None):
-        resp = requests.get(url, headers=headers, timeout=DEFAULT_TIMEOUT_SECONDS)
-        soup = HtmlParser._create_bs(resp.text)
-        return soup
+    def parse_title(content: bytes, charset: Optional[str] = None) -> Optional[str]:
+        """
+        Title of a page with a full BeautifulSoup parse.
+        """
+        soup = BeautifulSoup(content, features=BS4_HTML_PARSER, from_encoding=charset)
+        if soup.title is None or soup.title.string is None:
+            return None
+        return str(soup.title.string)
 
     @staticmethod
-    def _create_bs(html) -> BeautifulSoup:
-        return BeautifulSoup(html, features=BS4_HTML_PARSER)
+    def _get_extracted_title(extractor: HeadTitleExtractor, charset: Optional[str]) -> Optional[str]:
+        if extractor.title is None:
+            return None
+        if not charset and extractor.charset:
+            # The page was decoded as UTF-8, that's only right if the page says so
+            try:
+                if codecs.lookup(extractor.charset).name not in ("utf-8", "ascii"):
+                    return None
+            except LookupError:
+                return None
+        return extractor.title
+
+    @classmethod
+    def _get_fetcher(cls) -> TitleFetcher:
+        with cls._fetcher_lock:
+            if cls._fetcher is None:
+                if cls._governor is None:
+                    cls._governor = RequestGovernor(max_concurrency=DEFAULT_CONNECTIONS_PER_HOST)
+                cls._fetcher = TitleFetcher(governor=cls._governor)
+            return cls._fetcher
 
     @classmethod
     def get_title_from_url_with_js(cls, url):
@@ -0,0 +1,202 @@
+import argparse
+import contextlib
+import cProfile
+import json
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Iterator, List, Optional
+
+from youtube_downloader.constants import FilePath
+from youtube_downloader.progress import summarize
+
+LOG = logging.getLogger(__name__)
+PROFILE_REPORT_FILE = "profile_report.json"
+CPROFILE_DUMP_FILE = "profile.pstats"
+# Functions listed in the log by cumulative time, the dump has all of them
+CPROFILE_TOP_FUNCTIONS = 30
+# cProfile is built on sys.monitoring since Python 3.12: a single profiler sees every thread,
+# before that a profiler only sees the thread that enabled it
+_PROCESS_WIDE_CPROFILE = sys.version_info >= (3, 12)
+# Returned by Instrumentation.span while disabled, no state: entered by any number of threads at once
+_NO_SPAN = contextlib.nullcontext()
+
+
+class _Span:
+    """
+    Timed section of a thread, see Instrumentation.span
+    """
+    __slots__ = ("_instrumentation", "_name", "_key", "_parent_key", "_start")
+
+    def __init__(self, instrumentation: 'Instrumentation', name: str, key: Optional[str]):
+        self._instrumentation = instrumentation
+        self._name = name
+        self._key = key
+
+    def __enter__(self):
+        local = self._instrumentation._local
+        self._parent_key = getattr(local, "key", None)
+        if self._key is None:
+            self._key = self._parent_key
+        local.key = self._key
+        self._instrumentation._start_thread_profiler()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        seconds = time.perf_counter() - self._start
+        self._instrumentation._stop_thread_profiler()
+        self._instrumentation._local.key = self._parent_key
+        self._instrumentation.record(self._name, seconds, self._key)
+
+
+class Instrumentation:
+    """
+    Opt-in timing of the hot paths: extraction, download, encode, ffprobe and title fetching.
+    Disabled by default, span() then returns a shared no-op context manager, so instrumented code only pays for
+    one attribute check and a with statement.
+    Span timings are collected by name, in total and per key (the URL of the download or title fetch).
+    Spans without a key belong to the key of the enclosing span of the same thread, so postprocessor hooks and
+    helper functions don't need to know the URL. Optionally each thread is profiled with cProfile while it runs
+    a span, threads are otherwise idle or waiting on the scheduler (on Python 3.12+ the whole run is profiled).
+    """
+    def __init__(self):
+        self.enabled = False
+        self._cprofile = False
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._seconds: Dict[str, List[float]] = defaultdict(list)
+        self._seconds_by_key: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+        self._profilers: List[cProfile.Profile] = []
+
+    def enable(self, cprofile: bool = False) -> None:
+        """
+        :param cprofile: Also profile threads with cProfile while they run a span
+        """
+        self._cprofile = cprofile and not _PROCESS_WIDE_CPROFILE
+        if cprofile and _PROCESS_WIDE_CPROFILE:
+            profiler = cProfile.Profile()
+            self._profilers.append(profiler)
+            profiler.enable()
+        self.enabled = True
+
+    def disable(self) -> None:
+        self.enabled = False
+        if _PROCESS_WIDE_CPROFILE:
+            for profiler in self._profilers:
+                profiler.disable()
+
+    def span(self, name: str, key: Optional[str] = None):
+        """
+        Context manager timing the with block as the span called name.
+        :param key: URL the span belongs to, defaults to the key of the enclosing span of the thread
+        """
+        if not self.enabled:
+            return _NO_SPAN
+        return _Span(self, name, key)
+
+    def record(self, name: str, seconds: float, key: Optional[str] = None) -> None:
+        """
+        Records a span that was timed by the caller, e.g. between two yt-dlp hook calls.
+        :param key: Defaults to the key of the enclosing span of the thread
+        """
+        if not self.enabled:
+            return
+        if key is None:
+            key = getattr(self._local, "key", None)
+        with self._lock:
+            self._seconds[name].append(seconds)
+            if key is not None:
+                self._seconds_by_key[key][name] += seconds
+
+    def report(self) -> Dict:
+        with self._lock:
+            return {
+                "spans": {name: summarize(values) for name, values in sorted(self._seconds.items())},
+                "urls": {key: dict(spans) for key, spans in self._seconds_by_key.items()},
+            }
+
+    def write_report(self, session_dir: str) -> str:
+        """
+        Writes the span timings and the cProfile stats of the threads, if profiled, to the session directory
+        :return: Path of the report
+        """
+        report = self.report()
+        for name, summary in report["spans"].items():
+            LOG.info("Span %s: %d calls, %.3fs in total, p50: %.3fs, p90: %.3fs, p99: %.3fs, max: %.3fs",
+                     name, summary["count"], summary["sum"], summary["p50"], summary["p90"], summary["p99"],
+                     summary["max"])
+        path = os.path.join(session_dir, PROFILE_REPORT_FILE)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        LOG.info("Wrote profile report to: %s", path)
+        stats = self._merged_cprofile_stats()
+        if stats:
+            dump_path = os.path.join(session_dir, CPROFILE_DUMP_FILE)
+            stats.dump_stats(dump_path)
+            LOG.info("Wrote cProfile stats to: %s, e.g. open it with: python -m pstats %s", dump_path, dump_path)
+            stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(CPROFILE_TOP_FUNCTIONS)
+        return path
+
+    def _start_thread_profiler(self) -> None:
+        depth = getattr(self._local, "depth", 0)
+        self._local.depth = depth + 1
+        if not self._cprofile or depth:
+            return
+        profiler = getattr(self._local, "profiler", None)
+        if profiler is None:
+            profiler = self._local.profiler = cProfile.Profile()
+            with self._lock:
+                self._profilers.append(profiler)
+        profiler.enable()
+
+    def _stop_thread_profiler(self) -> None:
+        self._local.depth -= 1
+        profiler = getattr(self._local, "profiler", None)
+        if profiler is not None and not self._local.depth:
+            profiler.disable()
+
+    def _merged_cprofile_stats(self) -> Optional[pstats.Stats]:
+        with self._lock:
+            profilers = list(self._profilers)
+        if not profilers:
+            return None
+        stats = pstats.Stats(profilers[0])
+        for profiler in profilers[1:]:
+            stats.add(profiler)
+        return stats
+
+
+# Shared by all modules, enabled by the --profile-report option of the entry points
+INSTRUMENTATION = Instrumentation()
+
+
+def add_profile_report_arguments(p: argparse.ArgumentParser) -> None:
+    p.add_argument("--profile-report", action="store_true",
+                   help="Time extraction, download, encode, ffprobe and title fetching of every URL and write "
+                        "per-URL and aggregate timings (p50 / p90 / p99) to the session directory under "
+                        f"{FilePath.SESSIONS_DIR}.")
+    p.add_argument("--profile-cprofile", action="store_true",
+                   help=f"With --profile-report, also profile the workers with cProfile and dump the stats "
+                        f"to {CPROFILE_DUMP_FILE} in the session directory.")
+
+
+@contextlib.contextmanager
+def profile_report(args: argparse.Namespace) -> Iterator[None]:
+    """
+    Collects span timings while the with block runs and writes the report at the end, even if the run failed,
+    if the arguments (see add_profile_report_arguments) ask for it
+    """
+    if not args.profile_report:
+        yield
+        return
+    INSTRUMENTATION.enable(cprofile=args.profile_cprofile)
+    try:
+        yield
+    finally:
+        INSTRUMENTATION.disable()
+        INSTRUMENTATION.write_report(FilePath.get_session_dir())
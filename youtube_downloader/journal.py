@@ -0,0 +1,181 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from enum import Enum
+from typing import Any, Dict, List, Optional, Tuple
+
+from yt_dlp.postprocessor.common import PostProcessor
+
+from youtube_downloader.constants import FilePath
+from youtube_downloader.playlist import ExpandedPlaylist, PlaylistEntry
+
+LOG = logging.getLogger(__name__)
+# (playlist id or None, URL): the same video may be downloaded once per playlist
+JournalKey = Tuple[Optional[str], str]
+
+
+class JournalState(Enum):
+    QUEUED = 'queued'
+    EXTRACTED = 'extracted'
+    DOWNLOADED = 'downloaded'
+    ENCODED = 'encoded'
+    VERIFIED = 'verified'
+    FAILED = 'failed'
+
+    @classmethod
+    def values(cls):
+        return [s.value for s in cls]
+
+
+# Order of the states of a successful download. A URL never goes back in this order,
+# except when it's queued again (a new attempt) or it fails.
+_PROGRESS_ORDER = [JournalState.QUEUED, JournalState.EXTRACTED, JournalState.DOWNLOADED,
+                   JournalState.ENCODED, JournalState.VERIFIED]
+_RANK = {state: rank for rank, state in enumerate(_PROGRESS_ORDER)}
+
+
+class RunJournal:
+    """
+    Append-only log of the state of every URL of a download run, one JSON object per line.
+    There is one journal per URL file and output directory, so a killed run can be resumed:
+    replaying the journal tells which URLs are finished and which playlists were already listed.
+
+    Lines are flushed as they are written, so only the line being written is lost if the process is killed.
+    A torn last line is skipped on replay.
+    """
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        self._lock = threading.Lock()
+        self._states: Dict[JournalKey, JournalState] = {}
+        self._playlists: Dict[str, ExpandedPlaylist] = {}
+        self._file = None
+
+    @staticmethod
+    def path_for_run(urls_file: str, output_dir: str, journal_dir: str = FilePath.RUN_JOURNAL_DIR,
+                     profile: Optional[str] = None) -> str:
+        """
+        :param profile: Media profile with journals of its own, None for video downloads
+        """
+        run_id = hashlib.sha1("\0".join([os.path.abspath(urls_file), os.path.abspath(output_dir)])
+                              .encode("utf-8")).hexdigest()[:12]
+        name = os.path.basename(urls_file) + (f"-{profile}" if profile else "")
+        return os.path.join(journal_dir, f"{name}-{run_id}.jsonl")
+
+    def open(self, resume: bool = False) -> 'RunJournal':
+        """
+        :param resume: Replay the existing journal and append to it. Otherwise a new, empty journal is started.
+        """
+        os.makedirs(os.path.dirname(self.file_path) or ".", exist_ok=True)
+        if resume and os.path.exists(self.file_path):
+            self._replay()
+            LOG.info("Resuming run journal %s: %d URLs, %d finished, %d playlists",
+                     self.file_path, len(self._states), len(self._states) - len(self.unfinished()),
+                     len(self._playlists))
+        # Line buffered: every record reaches the OS as soon as it's written
+        self._file = open(self.file_path, "a" if resume else "w", encoding="utf-8", buffering=1)
+        if resume and self._file.tell() > 0 and not self._ends_with_newline():
+            # Terminate the torn line of a killed run, so the next record starts on its own line
+            self._file.write("\n")
+        return self
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def record(self, url: str, playlist_id: Optional[str], state: JournalState, **details: Any) -> bool:
+        """
+        :param details: Extra fields of the line, e.g. filepath or error
+        :return: False if the record was dropped because the URL is already further along
+        """
+        key = (playlist_id, url)
+        with self._lock:
+            current = self._states.get(key)
+            if current in _RANK and state in _RANK and state is not JournalState.QUEUED \
+                    and _RANK[state] <= _RANK[current]:
+                return False
+            self._states[key] = state
+            self._write({"t": round(time.time(), 3), "url": url, "playlist_id": playlist_id,
+                         "state": state.value, **details})
+        return True
+
+    def record_playlist(self, playlist: ExpandedPlaylist) -> None:
+        with self._lock:
+            self._playlists[playlist.url] = playlist
+            self._write({"t": round(time.time(), 3), "playlist": {
+                "url": playlist.url,
+                "id": playlist.playlist_id,
+                "title": playlist.title,
+                "entries": [[e.video_id, e.url, e.title, e.duration] for e in playlist.entries],
+            }})
+
+    def playlist(self, url: str) -> Optional[ExpandedPlaylist]:
+        """
+        :return: The listing of the playlist recorded in this journal, if any
+        """
+        with self._lock:
+            return self._playlists.get(url)
+
+    def state(self, url: str, playlist_id: Optional[str] = None) -> Optional[JournalState]:
+        with self._lock:
+            return self._states.get((playlist_id, url))
+
+    def is_finished(self, url: str, playlist_id: Optional[str] = None) -> bool:
+        return self.state(url, playlist_id) is JournalState.VERIFIED
+
+    def unfinished(self) -> Dict[JournalKey, JournalState]:
+        with self._lock:
+            return {key: state for key, state in self._states.items() if state is not JournalState.VERIFIED}
+
+    def _write(self, record: Dict[str, Any]) -> None:
+        if self._file is None:
+            raise ValueError("Run journal is not open: {}".format(self.file_path))
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def _ends_with_newline(self) -> bool:
+        with open(self.file_path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+
+    def _replay(self) -> None:
+        with open(self.file_path, encoding="utf-8") as f:
+            for line_no, line in enumerate(f, start=1):
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    LOG.warning("Skipping unreadable line %d of run journal %s", line_no, self.file_path)
+                    continue
+                if "playlist" in record:
+                    p = record["playlist"]
+                    self._playlists[p["url"]] = ExpandedPlaylist(
+                        playlist_id=p["id"], url=p["url"], title=p["title"],
+                        entries=[PlaylistEntry(*entry) for entry in p["entries"]])
+                elif record.get("state") in JournalState.values():
+                    self._states[(record.get("playlist_id"), record["url"])] = JournalState(record["state"])
+
+
+class JournalPP(PostProcessor):
+    """
+    yt-dlp postprocessor that records a state of the processed URL in the run journal.
+    Registered with when='pre_process' it records that the URL was extracted.
+    """
+    def __init__(self, journal: RunJournal, state: JournalState, downloader=None):
+        super().__init__(downloader)
+        self._journal = journal
+        self._state = state
+
+    def run(self, info):
+        url = info.get("original_url")
+        if url:
+            self._journal.record(url, info.get("playlist_id"), self._state)
+        return [], info
@@ -0,0 +1,150 @@
+import logging
+import os
+import queue
+import threading
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+from yt_dlp.postprocessor.common import PostProcessor
+
+from youtube_downloader.archive import ArchiveKey, DownloadArchive
+from youtube_downloader.codec_policy import CodecPolicy, TranscodePlan
+
+LOG = logging.getLogger(__name__)
+DEFAULT_TRANSCODE_WORKERS = max(1, (os.cpu_count() or 2) // 2)
+DEFAULT_TRANSCODE_QUEUE_DEPTH = 2
+DEFAULT_VERIFY_WORKERS = 2
+DEFAULT_VERIFY_QUEUE_DEPTH = 8
+
+_STOP = object()
+
+
+@dataclass
+class DownloadedFile:
+    url: str
+    playlist_id: Optional[str]
+    filepath: str
+    # (extractor, video id) to record in the download archive once verified
+    archive_key: Optional[ArchiveKey] = None
+    # From the formats yt-dlp selected, None if their codecs are not known and the file has to be probed
+    transcode_plan: Optional[TranscodePlan] = None
+    duration: Optional[float] = None
+
+
+class Stage:
+    """
+    A named pool of worker threads consuming a bounded queue.
+    submit() blocks while the queue is full, this is what gives backpressure to the previous stage.
+    The handler returns the item to pass to the next stage, or None to stop processing the item.
+    """
+    def __init__(self, name: str,
+                 handler: Callable[[Any], Any],
+                 workers: int,
+                 queue_depth: int,
+                 next_stage: Optional['Stage'] = None):
+        if workers < 1:
+            raise ValueError("Stage '{}' needs at least 1 worker, got: {}".format(name, workers))
+        if queue_depth < 1:
+            raise ValueError("Stage '{}' needs a queue depth of at least 1, got: {}".format(name, queue_depth))
+        self.name = name
+        self._handler = handler
+        self._workers = workers
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_depth)
+        self._next_stage = next_stage
+        self._threads: List[threading.Thread] = []
+
+    def start(self):
+        for i in range(self._workers):
+            t = threading.Thread(target=self._run, name=f"{self.name}_{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def submit(self, item) -> None:
+        self._queue.put(item)
+
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+    def close(self) -> None:
+        """
+        Waits for all queued items to be processed, then stops the workers.
+        """
+        for _ in self._threads:
+            self._queue.put(_STOP)
+        for t in self._threads:
+            t.join()
+        self._threads = []
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            try:
+                result = self._handler(item)
+            except Exception:
+                LOG.exception("Stage '%s' failed to process item: %s", self.name, item)
+                continue
+            if result is not None and self._next_stage:
+                self._next_stage.submit(result)
+
+
+class PostDownloadPipeline:
+    """
+    Runs the CPU heavy work after a download (transcode, then verify) on separate worker pools,
+    so download workers can start on the next URL while the previous file is being encoded.
+    """
+    def __init__(self,
+                 transcode: Callable[[DownloadedFile], Optional[DownloadedFile]],
+                 verify: Callable[[DownloadedFile], None],
+                 transcode_workers: int = DEFAULT_TRANSCODE_WORKERS,
+                 transcode_queue_depth: int = DEFAULT_TRANSCODE_QUEUE_DEPTH,
+                 verify_workers: int = DEFAULT_VERIFY_WORKERS,
+                 verify_queue_depth: int = DEFAULT_VERIFY_QUEUE_DEPTH):
+        self._verify_stage = Stage("verify", verify, verify_workers, verify_queue_depth)
+        self._transcode_stage = Stage("transcode", transcode, transcode_workers, transcode_queue_depth,
+                                      next_stage=self._verify_stage)
+
+    def __enter__(self):
+        self._verify_stage.start()
+        self._transcode_stage.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def submit(self, downloaded: DownloadedFile) -> None:
+        self._transcode_stage.submit(downloaded)
+
+    def queue_depths(self) -> Dict[str, int]:
+        """
+        Number of files waiting in each stage
+        """
+        return {stage.name: stage.qsize() for stage in (self._transcode_stage, self._verify_stage)}
+
+    def close(self) -> None:
+        # Order matters: transcode workers may still push to the verify stage
+        self._transcode_stage.close()
+        self._verify_stage.close()
+
+
+class PipelineHandoffPP(PostProcessor):
+    """
+    yt-dlp postprocessor that hands the downloaded file over to the post-download pipeline.
+    Should be registered with when='after_move' so the final filepath is known.
+    Blocks the download worker while the transcode queue is full.
+    """
+    def __init__(self, pipeline: PostDownloadPipeline, downloader=None):
+        super().__init__(downloader)
+        self._pipeline = pipeline
+
+    def run(self, info):
+        filepath = info.get("filepath")
+        if filepath:
+            self._pipeline.submit(DownloadedFile(url=info.get("original_url"),
+                                                 playlist_id=info.get("playlist_id"),
+                                                 filepath=filepath,
+                                                 archive_key=DownloadArchive.key_from_info(info),
+                                                 transcode_plan=CodecPolicy.plan_for_info(info),
+                                                 duration=info.get("duration")))
+        return [], info
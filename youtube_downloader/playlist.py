@@ -0,0 +1,174 @@
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional
+from urllib.parse import urlparse, parse_qs
+
+from youtube_downloader.cache import VideoTitleCache, CacheEntry
+from youtube_downloader.constants import TitleProvider
+from youtube_downloader.governor import RequestGovernor
+from youtube_downloader.ydl_session import YoutubeDLPool
+
+LOG = logging.getLogger(__name__)
+YOUTUBE_VIDEO_ID_LENGTH = 11
+# Titles of flat listing entries of videos that can't be watched, not the title of the video
+PLACEHOLDER_TITLES = {"[Private video]", "[Deleted video]", "[Unavailable video]"}
+
+
+@dataclass
+class PlaylistEntry:
+    video_id: Optional[str]
+    url: str
+    title: Optional[str]
+    duration: Optional[float]
+
+    @property
+    def has_title(self) -> bool:
+        """
+        False if the listing has no real title of the video: a placeholder like '[Private video]',
+        or an entry without an id or duration
+        """
+        return bool(self.title) and self.title not in PLACEHOLDER_TITLES \
+            and self.video_id is not None and self.duration is not None
+
+
+@dataclass
+class ExpandedPlaylist:
+    playlist_id: str
+    url: str
+    title: Optional[str]
+    entries: List[PlaylistEntry]
+
+    def extra_info(self, index: int) -> Dict[str, Any]:
+        """
+        Playlist fields for YoutubeDL.extract_info(extra_info=...), so an entry downloaded on its own
+        still gets the playlist based output template and the playlist_id in postprocessor hooks.
+        :param index: 1-based index of the entry in the playlist
+        """
+        return {
+            "playlist": self.title,
+            "playlist_id": self.playlist_id,
+            "playlist_title": self.title,
+            "playlist_index": index,
+            "n_entries": len(self.entries),
+        }
+
+
+class PlaylistExpander:
+    """
+    Lists the entries of playlists with a single flat extraction per playlist
+    (no metadata request for each video) and records every entry's title in the title cache in bulk.
+    Expanded playlists are kept for the run, so the title and download paths share one listing.
+    """
+    def __init__(self, ydl_pool: YoutubeDLPool, cache: Optional[VideoTitleCache] = None,
+                 governor: Optional[RequestGovernor] = None):
+        """
+        :param ydl_pool: Pool created from make_ydl_opts()
+        :param governor: Rate and concurrency limits of the listings, shared with the title and download requests
+        to the same hosts. Listings are not limited if not given.
+        """
+        self._ydl_pool = ydl_pool
+        self._cache = cache
+        self._governor = governor
+        self._lock = threading.Lock()
+        self._playlists: Dict[str, ExpandedPlaylist] = {}
+
+    @staticmethod
+    def make_ydl_opts(cookiefile: Optional[str] = None, use_browser_cookies: bool = False) -> Dict[str, Any]:
+        ydl_opts: Dict[str, Any] = {
+            "quiet": True,
+            "skip_download": True,
+            "extract_flat": "in_playlist",   # IMPORTANT: don't resolve each video, fast listing
+        }
+        if use_browser_cookies:
+            ydl_opts["cookiesfrombrowser"] = ("chrome",)
+        if cookiefile:
+            ydl_opts["cookiefile"] = cookiefile
+        return ydl_opts
+
+    @staticmethod
+    def is_playlist_url(url: str) -> bool:
+        # example: https://youtube.com/playlist?list=PLZRRxQcaEjA4qyEuYfAMCazlL0vQDkIj2&si=8vpeWaSLHyCdQ0pr
+        return "playlist?" in url
+
+    @staticmethod
+    def extract_playlist_id(url: str) -> str | None:
+        # extract the playlist id: 'PLZRRxQcaEjA4qyEuYfAMCazlL0vQDkIj2'
+        parsed = urlparse(url)
+        query_params = parse_qs(parsed.query)
+        return query_params.get("list", [None])[0]
+
+    @property
+    def expanded(self) -> Dict[str, ExpandedPlaylist]:
+        """
+        Playlists expanded so far by playlist URL
+        """
+        with self._lock:
+            return dict(self._playlists)
+
+    def expand_all(self, urls: Iterable[str]) -> Dict[str, ExpandedPlaylist]:
+        """
+        Expands all playlist URLs of the list. Playlists that can't be listed are logged and left out.
+        :return: Expanded playlists by playlist URL
+        """
+        result = {}
+        for url in urls:
+            if not self.is_playlist_url(url):
+                continue
+            try:
+                result[url] = self.expand(url)
+            except Exception as e:
+                LOG.error("Failed to list playlist %s: %s", url, e)
+        return result
+
+    def expand(self, url: str) -> ExpandedPlaylist:
+        with self._lock:
+            if url in self._playlists:
+                return self._playlists[url]
+
+        LOG.info("Listing playlist: %s", url)
+        info = self._governor.call(url, self._list, url) if self._governor else self._list(url)
+
+        entries = []
+        # YouTube playlists store entries under "entries"
+        for entry in info.get("entries") or []:
+            if entry is None:
+                continue
+            # entry["url"] is a video ID or full URL depending on extractor
+            video_id_or_url = entry.get("url") or entry.get("id")
+            if not video_id_or_url:
+                continue
+            # If it's just an ID, make it a full link
+            if len(video_id_or_url) == YOUTUBE_VIDEO_ID_LENGTH:
+                entry_url = f"https://www.youtube.com/watch?v={video_id_or_url}"
+            else:
+                entry_url = video_id_or_url
+            entries.append(PlaylistEntry(video_id=entry.get("id"),
+                                         url=entry_url,
+                                         title=entry.get("title"),
+                                         duration=entry.get("duration")))
+
+        playlist = ExpandedPlaylist(playlist_id=info.get("id") or self.extract_playlist_id(url),
+                                    url=url,
+                                    title=info.get("title"),
+                                    entries=entries)
+        LOG.info("Playlist '%s' has %d entries", playlist.title, len(entries))
+        self._record_titles(playlist)
+        with self._lock:
+            self._playlists[url] = playlist
+        return playlist
+
+    def _list(self, url: str) -> Dict[str, Any]:
+        with self._ydl_pool.session() as ydl:
+            return ydl.extract_info(url, download=False)
+
+    def _record_titles(self, playlist: ExpandedPlaylist) -> None:
+        if self._cache is None:
+            return
+        provider = TitleProvider.YT_DLP.value
+        cache_entries = {e.url: CacheEntry(title=e.title, video_id=e.video_id, duration=e.duration, provider=provider)
+                         for e in playlist.entries if e.has_title}
+        if playlist.title:
+            cache_entries[playlist.url] = CacheEntry(title=playlist.title, video_id=playlist.playlist_id,
+                                                     provider=provider)
+        self._cache.put_entries(cache_entries)
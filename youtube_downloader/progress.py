@@ -0,0 +1,352 @@
+import json
+import logging
+import math
+import queue
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import Any, Callable, Dict, List, Optional, TextIO, Tuple
+
+try:
+    from colorama import Fore, Style
+except Exception:
+    # fallback to no color if colorama not installed
+    class _C:
+        def __getattr__(self, _): return ""
+    Fore = Style = _C()
+
+LOG = logging.getLogger(__name__)
+DEFAULT_REFRESH_INTERVAL = 0.5
+METRIC_PREFIX = "youtube_downloader"
+# Quantiles of the stage latencies in the exported metrics
+EXPORTED_QUANTILES = (0.5, 0.9, 0.99)
+
+
+class EventKind(Enum):
+    # yt-dlp progress tick of a download
+    DOWNLOADING = "downloading"
+    DOWNLOAD_FINISHED = "download_finished"
+    DOWNLOAD_ERROR = "download_error"
+    # Latency of a stage of a URL: extract, download, encode, verify
+    STAGE = "stage"
+    # Line to print above the progress display
+    MESSAGE = "message"
+
+    @classmethod
+    def values(cls):
+        return [k.value for k in cls]
+
+
+# (kind, job, time, payload), the job of download events is the file being downloaded.
+# Plain tuples: hooks run on every progress tick of every download worker
+ProgressEvent = Tuple[EventKind, str, float, Any]
+
+
+def format_speed(speed: Optional[float]) -> str:
+    if not speed:
+        return ""
+    # speed is bytes/sec
+    units = ["B/s", "KB/s", "MB/s", "GB/s"]
+    s = float(speed)
+    for u in units:
+        if s < 1024.0:
+            return f"{s:0.1f}{u}"
+        s /= 1024.0
+    return f"{s:.1f}TB/s"
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """
+    Nearest-rank percentile of the values, q is between 0 and 1
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+
+def summarize(values: List[float]) -> Dict[str, Optional[float]]:
+    """
+    Count, sum, max and the EXPORTED_QUANTILES of the values, e.g. {"count": 3, ..., "p50": 1.5, "p90": 2.0}
+    """
+    summary = {"count": len(values), "sum": sum(values), "max": max(values) if values else None}
+    for q in EXPORTED_QUANTILES:
+        summary[f"p{int(q * 100)}"] = percentile(values, q)
+    return summary
+
+
+@dataclass
+class JobProgress:
+    """
+    A file being downloaded
+    """
+    downloaded_bytes: int = 0
+    total_bytes: Optional[int] = None
+    speed: Optional[float] = None
+    eta: Optional[int] = None
+    updated_at: float = 0.0
+
+    @property
+    def percent(self) -> Optional[float]:
+        if not self.total_bytes:
+            return None
+        return 100.0 * self.downloaded_bytes / self.total_bytes
+
+
+@dataclass
+class ProgressMetrics:
+    """
+    Counters aggregated from progress events. Only updated by the renderer thread.
+    """
+    started_at: float = field(default_factory=time.time)
+    jobs: Dict[str, JobProgress] = field(default_factory=dict)
+    downloaded_bytes: int = 0
+    downloads_finished: int = 0
+    download_errors: int = 0
+    # Seconds each stage took, per URL
+    stage_seconds: Dict[str, List[float]] = field(default_factory=dict)
+    # Average speed of each finished download, bytes/s
+    download_speeds: List[float] = field(default_factory=list)
+    # Last and highest seen depth of each queue
+    queue_depths: Dict[str, int] = field(default_factory=dict)
+    max_queue_depths: Dict[str, int] = field(default_factory=dict)
+
+    def apply(self, event: ProgressEvent) -> None:
+        kind, job, at, payload = event
+        if kind == EventKind.DOWNLOADING:
+            downloaded, total, speed, eta = payload
+            progress = self.jobs.setdefault(job, JobProgress())
+            progress.downloaded_bytes, progress.total_bytes = downloaded or 0, total
+            progress.speed, progress.eta, progress.updated_at = speed, eta, at
+        elif kind == EventKind.DOWNLOAD_FINISHED:
+            size, elapsed = payload
+            self.downloads_finished += 1
+            self.downloaded_bytes += size or 0
+            if size and elapsed:
+                self.download_speeds.append(size / elapsed)
+            self.jobs.pop(job, None)
+        elif kind == EventKind.DOWNLOAD_ERROR:
+            self.download_errors += 1
+            self.jobs.pop(job, None)
+        elif kind == EventKind.STAGE:
+            stage, seconds = payload
+            self.stage_seconds.setdefault(stage, []).append(seconds)
+
+    def set_queue_depth(self, name: str, depth: int) -> None:
+        self.queue_depths[name] = depth
+        self.max_queue_depths[name] = max(depth, self.max_queue_depths.get(name, 0))
+
+    @property
+    def current_speed(self) -> float:
+        return sum(p.speed or 0.0 for p in self.jobs.values())
+
+    def stage_summary(self, stage: str) -> Dict[str, Optional[float]]:
+        return summarize(self.stage_seconds.get(stage, []))
+
+    def to_dict(self) -> Dict[str, Any]:
+        elapsed = time.time() - self.started_at
+        return {
+            "elapsed_seconds": elapsed,
+            "downloaded_bytes": self.downloaded_bytes,
+            "average_bytes_per_second": self.downloaded_bytes / elapsed if elapsed else 0.0,
+            "downloads_finished": self.downloads_finished,
+            "download_errors": self.download_errors,
+            "download_bytes_per_second": summarize(self.download_speeds),
+            "queue_depths": dict(self.queue_depths),
+            "max_queue_depths": dict(self.max_queue_depths),
+            "stages": {stage: self.stage_summary(stage) for stage in sorted(self.stage_seconds)},
+        }
+
+    def write_json(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def to_prometheus(self) -> str:
+        """
+        Metrics in the Prometheus text exposition format, e.g. for the textfile collector of node_exporter
+        """
+        p = METRIC_PREFIX
+        lines = [f"# TYPE {p}_downloaded_bytes_total counter",
+                 f"{p}_downloaded_bytes_total {self.downloaded_bytes}",
+                 f"# TYPE {p}_downloads_finished_total counter",
+                 f"{p}_downloads_finished_total {self.downloads_finished}",
+                 f"# TYPE {p}_download_errors_total counter",
+                 f"{p}_download_errors_total {self.download_errors}",
+                 f"# TYPE {p}_download_bytes_per_second summary"]
+        speeds = summarize(self.download_speeds)
+        lines += [f'{p}_download_bytes_per_second{{quantile="{q}"}} {speeds[f"p{int(q * 100)}"]}'
+                  for q in EXPORTED_QUANTILES if speeds["count"]]
+        lines += [f"{p}_download_bytes_per_second_sum {speeds['sum']}",
+                  f"{p}_download_bytes_per_second_count {speeds['count']}"]
+        lines.append(f"# TYPE {p}_queue_depth_max gauge")
+        lines += [f'{p}_queue_depth_max{{queue="{name}"}} {depth}' for name, depth in sorted(self.max_queue_depths.items())]
+        lines.append(f"# TYPE {p}_stage_seconds summary")
+        for stage in sorted(self.stage_seconds):
+            summary = self.stage_summary(stage)
+            for q in EXPORTED_QUANTILES:
+                lines.append(f'{p}_stage_seconds{{stage="{stage}",quantile="{q}"}} {summary[f"p{int(q * 100)}"]}')
+            lines.append(f'{p}_stage_seconds_sum{{stage="{stage}"}} {summary["sum"]}')
+            lines.append(f'{p}_stage_seconds_count{{stage="{stage}"}} {summary["count"]}')
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.to_prometheus())
+
+
+class ProgressReporter:
+    """
+    Progress display and metrics of a run, fed by events.
+    Hooks of the download workers only put compact events on a queue, a single renderer thread aggregates them
+    into ProgressMetrics and redraws one status line per active download at most every refresh_interval seconds.
+    Messages are printed above the status lines in the order they were sent, so workers never wait for stdout.
+    Queue depths are sampled from the registered gauges on every refresh, registered status lines are redrawn
+    with the download lines.
+    """
+    def __init__(self, refresh_interval: float = DEFAULT_REFRESH_INTERVAL, stream: Optional[TextIO] = None):
+        self._refresh_interval = refresh_interval
+        self._stream = stream or sys.stdout
+        # On a terminal the status lines are redrawn in place, otherwise changed lines are printed on every refresh
+        self._tty = self._stream.isatty()
+        self._events: "queue.SimpleQueue[Optional[ProgressEvent]]" = queue.SimpleQueue()
+        self._gauges: Dict[str, Callable[[], int]] = {}
+        self._statuses: Dict[str, Callable[[], str]] = {}
+        self._drawn_lines = 0
+        self._last_lines: Dict[str, str] = {}
+        self.metrics = ProgressMetrics()
+        self._renderer = threading.Thread(target=self._render_loop, name="progress-renderer", daemon=True)
+        self._renderer.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self) -> None:
+        """
+        Renders the remaining events and stops the renderer thread
+        """
+        self._events.put(None)
+        self._renderer.join()
+
+    def add_gauge(self, name: str, depth: Callable[[], int]) -> None:
+        """
+        :param depth: Current depth of a queue, called from the renderer thread
+        """
+        self._gauges[name] = depth
+
+    def add_status(self, name: str, text: Callable[[], str]) -> None:
+        """
+        :param text: Current status, e.g. the request rate of the governor, called from the renderer thread.
+        Not shown while it's empty.
+        """
+        self._statuses[name] = text
+
+    def emit(self, kind: EventKind, payload: Any = None, job: Optional[str] = None) -> None:
+        self._events.put((kind, job or threading.current_thread().name, time.time(), payload))
+
+    def message(self, text: str) -> None:
+        self.emit(EventKind.MESSAGE, text)
+
+    def stage(self, stage: str, seconds: float) -> None:
+        self.emit(EventKind.STAGE, (stage, seconds))
+
+    def progress_hook(self, status: Dict[str, Any]) -> None:
+        """
+        yt-dlp progress hook, receives dicts with keys like:
+        - status: "downloading" | "finished" | "error"
+        - filename, downloaded_bytes, total_bytes, eta, speed, elapsed
+        - info_dict / tmpfilename etc.
+        """
+        st = status.get("status")
+        filename = status.get("filename") or status.get("tmpfilename") or ""
+        if st == "downloading":
+            self.emit(EventKind.DOWNLOADING, (status.get("downloaded_bytes"),
+                                              status.get("total_bytes") or status.get("total_bytes_estimate"),
+                                              status.get("speed"), status.get("eta")), job=filename)
+        elif st == "finished":
+            elapsed = status.get("elapsed")
+            self.emit(EventKind.DOWNLOAD_FINISHED, (status.get("total_bytes") or status.get("downloaded_bytes"), elapsed),
+                      job=filename)
+            if elapsed is not None:
+                self.stage("download", elapsed)
+            self.message(f"{Fore.GREEN}[MERGE]{Style.RESET_ALL} Download finished, now post-processing: {filename}")
+        elif st == "error":
+            self.emit(EventKind.DOWNLOAD_ERROR, job=filename)
+            self.message(f"{Fore.RED}[ERROR]{Style.RESET_ALL} {filename or status}")
+
+    def _render_loop(self) -> None:
+        next_render = time.monotonic() + self._refresh_interval
+        messages: List[str] = []
+        while True:
+            try:
+                event = self._events.get(timeout=max(0.0, next_render - time.monotonic()))
+            except queue.Empty:
+                event = False
+            if event is None:
+                self._render(messages, final=True)
+                return
+            if event:
+                if event[0] == EventKind.MESSAGE:
+                    messages.append(event[3])
+                else:
+                    self.metrics.apply(event)
+            # Messages are not held back for the next refresh, the status lines are
+            if messages and not self._tty:
+                self._write(messages)
+                messages = []
+            if time.monotonic() >= next_render:
+                self._render(messages)
+                messages = []
+                next_render = time.monotonic() + self._refresh_interval
+
+    def _render(self, messages: List[str], final: bool = False) -> None:
+        for name, depth in self._gauges.items():
+            try:
+                self.metrics.set_queue_depth(name, depth())
+            except Exception:
+                LOG.debug("Failed to sample queue depth: %s", name, exc_info=True)
+        status = {} if final else self._status_lines()
+        if self._tty:
+            out = []
+            if self._drawn_lines:
+                # Back to the first status line of the previous refresh, then clear to the end of the screen
+                out.append(f"\x1b[{self._drawn_lines}F\x1b[J")
+            out += [m + "\n" for m in messages]
+            out += [line + "\n" for line in status.values()]
+            self._stream.write("".join(out))
+            self._drawn_lines = len(status)
+        else:
+            self._write(messages)
+            changed = [line for job, line in status.items() if self._last_lines.get(job) != line]
+            self._write(changed)
+            self._last_lines = status
+        self._stream.flush()
+
+    def _write(self, lines: List[str]) -> None:
+        if lines:
+            self._stream.write("".join(line + "\n" for line in lines))
+
+    def _status_lines(self) -> Dict[str, str]:
+        lines = {}
+        for job, p in sorted(self.metrics.jobs.items()):
+            percent = f"{p.percent:.1f}%  " if p.percent is not None else ""
+            eta = f"  ETA:{p.eta}" if p.eta is not None else ""
+            lines[job] = f"{Fore.CYAN}[DL]{Style.RESET_ALL} {percent}{job}{eta}  {format_speed(p.speed)}"
+        if self.metrics.jobs and (len(self.metrics.jobs) > 1 or self.metrics.queue_depths):
+            queues = "  ".join(f"{name}: {depth}" for name, depth in self.metrics.queue_depths.items())
+            lines[""] = (f"{Fore.CYAN}[DL]{Style.RESET_ALL} {len(self.metrics.jobs)} downloads at "
+                         f"{format_speed(self.metrics.current_speed) or '0.0B/s'}, {self.metrics.downloads_finished} finished"
+                         + (f"  queued {queues}" if queues else ""))
+        for name, text in self._statuses.items():
+            try:
+                status = text()
+            except Exception:
+                LOG.debug("Failed to get status: %s", name, exc_info=True)
+                continue
+            if status:
+                lines[name] = f"{Fore.CYAN}[{name}]{Style.RESET_ALL} {status}"
+        return lines
@@ -0,0 +1,65 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable, Iterable, Optional, TypeVar
+
+LOG = logging.getLogger(__name__)
+T = TypeVar("T")
+
+# job(item, idx, total), idx is 1-based, total is None if the number of items is not known up front
+DownloadJob = Callable[[T, int, Optional[int]], None]
+# Jobs submitted to the pool ahead of the running ones, per worker
+PENDING_JOBS_PER_WORKER = 2
+
+
+class DownloadScheduler:
+    """
+    Runs download jobs on a bounded pool of worker threads.
+    Threads are enough here: yt-dlp spends its time waiting on the network and ffmpeg runs as a subprocess.
+    With a single job, URLs are processed inline in the calling thread (same behaviour as the old serial loop).
+    Items are taken from the iterable only as workers get free, so it can be a generator over a huge URL file.
+    """
+    def __init__(self, jobs: int = 1):
+        if jobs < 1:
+            raise ValueError("Number of jobs should be at least 1, got: {}".format(jobs))
+        self._jobs = jobs
+
+    @property
+    def jobs(self) -> int:
+        return self._jobs
+
+    def run(self, items: Iterable[T], job: DownloadJob) -> None:
+        """
+        :param items: URLs or download items, passed to the job as is
+        """
+        total = len(items) if hasattr(items, "__len__") else None
+        if self._jobs == 1:
+            for idx, item in enumerate(items, start=1):
+                job(item, idx, total)
+            return
+
+        LOG.info("Scheduling %s downloads on %d workers", total if total is not None else "streamed", self._jobs)
+        max_pending = self._jobs * PENDING_JOBS_PER_WORKER
+        with ThreadPoolExecutor(max_workers=self._jobs, thread_name_prefix="download") as executor:
+            futures = {}
+            for idx, item in enumerate(items, start=1):
+                if len(futures) >= max_pending:
+                    self._collect(futures, wait(futures, return_when=FIRST_COMPLETED).done)
+                futures[executor.submit(job, item, idx, total)] = item
+            self._collect(futures, wait(futures).done)
+
+    @staticmethod
+    def _collect(futures, done) -> None:
+        for future in done:
+            item = futures.pop(future)
+            # Jobs are expected to handle their own errors, this is just a safety net
+            # so that one failing worker does not take down the whole batch.
+            exc = future.exception()
+            if exc:
+                LOG.exception("Download job failed for: %s", item, exc_info=exc)
+
+    @staticmethod
+    def split_evenly(total: int, jobs: int) -> int:
+        """
+        Splits a global budget (e.g. concurrent fragment downloads) across workers, at least 1 per worker.
+        """
+        return max(1, total // max(1, jobs))
@@ -1,14 +1,31 @@
-import enum
+import itertools
 import logging
-import re
-from typing import Dict, Any, List, Tuple, Optional
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from typing import Dict, Any, Iterable, List, Tuple, Optional, Iterator
 from pythoncommons.url_utils import UrlUtils
-from yt_dlp import YoutubeDL
-
-from youtube_downloader.cache import VideoTitleCache
-from youtube_downloader.html_utils import HtmlParser
+from youtube_downloader.cache import VideoTitleCache, CacheEntry, FailureEntry, normalize_title, cache_key
+from youtube_downloader.constants import TitleProvider
+from youtube_downloader.errors import ErrorClassifier
+from youtube_downloader.governor import RequestGovernor
+from youtube_downloader.html_utils import HtmlParser, TitleFetcher
+from youtube_downloader.instrumentation import INSTRUMENTATION
+from youtube_downloader.playlist import PlaylistExpander
+from youtube_downloader.utils import ProgressUtils, UrlDeduplicator
+from youtube_downloader.ydl_session import YoutubeDLPool
 import logging
 LOG = logging.getLogger(__name__)
+DEFAULT_PER_HOST_LIMIT = 4
+# URLs looked up at once, titles are returned and the next URLs read after each batch
+DEFAULT_FETCH_BATCH_SIZE = 1000
+_DAY_SECONDS = 24 * 60 * 60
+# How long a cached title is used before it is fetched again, None means forever
+DEFAULT_TITLE_TTLS: Dict[TitleProvider, Optional[float]] = {
+    TitleProvider.YT_DLP: 30 * _DAY_SECONDS,
+    # Scraped page titles change more often (e.g. notifications count in the title)
+    TitleProvider.BEAUTIFULSOUP: 7 * _DAY_SECONDS,
+}
 
 class YoutubeOps:
     def __init__(self,
@@ -17,89 +34,262 @@ class YoutubeOps:
         self._cache = cache
         self._title_service = title_service
 
-    def get_video_titles(self, urls: List[str]):
-        result = self._title_service.fetch_titles(urls)
+    def get_video_titles(self, urls: Iterable[str]):
+        # Titles are printed batch by batch, as they are fetched
+        for url, title in self._title_service.iter_titles(urls):
+            if title:
+                LOG.info("URL: %s, title: %s", url, title)
         self._cache.save()
-
-        LOG.info("PRINTING FINAL RESULTS...")
-        for url, title in result.items():
-            LOG.info("URL: %s, title: %s", url, title)
-
-
-class TitleProvider(enum.Enum):
-    BEAUTIFULSOUP = 'beautifulsoup'
-    YT_DLP = 'yt-dlp'
+        LOG.info("Title cache memory tier: %s", self._cache.hot_stats)
 
 
 class TitleService:
-    def __init__(self, cache: VideoTitleCache, ydl_opts, provider=TitleProvider.YT_DLP, force_download=False):
+    def __init__(self, cache: VideoTitleCache, ydl_opts, provider=TitleProvider.YT_DLP, force_download=False,
+                 workers: int = 1, per_host_limit: int = DEFAULT_PER_HOST_LIMIT,
+                 ydl_pool: Optional[YoutubeDLPool] = None,
+                 playlist_expander: Optional[PlaylistExpander] = None,
+                 ttls: Optional[Dict[TitleProvider, Optional[float]]] = None,
+                 refresh_older_than: Optional[float] = None,
+                 retry_failed: bool = False,
+                 governor: Optional[RequestGovernor] = None,
+                 batch_size: int = DEFAULT_FETCH_BATCH_SIZE):
+        """
+        :param workers: Number of titles fetched in parallel on a cache miss. 1 means serial fetching.
+        :param per_host_limit: Max number of parallel requests to the same host of the governor the service creates
+        if none is given. Also the number of kept-alive connections per host of the page title scraper.
+        :param ydl_pool: YoutubeDL instances to extract titles with, e.g. from a YoutubeDLSessionManager.
+        If not given, the service creates its own pool from ydl_opts and closes it in close().
+        :param playlist_expander: If given, playlist URLs are listed with one flat extraction
+        and the titles of all their entries are returned, instead of fetching the playlist title only.
+        :param ttls: Max age of cached titles in seconds by the provider that fetched them, see DEFAULT_TITLE_TTLS.
+        Titles cached without a known provider never expire.
+        :param refresh_older_than: If given, cached titles older than this many seconds are fetched again.
+        If the fetch fails, the stale title is still returned.
+        :param retry_failed: Fetch titles of URLs that failed before, even if their retry time did not come yet.
+        Failed URLs are otherwise skipped until the retry time of their error class (see errors.RETRY_BACKOFF).
+        :param governor: Rate and concurrency limits of the requests to each host, shared with other services
+        of the process. If not given, the service creates its own.
+        :param batch_size: Number of URLs of the input looked up and fetched at once, see iter_titles.
+        """
         # The service holds the cache dependency
         self._ydl_opts = ydl_opts
+        self._owns_ydl_pool = ydl_pool is None
+        self._ydl_pool = ydl_pool if ydl_pool else YoutubeDLPool(ydl_opts)
         self._cache = cache
+        self._playlist_expander = playlist_expander
+        self._provider = provider
+        self._ttls = dict(DEFAULT_TITLE_TTLS)
+        if ttls:
+            self._ttls.update(ttls)
+        self._refresh_older_than = refresh_older_than
+        self._retry_failed = retry_failed
+        self._force_download = force_download
+        if workers < 1 or per_host_limit < 1 or batch_size < 1:
+            raise ValueError("Number of workers, per host limit and batch size should be at least 1, got: {}, {}, {}"
+                             .format(workers, per_host_limit, batch_size))
+        self.governor = governor if governor else RequestGovernor(max_concurrency=per_host_limit)
+        self._html_fetcher: Optional[TitleFetcher] = None
         if provider == TitleProvider.YT_DLP:
             self._title_provider = self.yt_dlp_title_provider
         elif provider == TitleProvider.BEAUTIFULSOUP:
+            # The fetcher sends its requests through the governor
+            self._html_fetcher = TitleFetcher(connections_per_host=per_host_limit, governor=self.governor)
             self._title_provider = self.bs_title_provider
-        self._force_download = force_download
+        self._workers = workers
+        self._batch_size = batch_size
 
     def bs_title_provider(self, url: str):
-        return HtmlParser.get_title_from_url(url)
+        return HtmlParser.fetch_title(url, fetcher=self._html_fetcher)
 
     def yt_dlp_title_provider(self, url: str):
-        with YoutubeDL(self._ydl_opts) as ydl:
+        return self.governor.call(url, self._extract_title, url)
+
+    def _extract_title(self, url: str):
+        with self._ydl_pool.session() as ydl:
             info = ydl.extract_info(url, download=False)
             return info.get('title')
 
-    def fetch_titles(self, urls: List[str]):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self) -> None:
+        if self._owns_ydl_pool:
+            self._ydl_pool.close()
+        if self._html_fetcher:
+            self._html_fetcher.close()
+
+    def fetch_titles(self, urls: Iterable[str]) -> Dict[str, str]:
         """
-        Iterates through all checklists in a board to fetch and cache URL titles.
-        :param urls:
+        Fetches and caches the titles of the URLs, see iter_titles. Keeps all titles in memory,
+        use iter_titles for huge URL lists.
+        :return: Titles by URL, in the order of the input URLs. URLs without a title are left out.
         """
-        # Ensure the cache is used with a context manager if possible, or managed externally
-        # to ensure it saves/closes correctly.
+        return {url: url_title for url, url_title in self.iter_titles(urls) if url_title}
 
-        result = {}
-        total_urls = len(urls)
-        for idx, url in enumerate(urls):
-            LOG.info("[%d / %d] Fetching titles for url: %s ", idx + 1, total_urls, url)
-            url_title = None
+    def iter_titles(self, urls: Iterable[str]) -> Iterator[Tuple[str, Optional[str]]]:
+        """
+        Yields (url, title) pairs in the order of the input URLs, title is None if it's not known.
+        URLs are looked up in batches of batch_size: only cache misses are fetched (in parallel if workers > 1),
+        and the next batch is only read once the titles of the batch were yielded.
+        Other forms of URLs seen before are skipped, remembered by a hash (see UrlDeduplicator),
+        so memory use doesn't grow with the titles of the URLs.
+        All cache writes happen from the calling thread.
+        :param urls: A list, or any iterable, e.g. URLs streamed from a file (FileUtils.iter_urls), consumed once
+        """
+        seen = UrlDeduplicator()
+        total_urls = len(urls) if hasattr(urls, "__len__") else None
+        numbered_urls = enumerate(urls, start=1)
+        while True:
+            batch = list(itertools.islice(numbered_urls, self._batch_size))
+            if not batch:
+                break
+            with INSTRUMENTATION.span("fetch_title_batch"):
+                result = self._fetch_batch(batch, total_urls, seen)
+            yield from result.items()
+
+        # After processing, ensure the cache is saved
+        self._cache.save()
+
+    def _fetch_batch(self, batch: List[Tuple[int, str]], total_urls: Optional[int],
+                     seen: UrlDeduplicator) -> Dict[str, Optional[str]]:
+        """
+        :param batch: (number, url) pairs, number is the position of the URL in the input
+        """
+        # Insertion order of the dict is the order of the URLs, fetched titles are filled in later
+        result: Dict[str, Optional[str]] = {}
+        misses: List[str] = []
+        # Titles of expired cache entries, used if fetching them again fails
+        stale_titles: Dict[str, str] = {}
+        for number, url in batch:
+            LOG.info("[%s] Looking up title for url: %s ", ProgressUtils.format_count(number, total_urls), url)
             try:
                 # 1. Identify URL
                 url = UrlUtils.extract_from_str(url)
             except:
                 url = None
-            if url:
-                # 2. Get from cache or fetch (ALL cache interaction is here)
-                # Uncomment to delete from cache
-                # del self._cache._shelf["https://chatgpt.com/c/6872d253-faf8-8007-8ad8-6c144b31ce50"]
-                url_title = self._cache.get(url)
-                if self._force_download:
-                    # Pretend URL title is not cached when force download is enabled
-                    url_title = None
-                if not url_title:
-                    # Fetch title of URL
-                    url_title = self._title_provider(url)
-                    if url_title:
-                        url_title = self._process_fetched_url_title(url, url_title)
-                else:
-                    # Read from cache (still need to clean old titles if needed)
-                    new_url_title = re.sub(r'[\n\t\r]+', ' ', url_title)
-                    if url_title != new_url_title:
-                        self._cache.put(url, new_url_title)
-                    url_title = new_url_title
-            if url_title:
-                result[url] = url_title
+            if not url:
+                continue
+            if not seen.add(cache_key(url)):
+                LOG.debug("Skipping url, another form of it was already looked up: %s", url)
+                continue
+            if self._playlist_expander and PlaylistExpander.is_playlist_url(url):
+                if self._add_playlist_titles(url, result, seen):
+                    continue
+            # 2. Get from cache or schedule fetch (ALL cache interaction is in this thread)
+            # Uncomment to delete from cache
+            # self._cache.delete("https://chatgpt.com/c/6872d253-faf8-8007-8ad8-6c144b31ce50")
+            entry = self._cache.get_entry(url)
+            url_title = None
+            if entry and not self._is_fresh(entry):
+                stale_titles[url] = entry.title
+                entry = None
+            if self._force_download:
+                # Pretend URL title is not cached when force download is enabled
+                entry = None
+            if entry:
+                # Cached titles are already normalized
+                url_title = entry.title
+            elif self._is_failure_cached(url):
+                url_title = stale_titles.pop(url, None)
+            else:
+                misses.append(url)
+            result[url] = url_title
 
-        # After processing, ensure the cache is saved
-        self._cache.save()
+        # 3. Fetch titles of URLs that are not cached or expired
+        for url, url_title, error in self._fetch_missing_titles(misses):
+            if url_title:
+                result[url] = self._process_fetched_url_title(url, url_title)
+                continue
+            self._record_failure(url, error)
+            if url in stale_titles:
+                LOG.warning("Failed to refresh title, using the expired cached title for url: %s", url)
+                result[url] = stale_titles[url]
         return result
 
+    def _is_fresh(self, entry: CacheEntry) -> bool:
+        max_ages = []
+        if entry.provider in TitleProvider.values():
+            max_ages.append(self._ttls.get(TitleProvider(entry.provider)))
+        max_ages.append(self._refresh_older_than)
+        max_ages = [max_age for max_age in max_ages if max_age is not None]
+        return not max_ages or entry.age() <= min(max_ages)
+
+    def _add_playlist_titles(self, url: str, result: Dict[str, Optional[str]], seen: UrlDeduplicator) -> bool:
+        """
+        Adds the title of the playlist and all of its entries to the result.
+        The expander already stored them in the cache.
+        :return: False if the playlist could not be listed
+        """
+        try:
+            playlist = self._playlist_expander.expand(url)
+        except Exception as e:
+            LOG.error("Failed to list playlist, falling back to fetching its title: %s, error: %s", url, e)
+            return False
+        result[url] = playlist.title
+        for entry in playlist.entries:
+            if seen.add(cache_key(entry.url)):
+                result[entry.url] = normalize_title(entry.title) if entry.title else None
+        return True
+
+    def _is_failure_cached(self, url: str) -> bool:
+        if self._force_download or self._retry_failed:
+            return False
+        failure = self._cache.get_failure(url)
+        if not failure or failure.should_retry():
+            return False
+        LOG.info("Skipping url, fetching its title failed %d time(s) (%s), next retry after %s: %s",
+                 failure.attempts, failure.error_class,
+                 datetime.fromtimestamp(failure.retry_after).isoformat(timespec="seconds"), url)
+        return True
+
+    def _record_failure(self, url: str, error: Optional[BaseException]) -> None:
+        error_class = ErrorClassifier.classify(error)
+        previous = self._cache.get_failure(url)
+        attempts = previous.attempts + 1 if previous else 1
+        now = time.time()
+        retry_after = now + ErrorClassifier.retry_delay(error_class, attempts)
+        LOG.warning("Failed to fetch title (%s, attempt %d), next retry after %s: %s",
+                    error_class.value, attempts, datetime.fromtimestamp(retry_after).isoformat(timespec="seconds"), url)
+        self._cache.put_failure(url, FailureEntry(error_class=error_class.value,
+                                                  message=str(error) if error else None,
+                                                  attempts=attempts,
+                                                  failed_at=now,
+                                                  retry_after=retry_after))
+
+    def _fetch_missing_titles(self, urls: List[str]) -> Iterator[Tuple[str, Optional[str], Optional[BaseException]]]:
+        """
+        Yields (url, title, error) tuples, in completion order when fetching in parallel.
+        """
+        total_urls = len(urls)
+        if self._workers == 1 or total_urls <= 1:
+            for idx, url in enumerate(urls):
+                LOG.info("[%d / %d] Fetching title for url: %s ", idx + 1, total_urls, url)
+                yield url, *self._fetch_title(url)
+            return
+
+        # Parallel requests to the same host are limited by the governor
+        LOG.info("Fetching %d titles with %d workers", total_urls, self._workers)
+        with ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix="title") as executor:
+            futures = {executor.submit(self._fetch_title, url): url for url in urls}
+            for idx, future in enumerate(as_completed(futures)):
+                url = futures[future]
+                LOG.info("[%d / %d] Fetched title for url: %s ", idx + 1, total_urls, url)
+                yield url, *future.result()
+
+    def _fetch_title(self, url: str) -> Tuple[Optional[str], Optional[BaseException]]:
+        """
+        :return: (title, None) on success, (None, error) if fetching failed, (None, None) if the page has no title
+        """
+        try:
+            with INSTRUMENTATION.span("fetch_title", key=url):
+                return self._title_provider(url), None
+        except Exception as e:
+            LOG.error("Failed to fetch title for url: %s, error: %s", url, e)
+            return None, e
+
     def _process_fetched_url_title(self, url: str | Any, url_title: str | None) -> str:
-        url_title = re.sub(r'[\n\t\r]+', ' ', url_title)
-        # Replace only two or more consecutive spaces with a single space
-        url_title = re.sub(r' {2,}', ' ', url_title)
-
-        if url_title:
-            # Put title into cache
-            self._cache.put(url, url_title)
-        return url_title
+        # Put title into cache, the cache normalizes it once
+        return self._cache.put(url, url_title, provider=self._provider.value)
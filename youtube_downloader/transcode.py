@@ -0,0 +1,290 @@
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from yt_dlp.postprocessor.common import PostProcessor
+
+from youtube_downloader.codec_policy import CodecPolicy, EncodeStats, TranscodePlan
+from youtube_downloader.ffmpeg_utils import FFmpegUtils, COPY_CODEC, MP4_EXT
+
+LOG = logging.getLogger(__name__)
+# Jobs with a lower priority value run first, jobs of the same priority in submission order
+PRIORITY_REMUX = 0
+PRIORITY_ENCODE = 10
+# libx264 gains little from more threads than this on a single 1080p encode,
+# more encodes in parallel use the cores better
+DEFAULT_THREADS_PER_JOB = 4
+
+
+@dataclass(frozen=True)
+class TranscodeProfile:
+    name: str
+    # libx264 -preset and -crf
+    preset: str
+    crf: int
+    audio_bitrate: str
+
+    def encoder_args(self, plan: TranscodePlan, threads: int) -> List[str]:
+        args = ["-threads", str(threads)]
+        if plan.transcodes_video:
+            args += ["-preset", self.preset, "-crf", str(self.crf)]
+        if plan.audio_codec != COPY_CODEC:
+            args += ["-b:a", self.audio_bitrate]
+        return args
+
+
+TRANSCODE_PROFILES: Dict[str, TranscodeProfile] = {
+    # Quick to encode, bigger files
+    "fast": TranscodeProfile("fast", preset="veryfast", crf=23, audio_bitrate="160k"),
+    # Slow to encode, close to the source quality at a smaller size
+    "archival": TranscodeProfile("archival", preset="slow", crf=18, audio_bitrate="256k"),
+}
+DEFAULT_TRANSCODE_PROFILE = "fast"
+
+
+@dataclass
+class TranscodeMetrics:
+    filepath: str
+    profile: str
+    threads: int
+    # Time spent waiting for CPU budget, then running ffmpeg
+    queue_seconds: float = 0.0
+    wall_seconds: float = 0.0
+    frames: int = 0
+    media_seconds: Optional[float] = None
+
+    @property
+    def encode_fps(self) -> Optional[float]:
+        if not self.frames or not self.wall_seconds:
+            return None
+        return self.frames / self.wall_seconds
+
+    @property
+    def speed(self) -> Optional[float]:
+        """
+        Seconds of video encoded per second of wall time
+        """
+        if not self.media_seconds or not self.wall_seconds:
+            return None
+        return self.media_seconds / self.wall_seconds
+
+
+@dataclass
+class TranscodeResult:
+    filepath: str
+    metrics: TranscodeMetrics
+
+
+@dataclass(order=True)
+class _Job:
+    priority: int
+    seq: int
+    filepath: str = field(compare=False)
+    plan: TranscodePlan = field(compare=False)
+    media_seconds: Optional[float] = field(compare=False)
+    threads: int = field(compare=False)
+    future: Future = field(compare=False)
+    submitted_at: float = field(compare=False)
+
+
+def available_cpus() -> int:
+    """
+    CPUs this process may run on, which is less than os.cpu_count() in containers and with taskset
+    """
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+class TranscodeService:
+    """
+    Runs all ffmpeg conversions of the process within a CPU budget, counted in encoder threads.
+    Each encode gets threads_per_job threads (ffmpeg -threads), a remux gets one,
+    and a job only starts when the budget has room for its threads. Waiting jobs are started by priority.
+    The x264 preset and CRF come from the selected TranscodeProfile.
+    """
+    def __init__(self,
+                 cpu_budget: Optional[int] = None,
+                 threads_per_job: int = DEFAULT_THREADS_PER_JOB,
+                 profile: TranscodeProfile = TRANSCODE_PROFILES[DEFAULT_TRANSCODE_PROFILE]):
+        """
+        :param cpu_budget: Encoder threads of all running jobs together, defaults to the available CPUs
+        """
+        self.cpu_budget = max(1, cpu_budget or available_cpus())
+        if threads_per_job < 1:
+            raise ValueError("Transcode jobs need at least 1 thread, got: {}".format(threads_per_job))
+        self.threads_per_job = min(threads_per_job, self.cpu_budget)
+        self.profile = profile
+        self._cond = threading.Condition()
+        self._queue: List[_Job] = []
+        self._seq = itertools.count()
+        self._free_threads = self.cpu_budget
+        self._running = 0
+        self._closed = False
+        self._metrics: List[TranscodeMetrics] = []
+        self._dispatcher = threading.Thread(target=self._dispatch, name="transcode-dispatcher", daemon=True)
+        self._dispatcher.start()
+        LOG.info("Transcode service: %d CPU threads, %d threads per encode, profile '%s' (preset %s, crf %d)",
+                 self.cpu_budget, self.threads_per_job, profile.name, profile.preset, profile.crf)
+
+    def close(self) -> None:
+        """
+        Waits for the queued and running jobs to finish.
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._dispatcher.join()
+        with self._cond:
+            self._cond.wait_for(lambda: self._running == 0)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def submit(self, filepath: str, plan: TranscodePlan, media_seconds: Optional[float] = None,
+               priority: Optional[int] = None) -> Future:
+        """
+        :param priority: Defaults to PRIORITY_REMUX for copy only plans, PRIORITY_ENCODE otherwise
+        :return: Future of the TranscodeResult
+        """
+        if priority is None:
+            priority = PRIORITY_REMUX if plan.is_copy else PRIORITY_ENCODE
+        threads = 1 if plan.is_copy else self.threads_per_job
+        future = Future()
+        with self._cond:
+            if self._closed:
+                raise ValueError("Transcode service is already closed")
+            heapq.heappush(self._queue, _Job(priority, next(self._seq), filepath, plan, media_seconds, threads,
+                                             future, time.perf_counter()))
+            self._cond.notify_all()
+        return future
+
+    def transcode(self, filepath: str, plan: TranscodePlan, media_seconds: Optional[float] = None,
+                  priority: Optional[int] = None) -> TranscodeResult:
+        """
+        Blocking submit(), raises the error of the conversion
+        """
+        return self.submit(filepath, plan, media_seconds, priority).result()
+
+    @property
+    def queue_depth(self) -> int:
+        """
+        Number of jobs waiting for CPU budget
+        """
+        with self._cond:
+            return len(self._queue)
+
+    @property
+    def metrics(self) -> List[TranscodeMetrics]:
+        with self._cond:
+            return list(self._metrics)
+
+    def summary(self) -> str:
+        metrics = self.metrics
+        if not metrics:
+            return "no ffmpeg jobs"
+        wall = sum(m.wall_seconds for m in metrics)
+        with_frames = [m for m in metrics if m.frames]
+        fps = sum(m.frames for m in with_frames) / sum(m.wall_seconds for m in with_frames) if with_frames else None
+        return (f"{len(metrics)} ffmpeg jobs ({self.profile.name} profile): {wall:.0f}s wall time, "
+                f"longest {max(m.wall_seconds for m in metrics):.0f}s, "
+                f"waited {sum(m.queue_seconds for m in metrics):.0f}s for CPU budget"
+                + (f", {fps:.1f} fps on average" if fps else ""))
+
+    def _dispatch(self) -> None:
+        while True:
+            with self._cond:
+                # Strict priority: a big encode at the head of the queue is not overtaken by later jobs
+                self._cond.wait_for(lambda: (self._queue and self._queue[0].threads <= self._free_threads)
+                                    or (self._closed and not self._queue))
+                if not self._queue:
+                    return
+                job = heapq.heappop(self._queue)
+                self._free_threads -= job.threads
+                self._running += 1
+            threading.Thread(target=self._run, args=(job,), name="transcode", daemon=True).start()
+
+    def _run(self, job: _Job) -> None:
+        metrics = TranscodeMetrics(job.filepath, self.profile.name, job.threads,
+                                   queue_seconds=time.perf_counter() - job.submitted_at,
+                                   media_seconds=job.media_seconds)
+
+        def on_progress(progress: Dict[str, str]) -> None:
+            if progress.get("frame", "").isdigit():
+                metrics.frames = int(progress["frame"])
+
+        start = time.perf_counter()
+        try:
+            outpath = FFmpegUtils.convert_to_mp4(job.filepath, job.plan.video_codec, job.plan.audio_codec,
+                                                 encoder_args=self.profile.encoder_args(job.plan, job.threads),
+                                                 on_progress=on_progress)
+        except BaseException as e:
+            job.future.set_exception(e)
+        else:
+            metrics.wall_seconds = time.perf_counter() - start
+            LOG.info("Transcoded %s in %.1fs (queued %.1fs, %d threads, %s fps)", job.filepath,
+                     metrics.wall_seconds, metrics.queue_seconds, job.threads,
+                     f"{metrics.encode_fps:.1f}" if metrics.encode_fps else "n/a")
+            with self._cond:
+                self._metrics.append(metrics)
+            job.future.set_result(TranscodeResult(outpath, metrics))
+        finally:
+            with self._cond:
+                self._free_threads += job.threads
+                self._running -= 1
+                self._cond.notify_all()
+
+
+def apply_plan(filepath: str, plan: TranscodePlan, media_seconds: Optional[float],
+               transcoder: TranscodeService, stats: Optional[EncodeStats] = None) -> str:
+    """
+    Converts the file to MP4 according to the plan on the transcode service, if it needs to be.
+    :return: Path of the resulting file
+    """
+    elapsed = 0.0
+    if plan.needs_ffmpeg(filepath):
+        result = transcoder.transcode(filepath, plan, media_seconds)
+        filepath, elapsed = result.filepath, result.metrics.wall_seconds
+    else:
+        LOG.debug("Not converting media file, already H.264 compatible mp4 (video: %s, audio: %s): %s",
+                  plan.source_vcodec, plan.source_acodec, filepath)
+    if stats:
+        stats.record(plan, media_seconds, elapsed)
+    return filepath
+
+
+class CodecAwareConvertorPP(PostProcessor):
+    """
+    yt-dlp postprocessor converting downloads to MP4 according to CodecPolicy, on the transcode service.
+    Replaces FFmpegVideoConvertor, which re-encodes every file that's not MP4 and keeps every MP4 as is,
+    even with VP9 or AV1 video. Should be registered with when='post_process'.
+    """
+    def __init__(self, transcoder: TranscodeService, stats: Optional[EncodeStats] = None, downloader=None):
+        super().__init__(downloader)
+        self._transcoder = transcoder
+        self._stats = stats
+
+    def run(self, info):
+        filepath = info["filepath"]
+        plan = CodecPolicy.plan_for_info(info)
+        duration = info.get("duration")
+        if plan is None:
+            plan, duration = CodecPolicy.plan_for_file(filepath)
+        if plan.needs_ffmpeg(filepath):
+            self.to_screen(f"Converting to mp4 (video: {plan.source_vcodec} -> {plan.video_codec}, "
+                           f"audio: {plan.source_acodec} -> {plan.audio_codec}): {filepath}")
+        outpath = apply_plan(filepath, plan, duration, self._transcoder, self._stats)
+        if outpath != filepath:
+            info["filepath"] = outpath
+            info["format"] = info["ext"] = MP4_EXT
+        return [], info
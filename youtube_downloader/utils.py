@@ -1,15 +1,20 @@
+import hashlib
 import logging
 import os
 import pathlib
+import re
 from copy import copy
 from logging.handlers import TimedRotatingFileHandler
 from os.path import expanduser
-from typing import List
+from typing import Iterator, List, Optional, Set
+
+from pythoncommons.url_utils import UrlUtils
 
 from pythoncommons.constants import ExecutionMode
 from pythoncommons.logging_setup import DEFAULT_FORMAT, SimpleLoggingSetupConfig, SimpleLoggingSetup
 from pythoncommons.project_utils import ProjectRootDeterminationStrategy, ProjectUtils
 
+from youtube_downloader.canonical import UrlCanonicalizer
 from youtube_downloader.constants import PROJECT_NAME
 import logging
 LOG = logging.getLogger(__name__)
@@ -108,6 +113,36 @@ class LoggingUtils:
             logger.removeHandler(handler)
 
 
+class UrlDeduplicator:
+    """
+    Remembers seen URLs by a 64-bit hash of their key, much smaller than keeping the URL strings.
+    The key of YouTube URLs is their canonical video or playlist id (see UrlCanonicalizer),
+    so different URL forms of the same video are duplicates.
+    With 64-bit hashes, a false duplicate among 10 million URLs has a chance of about 1 in 300,000.
+    """
+    def __init__(self):
+        self._seen: Set[int] = set()
+        self.duplicates = 0
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+    @staticmethod
+    def key(url: str) -> str:
+        return UrlCanonicalizer.canonical_key(url) or url
+
+    def add(self, url: str) -> bool:
+        """
+        :return: True if the URL was not seen before
+        """
+        digest = int.from_bytes(hashlib.blake2b(self.key(url).encode("utf-8"), digest_size=8).digest(), "big")
+        if digest in self._seen:
+            self.duplicates += 1
+            return False
+        self._seen.add(digest)
+        return True
+
+
 class FileUtils:
     @staticmethod
     def load_urls(file_path: str) -> List[str]:
@@ -116,4 +151,61 @@ class FileUtils:
             raise FileNotFoundError(f"URLs file not found: {file_path}")
         with p.open("r", encoding="utf-8") as fh:
             lines = [l.strip() for l in fh.readlines() if l.strip() and not l.strip().startswith("#")]
-        return lines
\ No newline at end of file
+        return lines
+
+    @staticmethod
+    def iter_urls(file_path: str, dedupe: bool = True) -> Iterator[str]:
+        """
+        Streams the URLs of a file line by line, without loading the file.
+        The URL is extracted from each line, lines without a URL and comment lines are skipped.
+        :param dedupe: Skip URLs seen before in the file, see UrlDeduplicator
+        :raises FileNotFoundError: Right away, not on the first iteration
+        """
+        p = pathlib.Path(file_path)
+        if not p.exists():
+            raise FileNotFoundError(f"URLs file not found: {file_path}")
+        return FileUtils._iter_urls(p, UrlDeduplicator() if dedupe else None)
+
+    @staticmethod
+    def _iter_urls(p: pathlib.Path, deduplicator: Optional[UrlDeduplicator]) -> Iterator[str]:
+        with p.open("r", encoding="utf-8") as fh:
+            for line in fh:
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                try:
+                    url = UrlUtils.extract_from_str(line)
+                except AttributeError:
+                    LOG.warning("Skipping line without URL: %s", line)
+                    continue
+                if deduplicator is not None and not deduplicator.add(url):
+                    LOG.debug("Skipping duplicate URL: %s", url)
+                    continue
+                yield url
+        if deduplicator is not None and deduplicator.duplicates:
+            LOG.info("Skipped %d duplicate URLs of %s", deduplicator.duplicates, p)
+
+
+class ProgressUtils:
+    @staticmethod
+    def format_count(idx: int, total: Optional[int] = None) -> str:
+        """
+        '3 / 10', or a running count '3' if the total is not known (e.g. URLs streamed from a file)
+        """
+        return f"{idx} / {total}" if total is not None else str(idx)
+
+
+class TimeUtils:
+    _DURATION_UNITS = {"s": 1, "m": 60, "h": 60 * 60, "d": 24 * 60 * 60, "w": 7 * 24 * 60 * 60}
+
+    @staticmethod
+    def parse_duration(value: str) -> float:
+        """
+        Parses durations like '90', '45s', '30m', '12h', '7d' or '2w' to seconds.
+        Plain numbers are seconds.
+        """
+        m = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([smhdw]?)\s*", value.lower())
+        if not m:
+            raise ValueError(f"Invalid duration: '{value}', expected a number with an optional unit (s, m, h, d, w)")
+        number, unit = m.groups()
+        return float(number) * TimeUtils._DURATION_UNITS[unit or "s"]
@@ -0,0 +1,237 @@
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, asdict, field
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from yt_dlp.utils import DownloadError
+
+from youtube_downloader.constants import FilePath
+from youtube_downloader.ffmpeg_utils import FFmpegUtils
+from youtube_downloader.instrumentation import INSTRUMENTATION
+
+LOG = logging.getLogger(__name__)
+DEFAULT_PROBE_WORKERS = 4
+DEFAULT_BATCH_SIZE = 200
+BUSY_TIMEOUT_SECONDS = 30
+# A file is considered truncated if its duration is off by more than this from the expected one
+DURATION_TOLERANCE_SECONDS = 2.0
+DURATION_TOLERANCE_RATIO = 0.01
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS probes (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    result TEXT NOT NULL,
+    probed_at REAL NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+@dataclass
+class ProbeResult:
+    """
+    What ffprobe reported about a file, the part of it verification needs.
+    """
+    path: str
+    size: int
+    mtime_ns: int
+    has_video: bool = False
+    has_audio: bool = False
+    width: Optional[int] = None
+    height: Optional[int] = None
+    duration: Optional[float] = None
+    video_codec: Optional[str] = None
+    audio_codec: Optional[str] = None
+    # Set if ffprobe could not read the file
+    error: Optional[str] = None
+
+    @staticmethod
+    def from_ffprobe(path: str, size: int, mtime_ns: int, probe: Dict) -> 'ProbeResult':
+        streams = probe.get("streams", [])
+        video = next((s for s in streams if s.get("codec_type") == "video"), None)
+        audio = next((s for s in streams if s.get("codec_type") == "audio"), None)
+        duration = (probe.get("format") or {}).get("duration")
+        return ProbeResult(path, size, mtime_ns,
+                           has_video=video is not None,
+                           has_audio=audio is not None,
+                           width=video.get("width") if video else None,
+                           height=video.get("height") if video else None,
+                           duration=float(duration) if duration not in (None, "N/A")
+                           else FFmpegUtils.probe_duration(streams),
+                           video_codec=video.get("codec_name") if video else None,
+                           audio_codec=audio.get("codec_name") if audio else None)
+
+
+@dataclass
+class VerificationResult:
+    path: str
+    probe: ProbeResult
+    # Empty if the file passed all checks
+    problems: List[str] = field(default_factory=list)
+    # True if the probe result came from the cache, the file was not probed again
+    cached: bool = False
+
+    @property
+    def ok(self) -> bool:
+        return not self.problems
+
+
+class ProbeCache:
+    """
+    Persistent ffprobe results, keyed by path and valid as long as the size and modification time
+    of the file are the same. All entries are loaded when it's opened, new results are written in batches.
+    """
+    def __init__(self, file_path: str = FilePath.PROBE_CACHE_DB_FILE, batch_size: int = DEFAULT_BATCH_SIZE):
+        self._file_path = file_path
+        self._batch_size = batch_size
+        self._lock = threading.Lock()
+        # The connection is shared by probe workers, access is serialized by self._lock
+        self._conn = sqlite3.connect(file_path, timeout=BUSY_TIMEOUT_SECONDS, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._results: Dict[str, ProbeResult] = {}
+        for result_json, in self._conn.execute("SELECT result FROM probes"):
+            result = ProbeResult(**json.loads(result_json))
+            self._results[result.path] = result
+        self._pending: List[ProbeResult] = []
+
+    def __len__(self):
+        return len(self._results)
+
+    def get(self, path: str, size: int, mtime_ns: int) -> Optional[ProbeResult]:
+        """
+        :return: The cached result if the file did not change since it was probed
+        """
+        result = self._results.get(path)
+        if result and result.size == size and result.mtime_ns == mtime_ns:
+            return result
+        return None
+
+    def put(self, result: ProbeResult) -> None:
+        with self._lock:
+            self._results[result.path] = result
+            self._pending.append(result)
+            if len(self._pending) >= self._batch_size:
+                self._flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush()
+
+    def close(self) -> None:
+        with self._lock:
+            self._flush()
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _flush(self) -> None:
+        if not self._pending:
+            return
+        now = time.time()
+        rows = [(r.path, r.size, r.mtime_ns, json.dumps(asdict(r)), now) for r in self._pending]
+        with self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO probes (path, size, mtime_ns, result, probed_at) "
+                                   "VALUES (?, ?, ?, ?, ?)", rows)
+        self._pending = []
+
+
+class VerificationService:
+    """
+    Verifies downloaded files with ffprobe: a video stream with a resolution, a duration
+    (close to the expected one, if known) and an audio stream. Audio files are verified without the video checks.
+    At most `workers` ffprobe processes run at once, whichever thread asks for them.
+    With a ProbeCache, files that did not change since they were last probed are not probed again.
+    """
+    def __init__(self, workers: int = DEFAULT_PROBE_WORKERS,
+                 cache: Optional[ProbeCache] = None,
+                 require_audio: bool = True,
+                 require_video: bool = True):
+        if workers < 1:
+            raise ValueError("Verification needs at least 1 worker, got: {}".format(workers))
+        self.ensure_ffprobe()
+        self.workers = workers
+        self._cache = cache
+        self._require_audio = require_audio
+        self._require_video = require_video
+        self._probe_slots = threading.BoundedSemaphore(workers)
+
+    @staticmethod
+    def ensure_ffprobe() -> None:
+        """
+        :raises DownloadError: If ffprobe is not installed
+        """
+        if not shutil.which("ffprobe"):
+            raise DownloadError("ffprobe not found — please install ffmpeg (ffprobe).")
+
+    def probe(self, path: str, use_cache: bool = True) -> Tuple[ProbeResult, bool]:
+        """
+        :return: The probe result and whether it came from the cache
+        """
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        if self._cache is not None and use_cache:
+            cached = self._cache.get(path, stat.st_size, stat.st_mtime_ns)
+            if cached:
+                return cached, True
+        with self._probe_slots, INSTRUMENTATION.span("ffprobe"):
+            try:
+                result = ProbeResult.from_ffprobe(path, stat.st_size, stat.st_mtime_ns, FFmpegUtils.probe(path))
+            except DownloadError as e:
+                result = ProbeResult(path, stat.st_size, stat.st_mtime_ns, error=str(e))
+        if self._cache is not None:
+            self._cache.put(result)
+        return result, False
+
+    def verify(self, path: str, expected_duration: Optional[float] = None,
+               use_cache: bool = True) -> VerificationResult:
+        """
+        :param expected_duration: Duration of the video in seconds as reported by the site, to catch truncated files
+        """
+        probe, cached = self.probe(path, use_cache)
+        return VerificationResult(probe.path, probe, self.check(probe, expected_duration), cached)
+
+    def verify_many(self, paths: Iterable[str], use_cache: bool = True) -> Iterator[VerificationResult]:
+        """
+        Verifies the files in parallel, in no particular order. Paths are read lazily.
+        """
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="verify") as executor:
+            pending = set()
+            for path in paths:
+                pending.add(executor.submit(self.verify, path, None, use_cache))
+                if len(pending) >= self.workers * 2:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    yield from (f.result() for f in done)
+            for f in pending:
+                yield f.result()
+
+    def check(self, probe: ProbeResult, expected_duration: Optional[float] = None) -> List[str]:
+        if probe.error:
+            return [probe.error]
+        problems = []
+        if self._require_video:
+            if not probe.has_video:
+                problems.append("NO video stream")
+            elif not probe.width or not probe.height:
+                problems.append("video stream has no resolution")
+        if not probe.duration or probe.duration <= 0:
+            problems.append("no duration")
+        elif expected_duration:
+            tolerance = max(DURATION_TOLERANCE_SECONDS, expected_duration * DURATION_TOLERANCE_RATIO)
+            if abs(probe.duration - expected_duration) > tolerance:
+                problems.append(f"duration is {probe.duration:.1f}s, expected {expected_duration:.1f}s")
+        if self._require_audio and not probe.has_audio:
+            problems.append("no audio stream")
+        return problems
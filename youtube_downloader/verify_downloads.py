@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import time
+from typing import Iterator, List, Optional, Sequence
+
+from yt_dlp.utils import DownloadError
+
+from youtube_downloader.constants import FilePath
+from youtube_downloader.instrumentation import add_profile_report_arguments, profile_report
+from youtube_downloader.utils import LoggingUtils
+from youtube_downloader.verification import VerificationService, ProbeCache, DEFAULT_PROBE_WORKERS
+
+try:
+    from colorama import init as colorama_init, Fore, Style
+    colorama_init()
+except Exception:
+    # fallback to no color if colorama not installed
+    class _C:
+        def __getattr__(self, _): return ""
+    Fore = Style = _C()
+
+DEFAULT_EXTENSIONS = ["mp4"]
+
+
+def iter_media_files(output_dir: str, extensions: Sequence[str]) -> Iterator[str]:
+    suffixes = tuple("." + ext.lower().lstrip(".") for ext in extensions)
+    for dirpath, _, filenames in os.walk(output_dir):
+        for filename in sorted(filenames):
+            # Leftovers of interrupted downloads and conversions are not outputs
+            if filename.lower().endswith(suffixes) and ".temp." not in filename and ".part" not in filename:
+                yield os.path.join(dirpath, filename)
+
+
+def build_argparser() -> argparse.ArgumentParser:
+    p = argparse.ArgumentParser(description="Re-audit downloaded videos with ffprobe: video stream, resolution, "
+                                            "duration and audio. Files that did not change since their last "
+                                            "check are not probed again.")
+    p.add_argument("output_dir", nargs="?", default=FilePath.DEFAULT_OUTPUT_DIR,
+                   help=f"Directory tree to verify (default: {FilePath.DEFAULT_OUTPUT_DIR})")
+    p.add_argument("--workers", "-j", type=int, default=DEFAULT_PROBE_WORKERS,
+                   help=f"Number of parallel ffprobe processes (default: {DEFAULT_PROBE_WORKERS}).")
+    p.add_argument("--extensions", nargs="+", default=DEFAULT_EXTENSIONS,
+                   help=f"File extensions to verify (default: {' '.join(DEFAULT_EXTENSIONS)}).")
+    p.add_argument("--force", action="store_true",
+                   help="Probe every file again, even if it did not change since it was last probed.")
+    p.add_argument("--no-audio-required", action="store_true",
+                   help="Don't report files without an audio stream.")
+    p.add_argument("--no-video-required", action="store_true",
+                   help="Don't report files without a video stream, for audio downloads (e.g. --extensions mp3 opus m4a).")
+    add_profile_report_arguments(p)
+    return p
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = build_argparser().parse_args(argv)
+    LoggingUtils.init_with_basic_config()
+
+    if not os.path.isdir(args.output_dir):
+        print(f"{Fore.RED}Not a directory: {args.output_dir}{Style.RESET_ALL}")
+        sys.exit(2)
+
+    start = time.perf_counter()
+    total = cached = 0
+    failed = []
+    with profile_report(args), ProbeCache() as cache:
+        try:
+            service = VerificationService(workers=args.workers, cache=cache,
+                                          require_audio=not args.no_audio_required,
+                                          require_video=not args.no_video_required)
+        except DownloadError as e:
+            print(f"{Fore.RED}{e}{Style.RESET_ALL}")
+            sys.exit(2)
+        files = iter_media_files(args.output_dir, args.extensions)
+        for result in service.verify_many(files, use_cache=not args.force):
+            total += 1
+            cached += result.cached
+            if not result.ok:
+                failed.append(result)
+                print(f"{Fore.RED}[FAIL]{Style.RESET_ALL} {result.path}: {', '.join(result.problems)}")
+
+    elapsed = time.perf_counter() - start
+    color = Fore.RED if failed else Fore.GREEN
+    print(f"{color}Verified {total} files in {elapsed:.1f}s: {total - len(failed)} OK, {len(failed)} failed. "
+          f"{cached} unchanged files were not probed again.{Style.RESET_ALL}")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
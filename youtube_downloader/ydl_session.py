@@ -0,0 +1,133 @@
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from yt_dlp import YoutubeDL
+
+LOG = logging.getLogger(__name__)
+
+
+class YoutubeDLPool:
+    """
+    Keeps long-lived YoutubeDL instances created from the same options and lends them out one at a time.
+    Creating a YoutubeDL is expensive: extractor registration, cookie loading
+    (including decrypting the browser's cookie DB with 'cookiesfrombrowser') and HTTP session setup.
+    Instances are created lazily, so the pool grows to the number of threads using it concurrently.
+    """
+    def __init__(self, ydl_opts: Dict[str, Any],
+                 on_create: Optional[Callable[[YoutubeDL], None]] = None,
+                 session_manager: Optional['YoutubeDLSessionManager'] = None):
+        """
+        :param on_create: Called once for each new instance, e.g. to register postprocessors.
+        :param session_manager: If given, cookies are shared with all other pools of the manager.
+        """
+        self._ydl_opts = ydl_opts
+        self._on_create = on_create
+        self._session_manager = session_manager
+        self._lock = threading.Lock()
+        self._idle: List[YoutubeDL] = []
+        self._all: List[YoutubeDL] = []
+        self._closed = False
+
+    @property
+    def size(self) -> int:
+        return len(self._all)
+
+    @contextmanager
+    def session(self) -> Iterator[YoutubeDL]:
+        ydl = self._acquire()
+        try:
+            yield ydl
+        finally:
+            self._release(ydl)
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+            instances, self._all, self._idle = self._all, [], []
+        for ydl in instances:
+            ydl.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _acquire(self) -> YoutubeDL:
+        with self._lock:
+            if self._closed:
+                raise ValueError("YoutubeDL pool is already closed")
+            if self._idle:
+                # LIFO: the most recently used instance has the warmest connections
+                return self._idle.pop()
+        ydl = self._create()
+        with self._lock:
+            self._all.append(ydl)
+        return ydl
+
+    def _release(self, ydl: YoutubeDL) -> None:
+        with self._lock:
+            if self._closed:
+                closed = True
+            else:
+                closed = False
+                self._idle.append(ydl)
+        if closed:
+            ydl.close()
+
+    def _create(self) -> YoutubeDL:
+        LOG.debug("Creating new YoutubeDL instance, pool size: %d", self.size + 1)
+        # Each instance gets its own copy of the options, e.g. the bandwidth manager sets the rate limit of each download
+        ydl = YoutubeDL(dict(self._ydl_opts))
+        if self._session_manager:
+            self._session_manager.share_cookies(ydl)
+        if self._on_create:
+            self._on_create(ydl)
+        return ydl
+
+
+class YoutubeDLSessionManager:
+    """
+    Owns the YoutubeDL pools of a run, one pool per set of options (e.g. title extraction, video download).
+    Cookies are loaded once per cookie source and shared by every instance of every pool.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pools: Dict[str, YoutubeDLPool] = {}
+        self._cookiejars: Dict[Tuple, Any] = {}
+
+    def get_pool(self, name: str, ydl_opts: Dict[str, Any],
+                 on_create: Optional[Callable[[YoutubeDL], None]] = None) -> YoutubeDLPool:
+        """
+        Returns the pool registered with the name, creates it with the options if it does not exist yet.
+        """
+        with self._lock:
+            if name not in self._pools:
+                self._pools[name] = YoutubeDLPool(ydl_opts, on_create=on_create, session_manager=self)
+            return self._pools[name]
+
+    def share_cookies(self, ydl: YoutubeDL) -> None:
+        key = (ydl.params.get("cookiefile"), tuple(ydl.params.get("cookiesfrombrowser") or ()))
+        # Loading happens under the lock on purpose: concurrent workers should wait for the first load
+        # instead of all decrypting the browser cookie DB at the same time.
+        with self._lock:
+            cookiejar = self._cookiejars.get(key)
+            if cookiejar is None:
+                self._cookiejars[key] = ydl.cookiejar
+            else:
+                # YoutubeDL.cookiejar is a cached_property, pre-populating it skips loading the cookies again
+                ydl.__dict__["cookiejar"] = cookiejar
+
+    def close(self) -> None:
+        with self._lock:
+            pools, self._pools = list(self._pools.values()), {}
+        for pool in pools:
+            pool.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()